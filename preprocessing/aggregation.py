@@ -0,0 +1,190 @@
+"""Mergeable aggregates behind demographics, body system, Sankey and treemap outputs
+
+Aggregates count records.Record codes (age group, gender, system and symptom
+indices); the builders decode them back to names.
+"""
+
+from collections import Counter
+
+from extractors import AGE_GROUPS, ALL_SYSTEMS, GENDERS, body_systems, symptom_keywords
+from records import UNKNOWN_GENDER, bit_codes
+
+
+def decode(counter, names):
+    """Counter keyed by code -> Counter keyed by name, keeping first-seen order"""
+    return Counter({names[code]: count for code, count in counter.items()})
+
+
+def merge_counts(mine, other):
+    """Counter.update, or a sketch merge when partials carry sketches.HeavyHitters; returns the result"""
+    if isinstance(other, Counter):
+        mine.update(other)
+        return mine
+    # Partials are consumed by merging, so the first sketch can be reused
+    return other if isinstance(mine, Counter) and not mine else mine.merge(other)
+
+
+class SystemStats:
+    """Counters for one body system; symptoms, age and gender are keyed by code"""
+
+    def __init__(self):
+        self.count = 0
+        self.conditions = Counter()  # answer -> count, or a sketches.HeavyHitters with --sketch
+        self.symptoms = Counter()
+        self.age = Counter()
+        self.gender = Counter()
+        self.samples = []
+
+    def add(self, item, sample_size=3):
+        self.count += 1
+        self.conditions[item.answer] += 1
+        self.symptoms.update(bit_codes(item.symptoms))
+        self.age[item.age_code] += 1
+        self.gender[item.gender_code] += 1
+        if len(self.samples) < sample_size:  # only the first few questions are kept
+            self.samples.append(item.question)
+
+    def merge(self, other, sample_size=3):
+        self.count += other.count
+        self.conditions = merge_counts(self.conditions, other.conditions)
+        self.symptoms.update(other.symptoms)
+        self.age.update(other.age)
+        self.gender.update(other.gender)
+        self.samples.extend(other.samples[:sample_size - len(self.samples)])
+
+
+class Aggregates:
+    """Partial statistics over a run of records; merge partials in input order"""
+
+    def __init__(self, head_size=1000):
+        self.head_size = head_size
+        self.total = 0
+        self.head = []  # first records, saved as processed_data.json
+        self.demographics = {}  # age_code -> Counter of gender codes
+        self.systems = {}  # system code -> SystemStats
+        self.pairs = Counter()  # (symptom code, answer) -> count, or a sketches.HeavyHitters
+        self.ages_found = 0
+        self.genders_found = 0
+        self.primary_counts = Counter()  # keyed by system code
+        self.age_counts = Counter()  # keyed by age group code
+        self.gender_counts = Counter()  # keyed by gender code
+        self.cube = None  # cube.Cube, when the drill-down cube is requested
+        self.sample = None  # sampling.StratifiedSample, when a stratified sample is requested
+
+    def add(self, item):
+        """Fold one Record into every statistic in a single pass"""
+        self.total += 1
+        if len(self.head) < self.head_size:
+            self.head.append(item)
+
+        self.demographics.setdefault(item.age_code, Counter())[item.gender_code] += 1
+
+        systems = self.systems
+        for system in bit_codes(item.systems):
+            stats = systems.get(system)
+            if stats is None:
+                stats = systems[system] = SystemStats()
+            stats.add(item)
+
+        answer = item.answer
+        for symptom in bit_codes(item.symptoms)[:3]:  # Limit to first 3 symptoms per question
+            self.pairs[(symptom, answer)] += 1
+
+        if item.age is not None:
+            self.ages_found += 1
+        if item.gender_code != UNKNOWN_GENDER:
+            self.genders_found += 1
+        self.primary_counts[item.primary_code] += 1
+        self.age_counts[item.age_code] += 1
+        self.gender_counts[item.gender_code] += 1
+
+    def merge(self, other):
+        """Fold another partial in; counters keep first-seen order when merged in input order"""
+        self.total += other.total
+        self.head.extend(other.head[:self.head_size - len(self.head)])
+        for age_group, genders in other.demographics.items():
+            self.demographics.setdefault(age_group, Counter()).update(genders)
+        for system, stats in other.systems.items():
+            self.systems.setdefault(system, SystemStats()).merge(stats)
+        self.pairs = merge_counts(self.pairs, other.pairs)
+        self.ages_found += other.ages_found
+        self.genders_found += other.genders_found
+        self.primary_counts.update(other.primary_counts)
+        self.age_counts.update(other.age_counts)
+        self.gender_counts.update(other.gender_counts)
+        if other.cube is not None:
+            # Partials are consumed by merging, so the first cube can be reused
+            self.cube = other.cube if self.cube is None else self.cube.merge(other.cube)
+        if other.sample is not None:
+            self.sample = other.sample if self.sample is None else self.sample.merge(other.sample)
+        return self
+
+    def reference_records(self):
+        """Records saved as processed_data.json: the stratified sample if there is one, else the head"""
+        return self.sample.records() if self.sample is not None else self.head
+
+
+def aggregate_records(records, head_size=1000):
+    """Compute partial aggregates for a list of Records in one pass"""
+    agg = Aggregates(head_size)
+    for item in records:
+        agg.add(item)
+    return agg
+
+
+# ============================================================
+# OUTPUT BUILDERS
+# ============================================================
+
+def build_demographics(agg):
+    """Sunburst hierarchy: age group -> gender"""
+    return {
+        "name": "Patients",
+        "children": [
+            {
+                "name": AGE_GROUPS[age_code],
+                "children": [{"name": GENDERS[gender], "value": count} for gender, count in genders.items()]
+            }
+            for age_code, genders in agg.demographics.items()
+        ]
+    }
+
+
+def build_body_system_stats(agg):
+    """Per-system statistics for the anatomy view"""
+    body_system_stats = {}
+    for code, system in enumerate(ALL_SYSTEMS):
+        stats = agg.systems.get(code)
+        if stats is None or not stats.count:
+            continue
+        body_system_stats[system] = {
+            'count': stats.count,
+            'top_conditions': [{'name': c[0], 'count': c[1]} for c in stats.conditions.most_common(10)],
+            'top_symptoms': [{'name': symptom_keywords[s[0]], 'count': s[1]} for s in stats.symptoms.most_common(10)],
+            'age_distribution': dict(decode(stats.age, AGE_GROUPS)),
+            'gender_distribution': dict(decode(stats.gender, GENDERS)),
+            'color': body_systems.get(system, {}).get('color', '#95A5A6'),
+            'sample_questions': agg.sample.system_questions(code) if agg.sample is not None else list(stats.samples)
+        }
+    return body_system_stats
+
+
+def build_treemap(body_system_stats):
+    """Specialty hierarchy: body system -> top conditions"""
+    treemap_data = {
+        "name": "Medical Questions",
+        "children": []
+    }
+
+    for system, stats in body_system_stats.items():
+        system_node = {
+            "name": system,
+            "color": stats['color'],
+            "children": [
+                {"name": cond['name'], "value": cond['count']}
+                for cond in stats['top_conditions'][:8]
+            ]
+        }
+        if system_node["children"]:  # Only add if has conditions
+            treemap_data["children"].append(system_node)
+    return treemap_data
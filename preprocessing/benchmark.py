@@ -0,0 +1,153 @@
+"""Benchmark the preprocessing stages on seeded synthetic corpora.
+
+Each corpus size runs in a fresh subprocess. Every stage reports the highest
+RSS reached while it ran (where Linux lets the high-water mark be reset) and
+the process's high-water mark so far.
+Results are appended as one JSON line per run, so runs can be compared over
+time; no network access is needed.
+
+Usage (from the repo root):
+    python preprocessing/benchmark.py [--sizes 10000 100000 1000000] [--seed 0]
+                                      [--output benchmark_results.jsonl]
+"""
+
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from instrumentation import peak_rss_mb, reset_peak_rss, stage_peak_rss_mb
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def checksum(value):
+    """Stable hash of a stage's output, to spot behaviour changes between runs"""
+    payload = json.dumps(value, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def run_stages(n_rows, seed):
+    """Run every stage once on an n_rows corpus and return per-stage measurements"""
+    from aggregation import (
+        aggregate_records, build_body_system_stats, build_demographics, build_treemap
+    )
+    from cube import Cube
+    from demographics import extract_demographics
+    from extracted_features2 import build_age_disease, build_gender_disease, build_network, question_fields
+    from extractors import (
+        extract_age, extract_body_systems, extract_gender, extract_symptoms, extract_systems_and_symptoms
+    )
+    from matrix_aggregation import aggregate_records as matrix_aggregate_records
+    from sharding import ANSWER_COL, QUESTION_COL, extract_chunk, extract_chunk_columns
+    from sankey import build_sankey
+    from synthetic import generate
+    import pyarrow as pa
+
+    results = []
+
+    def stage(name, fn):
+        reset = reset_peak_rss()
+        start = time.perf_counter()
+        output = fn()
+        seconds = time.perf_counter() - start
+        results.append({
+            'stage': name,
+            'seconds': round(seconds, 4),
+            'rows_per_sec': round(n_rows / seconds, 1) if seconds > 0 else None,
+            'stage_peak_rss_mb': stage_peak_rss_mb() if reset else None,
+            'process_peak_rss_mb': peak_rss_mb(),
+            'checksum': checksum(output),
+        })
+        return output
+
+    df = stage('generate', lambda: generate(n_rows, seed))
+    questions = df[QUESTION_COL].tolist()
+    answers = df[ANSWER_COL].tolist()
+
+    stage('extract_age', lambda: [extract_age(q) for q in questions])
+    stage('extract_gender', lambda: [extract_gender(q) for q in questions])
+    stage('extract_demographics', lambda: [extract_demographics(q) for q in questions])
+    stage('extract_body_systems', lambda: [extract_body_systems(q + " " + a) for q, a in zip(questions, answers)])
+    stage('extract_symptoms', lambda: [extract_symptoms(q) for q in questions])
+    stage('extract_systems_and_symptoms', lambda: [extract_systems_and_symptoms(q, a) for q, a in zip(questions, answers)])
+    records = stage('extract_records_rows', lambda: extract_chunk(df, 'rows'))
+    stage('extract_records_columnar', lambda: extract_chunk(df, 'columnar'))
+    # What the pipeline uses: code and bitmask columns, with no Records built
+    columns = stage('extract_columns_columnar', lambda: extract_chunk_columns(df, 'columnar'))
+    results[-1]['checksum'] = checksum(columns.records())
+    aggregates = stage('aggregate', lambda: aggregate_records(records))
+    # Checksum the built outputs rather than the Aggregates object
+    results[-1]['checksum'] = checksum([aggregates.total, aggregates.ages_found, aggregates.genders_found])
+    matrix = stage('aggregate_matrix', lambda: matrix_aggregate_records(records))
+    results[-1]['checksum'] = checksum([matrix.total, matrix.ages_found, matrix.genders_found])
+    cube = stage('cube', lambda: Cube.from_records(records))
+    results[-1]['checksum'] = checksum(cube.counts.tolist())
+    body_system_stats = stage('body_system_stats', lambda: build_body_system_stats(aggregates))
+    stage('demographics', lambda: build_demographics(aggregates))
+    stage('sankey', lambda: build_sankey(aggregates))
+    stage('treemap', lambda: build_treemap(body_system_stats))
+
+    # extracted_features2.py reads the Question and Response columns of the split
+    source = pa.Table.from_pandas(df[['Question', 'Response']], preserve_index=False)
+    disease_hits, age_groups, genders = stage('features2_questions', lambda: question_fields(source))
+    results[-1]['checksum'] = checksum([disease_hits.sum().to_dict(), age_groups.tolist(), genders.tolist()])
+    stage('features2_age_disease', lambda: build_age_disease(disease_hits, age_groups))
+    stage('features2_gender_disease', lambda: build_gender_disease(disease_hits, genders))
+    stage('features2_network', lambda: build_network(source).to_json())
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=HERE, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the preprocessing pipeline on synthetic data")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmark_results.jsonl')
+    parser.add_argument('--single', type=int, help=argparse.SUPPRESS)  # child process mode
+    args = parser.parse_args()
+
+    if args.single is not None:
+        json.dump(run_stages(args.single, args.seed), sys.stdout)
+        return
+
+    run = {
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'seed': args.seed,
+        'sizes': [],
+    }
+    for n_rows in args.sizes:
+        print(f"Benchmarking {n_rows} rows...")
+        output = subprocess.check_output(
+            [sys.executable, os.path.abspath(__file__), '--single', str(n_rows), '--seed', str(args.seed)]
+        )
+        stages = json.loads(output)
+        run['sizes'].append({'rows': n_rows, 'stages': stages})
+        print(f"  {'stage':<30} {'seconds':>10} {'rows/s':>19} {'stage peak':>11} {'process peak':>13}")
+        for s in stages:
+            stage_peak = '-' if s['stage_peak_rss_mb'] is None else f"{s['stage_peak_rss_mb']:.1f} MB"
+            print(f"  {s['stage']:<30} {s['seconds']:>9.3f}s {s['rows_per_sec'] or 0:>12,.0f} rows/s "
+                  f"{stage_peak:>11} {s['process_peak_rss_mb']:>10.1f} MB  {s['checksum']}")
+
+    with open(args.output, 'a') as f:
+        f.write(json.dumps(run) + "\n")
+    print(f"Saved: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
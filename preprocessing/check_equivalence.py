@@ -0,0 +1,206 @@
+"""Check that the fast extractors return exactly what the reference ones do.
+
+Usage (from the repo root):
+    python preprocessing/check_equivalence.py [path/to/medical_questions.csv]
+
+Without a CSV the questions and answers in data/processed_data.json are used.
+"""
+
+import contextlib
+import io
+import json
+import os
+import re
+import sys
+
+import pandas as pd
+
+import extractors
+import records
+import reference
+from demographics import (
+    BINARY_FEMALE_PATTERN, BINARY_MALE_PATTERN, PEDIATRIC_AGE_PATTERN, extract_demographics
+)
+from taxonomy import load_taxonomy, question_registry
+from vectorized import binary_genders, pediatric_age_groups
+
+MEDTRINITY_FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'medtrinity_sample.jsonl')
+
+# Nested and overlapping keywords that a one-pass matcher must still report
+EDGE_CASES = [
+    ("Chest pain radiating to the back pain area", "Angina"),
+    ("Blood pressure is high and blood in urine was noted", "Hypertension"),
+    ("She reports abdominal pain and weight loss", "Colitis"),
+    ("Hyperthyroidism with tremor", "Graves disease"),
+    ("", ""),
+    ("nothing relevant here", "n/a"),
+    # A keyword across the question/answer join counts for the systems but not the symptoms
+    ("The patient complains of chest", "pain and shortness of breath"),
+    # re.I folds the long s and the dotted and dotless i onto ASCII letters, lower() does not
+    ("Burning ſtomach pain after meals", "Peptic ulcer"),
+    ("İnsulin levels were low and ınsulin was started", "Type 1 diabetes"),
+]
+
+# Hand-labeled questions: (age, age_unit, age_group, pediatric_age_group, gender, binary_gender)
+LABELED_DEMOGRAPHICS = [
+    ("A 45-year-old man presents with chest pain.",
+     (45, 'year', 'Middle Age (40-59)', 'Adult (41-65)', 'Male', 'Male')),
+    # 'year old' outranks an earlier 'month old'
+    ("A 3 month old girl has a fever; her mother says she is 2 year old.",
+     (2, 'year', 'Child (2-12)', 'Pediatric (0-18)', 'Female', 'Female')),
+    ("A 3-week-old infant with jaundice.",
+     (0, 'week', 'Infant (0-1)', None, 'Unknown', None)),
+    ("A 10 day old boy with a 25 year old mother.",
+     (25, 'year', 'Young Adult (20-39)', 'Young Adult (19-40)', 'Female', 'Male')),
+    ("A woman aged 67 with a history of stroke.",
+     (67, 'year', 'Senior (60-79)', None, 'Female', 'Female')),
+    ("A patient at the age of 12 has a rash.",
+     (None, None, 'Unknown', 'Pediatric (0-18)', 'Unknown', None)),
+    # extract_age reads at most three digits, extracted_features2 the whole number
+    ("A 1234-year-old statue, aged 1234.",
+     (234, 'year', 'Elderly (80+)', 'Senior (65+)', 'Unknown', None)),
+    ("A 30 years old lady with anxiety.",
+     (None, None, 'Unknown', None, 'Unknown', 'Female')),
+    ("The 70 - year - old gentleman and his wife.",
+     (None, None, 'Unknown', 'Senior (65+)', 'Unknown', 'Male')),
+    ("He says she and her husband are fine.",
+     (None, None, 'Unknown', None, 'Unknown', None)),
+    # 'age' also matches inside words
+    ("A pregnant female at stage 3 labor.",
+     (3, 'year', 'Child (2-12)', 'Pediatric (0-18)', 'Female', 'Female')),
+    ("A box of gloves was left by the man.",
+     (None, None, 'Unknown', None, 'Male', 'Male')),
+    ("A middle-aged male with nagging abdominal pain for 2 weeks.",
+     (None, None, 'Unknown', None, 'Male', 'Male')),
+    ("AGE 81, Female, presents with confusion.",
+     (81, 'year', 'Elderly (80+)', 'Senior (65+)', 'Female', 'Female')),
+    ("A 19-year-old girl; her father is 52 years old.",
+     (19, 'year', 'Adolescent (13-19)', 'Young Adult (19-40)', 'Female', 'Female')),
+    # re.I folds the dotless i onto 'i', lower() does not
+    ("A gırl aged 7.",
+     (7, 'year', 'Child (2-12)', None, 'Unknown', 'Female')),
+    ("", (None, None, 'Unknown', None, 'Unknown', None)),
+]
+
+
+def load_pairs(path=None):
+    """Return (question, answer) pairs from a CSV or the processed_data sample"""
+    if path:
+        import pandas as pd
+        df = pd.read_csv(path)
+        return [(str(q), str(a)) for q, a in zip(df['Open-ended Verifiable Question'], df['Ground-True Answer'])]
+    with open('data/processed_data.json') as f:
+        return [(item['question'], item['answer']) for item in json.load(f)]
+
+
+def compare_keyword_matcher(pairs):
+    """Return a list of mismatch descriptions between reference and matcher extraction"""
+    mismatches = []
+    for idx, (question, answer) in enumerate(pairs):
+        expected = (
+            reference.extract_body_systems(question + " " + answer),
+            reference.extract_symptoms(question),
+        )
+        actual = extractors.extract_systems_and_symptoms(question, answer)
+        standalone = (
+            extractors.extract_body_systems(question + " " + answer),
+            extractors.extract_symptoms(question),
+        )
+        if actual != expected or standalone != expected:
+            mismatches.append({'id': idx, 'expected': expected, 'actual': actual, 'standalone': standalone})
+    return mismatches
+
+
+def compare_records(pairs):
+    """Return ids whose compact Record does not decode to the extractors.extract_record dict"""
+    return [
+        idx for idx, (question, answer) in enumerate(pairs)
+        if records.extract_record(idx, question, answer).to_dict() != extractors.extract_record(idx, question, answer)
+    ]
+
+
+def compare_disease_categories(questions):
+    """Return ids where the question registry disagrees with extracted_features2's re.I searches"""
+    disease_map = load_taxonomy('medical_o1')['disease_categories']
+    registry = question_registry()
+    return [
+        idx for idx, question in enumerate(questions)
+        if registry.match(question)['disease'] !=
+        [name for name, pattern in disease_map.items() if re.search(pattern, question, re.I)]
+    ]
+
+
+def current_demographics(questions):
+    """(age, age_group, gender, pediatric_age_group, binary_gender) from the separate functions"""
+    series = pd.Series(questions, dtype=object)
+    pediatric = pediatric_age_groups(series, re.compile(PEDIATRIC_AGE_PATTERN, re.I))
+    binary = binary_genders(series, re.compile(BINARY_MALE_PATTERN, re.I), re.compile(BINARY_FEMALE_PATTERN, re.I))
+    return [
+        extractors.extract_age(q) + (extractors.extract_gender(q), p, b)
+        for q, p, b in zip(questions, pediatric.where(pediatric.notna(), None), binary.where(binary.notna(), None))
+    ]
+
+
+def compare_demographics(questions, labels=None):
+    """Return ids where the fused extractor disagrees with the separate functions or with a label"""
+    mismatches = []
+    for idx, (question, current) in enumerate(zip(questions, current_demographics(questions))):
+        d = extract_demographics(question)
+        fused = (d.age, d.age_group, d.gender, d.pediatric_age_group, d.binary_gender)
+        labeled = (d.age, d.age_unit, d.age_group, d.pediatric_age_group, d.gender, d.binary_gender)
+        if fused != current or (labels is not None and labeled != labels[idx]):
+            mismatches.append(idx)
+    return mismatches
+
+
+def compare_medtrinity(path=MEDTRINITY_FIXTURE):
+    """Return structures whose batched or pooled count differs from a whole-word regex count
+
+    'modalities' is returned too when the batched and pooled modality counts differ.
+    """
+    import medtrinity
+    with open(path, encoding='utf-8') as f:
+        captions = [json.loads(line).get('caption') for line in f if line.strip()]
+    captions = ['' if caption is None else str(caption).lower() for caption in captions]
+    expected = [
+        sum(bool(re.search(rf'(?<![^\W_]){re.escape(word)}(?![^\W_])', caption)) for caption in captions)
+        for word in medtrinity.STRUCTURES
+    ]
+    # count_structures reports its progress after every batch
+    with contextlib.redirect_stdout(io.StringIO()):
+        serial = medtrinity.count_structures(medtrinity.iter_batches(path, batch_size=7))
+        pooled = medtrinity.count_structures(medtrinity.iter_batches(path, batch_size=4), workers=2)
+    mismatches = [
+        word for word, count, a, b in zip(medtrinity.STRUCTURES, expected, serial.structures, pooled.structures)
+        if not count == a == b
+    ]
+    if serial.modalities != pooled.modalities:
+        mismatches.append('modalities')
+    return mismatches
+
+
+if __name__ == '__main__':
+    pairs = EDGE_CASES + load_pairs(sys.argv[1] if len(sys.argv) > 1 else None)
+    mismatches = compare_keyword_matcher(pairs)
+    for m in mismatches[:20]:
+        print(f"Mismatch on row {m['id']}: expected {m['expected']}, got {m['actual']}")
+    print(f"Keyword matcher: {len(pairs) - len(mismatches)} / {len(pairs)} rows identical")
+    record_mismatches = compare_records(pairs)
+    print(f"Compact records: {len(pairs) - len(record_mismatches)} / {len(pairs)} rows identical")
+    labeled_mismatches = compare_demographics(*map(list, zip(*LABELED_DEMOGRAPHICS)))
+    for idx in labeled_mismatches:
+        print(f"Demographics mismatch on labeled question {LABELED_DEMOGRAPHICS[idx][0]!r}")
+    demographic_mismatches = compare_demographics([question for question, _ in pairs])
+    print(f"Fused demographics: {len(LABELED_DEMOGRAPHICS) - len(labeled_mismatches)} / "
+          f"{len(LABELED_DEMOGRAPHICS)} labeled and {len(pairs) - len(demographic_mismatches)} / "
+          f"{len(pairs)} rows identical")
+    disease_mismatches = compare_disease_categories([question for question, _ in pairs])
+    for idx in disease_mismatches[:20]:
+        print(f"Disease category mismatch on row {idx}: {pairs[idx][0][:80]!r}")
+    print(f"Disease categories: {len(pairs) - len(disease_mismatches)} / {len(pairs)} rows identical")
+    medtrinity_mismatches = compare_medtrinity()
+    for word in medtrinity_mismatches:
+        print(f"MedTrinity count mismatch for {word!r}")
+    print(f"MedTrinity fixture: {len(medtrinity_mismatches)} structure count mismatches")
+    sys.exit(1 if mismatches or record_mismatches or labeled_mismatches or demographic_mismatches or
+             disease_mismatches or medtrinity_mismatches else 0)
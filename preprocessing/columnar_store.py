@@ -0,0 +1,206 @@
+"""Columnar intermediate file for extracted records (Parquet or Arrow IPC).
+
+The full extracted table is written once, then aggregations and exporters
+can re-read it batch by batch, without running the regex extraction again.
+Age group, gender and primary system are dictionary columns over fixed
+category lists; body systems and symptoms are bitmasks whose bit order is
+ALL_SYSTEMS and symptom_keywords, so decoding keeps the original list order.
+The mask columns are as wide as the taxonomy needs (uint16 and uint64 for
+the shipped tables).
+
+Files ending in .arrow or .feather use Arrow IPC (zero-copy memory-map);
+anything else is written as Parquet, which is decoded one batch at a time.
+"""
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from aggregation import Aggregates, aggregate_records
+from cube import Cube
+from matrix_aggregation import aggregate_columns
+from extractors import AGE_GROUPS, ALL_SYSTEMS, GENDERS, symptom_keywords
+from records import AGE_GROUP_CODES, GENDER_CODES, Record
+from sampling import StratifiedSample
+from sketches import sketch_aggregates
+
+
+def _dictionary_type():
+    return pa.dictionary(pa.int8(), pa.string())
+
+
+def mask_type(bits):
+    """Narrowest unsigned integer type with room for a bitmask of this many bits"""
+    # taxonomy.load_taxonomy already refuses tables that need more than 64
+    for width, type_ in ((8, pa.uint8()), (16, pa.uint16()), (32, pa.uint32()), (64, pa.uint64())):
+        if bits <= width:
+            return type_
+    raise ValueError(f"a {bits}-bit mask does not fit in an Arrow integer column")
+
+
+SYSTEMS_TYPE = mask_type(len(ALL_SYSTEMS))
+SYMPTOMS_TYPE = mask_type(len(symptom_keywords))
+
+
+SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('question', pa.string()),
+    ('answer', pa.string()),
+    ('age', pa.int16()),
+    ('age_group', _dictionary_type()),
+    ('gender', _dictionary_type()),
+    ('primary_system', _dictionary_type()),
+    ('body_systems', SYSTEMS_TYPE),
+    ('symptoms', SYMPTOMS_TYPE),
+    ('question_length', pa.int32()),
+])
+
+
+def _is_ipc(path):
+    return str(path).endswith(('.arrow', '.feather'))
+
+
+def _category_array(codes, categories):
+    # Record codes are already indices into the category list
+    indices = pa.array(codes, type=pa.int8())
+    return pa.DictionaryArray.from_arrays(indices, pa.array(categories, type=pa.string()))
+
+
+def category_codes(column, codes):
+    """Dictionary column -> Record codes, whatever dictionary the file stored"""
+    column = column.combine_chunks() if isinstance(column, pa.ChunkedArray) else column
+    remap = [codes[value] for value in column.dictionary.to_pylist()]
+    return [remap[i] for i in column.indices.to_pylist()]
+
+
+def records_to_batch(records):
+    """Encode Records as one Arrow record batch"""
+    columns = [
+        pa.array([r.id for r in records], type=pa.int64()),
+        pa.array([r.question for r in records], type=pa.string()),
+        pa.array([r.answer for r in records], type=pa.string()),
+        pa.array([r.age for r in records], type=pa.int16()),
+        _category_array([r.age_code for r in records], AGE_GROUPS),
+        _category_array([r.gender_code for r in records], GENDERS),
+        _category_array([r.primary_code for r in records], ALL_SYSTEMS),
+        pa.array([r.systems for r in records], type=SYSTEMS_TYPE),
+        pa.array([r.symptoms for r in records], type=SYMPTOMS_TYPE),
+        pa.array([r.question_length for r in records], type=pa.int32()),
+    ]
+    return pa.RecordBatch.from_arrays(columns, schema=SCHEMA)
+
+
+def batch_to_records(batch):
+    """Decode an Arrow record batch back into Records"""
+    return [
+        Record(*fields)
+        for fields in zip(
+            batch.column('id').to_pylist(),
+            batch.column('question').to_pylist(),
+            batch.column('answer').to_pylist(),
+            batch.column('age').to_pylist(),
+            category_codes(batch.column('age_group'), AGE_GROUP_CODES),
+            category_codes(batch.column('gender'), GENDER_CODES),
+            batch.column('body_systems').to_pylist(),
+            batch.column('symptoms').to_pylist(),
+            batch.column('question_length').to_pylist(),
+        )
+    ]
+
+
+class ExtractedWriter:
+    """Appends record batches to a Parquet or Arrow IPC file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = 0
+        if _is_ipc(path):
+            self._sink = pa.OSFile(str(path), 'wb')
+            self._writer = pa.ipc.new_file(self._sink, SCHEMA)
+        else:
+            self._sink = None
+            self._writer = pq.ParquetWriter(str(path), SCHEMA, compression='zstd')
+
+    def write_batch(self, batch):
+        if batch.num_rows:
+            self._writer.write_batch(batch)
+            self.rows += batch.num_rows
+
+    def write_records(self, records):
+        self.write_batch(records_to_batch(records))
+
+    def close(self):
+        self._writer.close()
+        if self._sink is not None:
+            self._sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_extracted(path):
+    """The whole extracted file as an Arrow table: memory-mapped for Arrow IPC, decoded into memory for Parquet"""
+    if _is_ipc(path):
+        return pa.ipc.open_file(pa.memory_map(str(path), 'r')).read_all()
+    return pq.read_table(str(path), memory_map=True)
+
+
+def iter_batches(path, batch_size=65536):
+    """Record batches of at most batch_size rows; only the current batch is decoded in memory"""
+    if _is_ipc(path):
+        reader = pa.ipc.open_file(pa.memory_map(str(path), 'r'))
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i)
+            for start in range(0, batch.num_rows, batch_size):
+                yield batch.slice(start, batch_size)
+    else:
+        yield from pq.ParquetFile(str(path), memory_map=True).iter_batches(batch_size=batch_size)
+
+
+def iter_records(path, batch_size=65536):
+    """Yield Records from an extracted file, batch by batch"""
+    for batch in iter_batches(path, batch_size):
+        yield from batch_to_records(batch)
+
+
+def aggregate_extracted(path, head_size=1000, aggregation='matrix', batch_size=65536, cube=None, sketch=None,
+                        sample=None):
+    """Recompute the aggregates from an extracted file without re-running extraction
+
+    The matrix aggregation reads the code and bitmask columns straight from
+    Arrow; only the first head_size rows are decoded into Records. With
+    sketch, each batch's answer-keyed counters are folded into fixed-size
+    sketches.HeavyHitters before merging. With sample, only the rows that
+    enter the stratified sample are decoded for it.
+    """
+    agg = Aggregates(head_size)
+    for batch in iter_batches(path, batch_size):
+        age_codes = category_codes(batch.column('age_group'), AGE_GROUP_CODES)
+        gender_codes = category_codes(batch.column('gender'), GENDER_CODES)
+        system_masks = batch.column('body_systems').to_numpy()
+        symptom_masks = batch.column('symptoms').to_numpy()
+        answers = batch.column('answer').to_pylist()
+        if aggregation == 'counters':
+            partial = aggregate_records(batch_to_records(batch), head_size)
+        else:
+            head = batch_to_records(batch.slice(0, head_size - len(agg.head))) if len(agg.head) < head_size else []
+            questions = batch.column('question')
+            partial = aggregate_columns(
+                batch.column('age').is_valid().to_numpy(zero_copy_only=False),
+                age_codes, gender_codes, system_masks, symptom_masks, answers,
+                lambda row: questions[row].as_py(),
+                head, head_size
+            )
+        if sketch is not None:
+            sketch_aggregates(partial, **sketch)
+        if cube is not None:
+            partial.cube = Cube(**cube).add_columns(age_codes, gender_codes, system_masks, symptom_masks, answers)
+        if sample is not None:
+            partial.sample = StratifiedSample(**sample).add_columns(
+                batch.column('id').to_numpy(), age_codes, gender_codes, system_masks,
+                lambda row: batch_to_records(batch.slice(row, 1))[0]
+            )
+        agg.merge(partial)
+    return agg
@@ -0,0 +1,281 @@
+"""Precomputed drill-down cube over age group x gender x body system x symptom.
+
+Every cell holds a record count and its most frequent conditions (answers).
+Age group and gender also have an "all" member ('*'), and so does the symptom
+dimension, so a dashboard can read any filter combination without summing.
+A record counts once in each of its body systems and once per symptom.
+
+Only the top conditions of each cell are exported. A chunk's cube counts
+them exactly; when partials merge, every cell becomes a Misra-Gries summary
+of at most `capacity` conditions (sketches.eviction_thresholds, the step
+sketches.HeavyHitters takes), so memory is bounded by the number of cells,
+not by the number of distinct answers. The evicted amounts add up in a
+per-cell offset, exported as the cell's error_bound once it is nonzero:
+listed counts are lower bounds at most error_bound (never more than
+count / (capacity + 1)) below the true counts, and any condition counted
+more than error_bound times is still listed if it ranks in the top. When
+the exported symptoms are known up front (symptom_codes), cells are kept
+for those symptoms and '*' only.
+
+The cube is written as one small file per body system under data/cube/,
+plus data/cube/index.json listing the dimensions and slice files, so the
+front end can fetch only the slice it drills into.
+"""
+
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from extractors import AGE_GROUPS, ALL_SYSTEMS, GENDERS, symptom_keywords
+from matrix_aggregation import bit_matrix, expand
+from records import RecordColumns
+from sketches import eviction_thresholds
+
+ALL = '*'
+# Dimension sizes, each with one extra "all" member except body system
+N_AGES = len(AGE_GROUPS) + 1
+N_GENDERS = len(GENDERS) + 1
+N_SYSTEMS = len(ALL_SYSTEMS)
+N_SYMPTOMS = len(symptom_keywords) + 1
+N_CELLS = N_AGES * N_GENDERS * N_SYSTEMS * N_SYMPTOMS
+DEFAULT_CAPACITY = 50
+
+
+def cell_code(age, gender, system, symptom):
+    return ((age * N_GENDERS + gender) * N_SYSTEMS + system) * N_SYMPTOMS + symptom
+
+
+def slice_filename(system):
+    """'Kidney/Urinary' -> 'kidney-urinary.json'"""
+    return re.sub(r'[^a-z0-9]+', '-', system.lower()).strip('-') + '.json'
+
+
+def top_codes(counts, k):
+    """Codes of the k largest nonzero counts, ties in table order"""
+    order = np.argsort(-np.asarray(counts), kind='stable')[:k]
+    return [code for code in order.tolist() if counts[code] > 0]
+
+
+def _top_per_cell(cells, counts, k):
+    """Positions of each cell's k largest counts, grouped by cell, largest (then earliest) first"""
+    # One stable sort on (cell, descending count); equal keys keep their input order
+    largest = int(counts.max()) + 1
+    order = np.argsort(cells * largest + (largest - 1 - counts), kind='stable')
+    sorted_cells = cells[order]
+    starts = np.flatnonzero(np.r_[True, sorted_cells[1:] != sorted_cells[:-1]])
+    rank = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+    return order[rank < k]
+
+
+def _summed_counts(cells, codes, *counts):
+    """Sum the counts of repeated (cell, code) entries, in first-seen order; no counts counts entries"""
+    width = int(codes.max()) + 1
+    # factorize numbers the distinct keys in order of first occurrence, without sorting
+    inverse, keys = pd.factorize(cells * width + codes)
+    totals = [np.bincount(inverse, weights=c, minlength=len(keys)).astype(np.int64) for c in counts] or \
+        [np.bincount(inverse, minlength=len(keys))]
+    return (keys // width, keys % width, *totals)
+
+
+class Cube:
+    """Mergeable cube counts; merge partials in input order"""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, symptom_codes=None):
+        self.capacity = capacity
+        # Symptoms that get cells of their own; None for every symptom
+        self.symptom_codes = None if symptom_codes is None else sorted(symptom_codes)
+        self.counts = np.zeros(N_CELLS, dtype=np.int64)
+        self.symptom_counts = np.zeros(len(symptom_keywords), dtype=np.int64)
+        # (cell, condition code, count, Misra-Gries counter) entries, each cell's in first-seen order;
+        # count is what was counted since the condition was last kept, a lower bound the export lists,
+        # and the counter, never above it, decides evictions. condition_names holds the distinct
+        # conditions the codes refer to
+        self.condition_cells = np.zeros(0, dtype=np.int64)
+        self.condition_codes = np.zeros(0, dtype=np.int64)
+        self.condition_counts = np.zeros(0, dtype=np.int64)
+        self.condition_counters = np.zeros(0, dtype=np.int64)
+        self.condition_names = np.zeros(0, dtype=object)
+        # Total evicted per cell; a true count is at most its listed count plus the offset
+        self.offsets = np.zeros(N_CELLS, dtype=np.int64)
+
+    def add_columns(self, age_codes, gender_codes, system_masks, symptom_masks, answers):
+        """Count one chunk given as column arrays of Record codes and bitmasks"""
+        if not len(age_codes):
+            return self
+        age_codes = np.asarray(age_codes, dtype=np.int64)
+        gender_codes = np.asarray(gender_codes, dtype=np.int64)
+        systems = bit_matrix(system_masks, N_SYSTEMS)
+        symptoms = bit_matrix(symptom_masks, len(symptom_keywords))
+        answer_codes, answer_names = pd.factorize(pd.Series(answers, dtype=object))
+        answer_names = np.asarray(answer_names, dtype=object)
+        self.symptom_counts += symptoms.sum(axis=0)
+        if self.symptom_codes is not None:
+            kept = np.zeros(symptoms.shape[1], dtype=bool)
+            kept[self.symptom_codes] = True
+            symptoms &= kept
+
+        # (row, system) pairs, each paired with every symptom of its row and with '*'
+        system_rows, system_codes = np.nonzero(systems)
+        symptom_rows, symptom_codes = np.nonzero(symptoms)
+        indptr = np.concatenate(([0], np.cumsum(symptoms.sum(axis=1))))
+        entry, joined = expand(system_rows, indptr, symptom_codes)
+        entry = np.concatenate((entry, np.arange(len(system_rows))))
+        joined = np.concatenate((joined, np.full(len(system_rows), N_SYMPTOMS - 1)))
+        rows = system_rows[entry]
+        system_codes = system_codes[entry]
+        if not len(rows):
+            return self
+
+        # Every pair also counts under '*' for age group, gender and both. The four
+        # variants fill disjoint cells, so each is counted on its own.
+        ages = age_codes[rows]
+        genders = gender_codes[rows]
+        all_ages = np.full(len(rows), N_AGES - 1)
+        all_genders = np.full(len(rows), N_GENDERS - 1)
+        answers = answer_codes[rows]
+        parts = []
+        for age in (ages, all_ages):
+            for gender in (genders, all_genders):
+                cells = cell_code(age, gender, system_codes, joined)
+                self.counts += np.bincount(cells, minlength=N_CELLS)
+                # Within a cell, answers are keyed in row order, so ties break as in a serial run
+                parts.append(_summed_counts(cells, answers))
+        # A chunk's counts are exact, like its Counters; the cap only applies when partials merge
+        cells, codes, counts = (np.concatenate(column) for column in zip(*parts))
+        return self._fold(cells, codes, counts, counts, answer_names)
+
+    def _fold(self, cells, codes, counts, counters, names):
+        """Add (cell, condition code, count, counter) entries after the cube's own, then evict
+
+        names maps the codes to conditions; only the conditions still kept are retained.
+        """
+        if len(self.condition_cells):
+            # Renumber both sides' conditions in one table; only distinct names are hashed
+            mapping, names = pd.factorize(np.concatenate((self.condition_names, names)))
+            cells, codes, counts, counters = _summed_counts(
+                np.concatenate((self.condition_cells, cells)),
+                np.concatenate((mapping[self.condition_codes], mapping[len(self.condition_names) + codes])),
+                np.concatenate((self.condition_counts, counts)), np.concatenate((self.condition_counters, counters))
+            )
+            thresholds = eviction_thresholds(cells, counters, self.capacity)
+            if thresholds.any():
+                kept = counters > thresholds
+                evicted = np.zeros(N_CELLS, dtype=np.int64)
+                evicted[cells] = thresholds
+                self.offsets += evicted
+                cells, codes, counts, counters = cells[kept], codes[kept], counts[kept], (counters - thresholds)[kept]
+        used, codes = np.unique(codes, return_inverse=True)
+        self.condition_cells = cells
+        self.condition_codes = codes
+        self.condition_counts = counts
+        self.condition_counters = counters
+        self.condition_names = np.asarray(names, dtype=object)[used]
+        return self
+
+    @classmethod
+    def from_columns(cls, columns, capacity=DEFAULT_CAPACITY, top_symptoms=None):
+        """Cube of a records.RecordColumns chunk; with top_symptoms, cells only for the k symptoms that will be exported"""
+        symptom_codes = None
+        if top_symptoms is not None:
+            counts = bit_matrix(columns.symptom_masks, len(symptom_keywords)).sum(axis=0)
+            symptom_codes = top_codes(counts, top_symptoms)
+        return cls(capacity, symptom_codes).add_columns(
+            columns.age_codes, columns.gender_codes, columns.system_masks, columns.symptom_masks, columns.answers
+        )
+
+    @classmethod
+    def from_records(cls, records, capacity=DEFAULT_CAPACITY, top_symptoms=None):
+        """Cube of a list of Records"""
+        return cls.from_columns(RecordColumns.from_records(records), capacity, top_symptoms)
+
+    def merge(self, other):
+        if self.capacity != other.capacity or self.symptom_codes != other.symptom_codes:
+            raise ValueError("Cubes with different capacities or symptom cells cannot be merged")
+        self.counts += other.counts
+        self.symptom_counts += other.symptom_counts
+        self.offsets += other.offsets
+        return self._fold(other.condition_cells, other.condition_codes, other.condition_counts,
+                          other.condition_counters, other.condition_names)
+
+    def top_symptoms(self, k):
+        """Symptom codes of the k most frequent symptoms, ties in table order"""
+        return top_codes(self.symptom_counts, k)
+
+    def top_conditions(self, system, k):
+        """{cell: [(condition, count)]} for one body system's cells, most frequent first"""
+        in_system = np.flatnonzero(self.condition_cells // N_SYMPTOMS % N_SYSTEMS == system)
+        cells = self.condition_cells[in_system]
+        top = {}
+        for position in in_system[_top_per_cell(cells, self.condition_counts[in_system], k)].tolist():
+            top.setdefault(int(self.condition_cells[position]), []).append(
+                (self.condition_names[self.condition_codes[position]], int(self.condition_counts[position]))
+            )
+        return top
+
+    def slice(self, system, symptom_codes, top_conditions=5):
+        """Nested {age_group: {gender: {symptom: cell}}} for one body system, '*' for all"""
+        ages = list(enumerate(AGE_GROUPS)) + [(N_AGES - 1, ALL)]
+        genders = list(enumerate(GENDERS)) + [(N_GENDERS - 1, ALL)]
+        symptoms = [(code, symptom_keywords[code]) for code in symptom_codes] + [(N_SYMPTOMS - 1, ALL)]
+        conditions = self.top_conditions(system, top_conditions)
+        cells = {}
+        for age, age_name in ages:
+            for gender, gender_name in genders:
+                for symptom, symptom_name in symptoms:
+                    cell = cell_code(age, gender, system, symptom)
+                    count = int(self.counts[cell])
+                    if not count:
+                        continue
+                    data = {
+                        'count': count,
+                        'top_conditions': [{'name': name, 'count': n} for name, n in conditions.get(cell, [])]
+                    }
+                    if self.offsets[cell]:
+                        # The listed counts may be this much below the true counts
+                        data['error_bound'] = int(self.offsets[cell])
+                    cells.setdefault(age_name, {}).setdefault(gender_name, {})[symptom_name] = data
+        return {
+            'body_system': ALL_SYSTEMS[system],
+            'count': int(self.counts[cell_code(N_AGES - 1, N_GENDERS - 1, system, N_SYMPTOMS - 1)]),
+            'cells': cells
+        }
+
+
+def write_cube(cube, exporter, total, directory='data/cube', top_symptoms=10, top_conditions=5):
+    """Write one slice file per body system and the index; returns the index"""
+    os.makedirs(directory, exist_ok=True)
+    symptom_codes = cube.top_symptoms(top_symptoms)
+    slices = []
+    written = set()
+    for system, name in enumerate(ALL_SYSTEMS):
+        data = cube.slice(system, symptom_codes, top_conditions)
+        if not data['count']:
+            continue
+        filename = slice_filename(name)
+        exporter.write(os.path.join(directory, filename), data)
+        written.add(filename)
+        slices.append({'body_system': name, 'file': os.path.join(directory, filename), 'count': data['count']})
+
+    index = {
+        'all': ALL,
+        'total': total,
+        'dimensions': {
+            'age_group': AGE_GROUPS,
+            'gender': GENDERS,
+            'body_system': [s['body_system'] for s in slices],
+            'symptom': [symptom_keywords[code] for code in symptom_codes],
+        },
+        'top_conditions': top_conditions,
+        'slices': slices
+    }
+    exporter.write(os.path.join(directory, 'index.json'), index)
+    written.add('index.json')
+
+    # Drop slices left over from earlier runs, so the directory matches the index
+    for filename in os.listdir(directory):
+        base = re.sub(r'\.(gz|br)$', '', filename)
+        if base.endswith('.json') and base not in written:
+            os.remove(os.path.join(directory, filename))
+    return index
@@ -0,0 +1,100 @@
+"""Offline-first, memory-mapped loading of the medical-o1-reasoning-SFT split.
+
+The first run fetches the split with the Hugging Face datasets package
+(regular or streaming mode) and writes the Question and Response columns to
+an uncompressed Arrow IPC snapshot. Every later run memory-maps that
+snapshot, so it needs neither the network nor the datasets package. The
+split is never copied into one DataFrame; callers iterate record batches
+and get one pandas Series per column and batch.
+"""
+
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+DATASET = "FreedomIntelligence/medical-o1-reasoning-SFT"
+CONFIG = "en"
+SPLIT = "train"
+COLUMNS = ['Question', 'Response']
+SNAPSHOT_PATH = 'data/snapshots/medical-o1-reasoning-SFT-en.arrow'
+SCHEMA = pa.schema([(column, pa.string()) for column in COLUMNS])
+
+
+def open_snapshot(path):
+    """Memory-map a snapshot (.parquet, Arrow IPC file or Arrow stream) as a table"""
+    path = str(path)
+    if path.endswith('.parquet'):
+        return pq.read_table(path, columns=COLUMNS, memory_map=True)
+    source = pa.memory_map(path, 'r')
+    try:
+        table = pa.ipc.open_file(source).read_all()
+    except pa.ArrowInvalid:
+        # datasets' own cache files are Arrow streams
+        source.seek(0)
+        table = pa.ipc.open_stream(source).read_all()
+    return table.select(COLUMNS)
+
+
+def _as_batch(columns):
+    return pa.RecordBatch.from_arrays([pa.array(columns[c], type=pa.string()) for c in COLUMNS], schema=SCHEMA)
+
+
+def _download_batches(streaming=False, batch_size=10000):
+    """Yield record batches of the split from the Hugging Face hub or its local cache"""
+    try:
+        from datasets import load_dataset
+    except ImportError:
+        raise SystemExit(f"No snapshot found and the datasets package is not installed; "
+                         f"pass --snapshot with a local .arrow/.parquet copy of {DATASET}")
+    if streaming:
+        split = load_dataset(DATASET, CONFIG, split=SPLIT, streaming=True)
+        for batch in split.iter(batch_size=batch_size):
+            yield _as_batch(batch)
+        return
+    split = load_dataset(DATASET, CONFIG)[SPLIT]
+    data = getattr(split, 'data', None)
+    if data is not None:
+        # A regular Dataset is already a memory-mapped Arrow table in the HF cache
+        yield from data.table.select(COLUMNS).cast(SCHEMA).to_batches(max_chunksize=batch_size)
+        return
+    rows = list(split)
+    for start in range(0, len(rows), batch_size):
+        chunk = rows[start:start + batch_size]
+        yield _as_batch({c: [row.get(c) for row in chunk] for c in COLUMNS})
+
+
+def write_snapshot(batches, path):
+    """Write record batches to an Arrow IPC file, atomically; returns the row count"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    rows = 0
+    with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, SCHEMA) as writer:
+        for batch in batches:
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    os.replace(tmp_path, path)
+    return rows
+
+
+def load_source(snapshot=SNAPSHOT_PATH, refresh=False, streaming=False):
+    """Memory-mapped Question/Response table, downloading into the snapshot only when needed"""
+    if refresh or not os.path.exists(snapshot):
+        print(f"Fetching {DATASET} ({CONFIG}/{SPLIT}) into {snapshot}...")
+        rows = write_snapshot(_download_batches(streaming), snapshot)
+        print(f"Saved: {snapshot} ({rows} rows)")
+    return open_snapshot(snapshot)
+
+
+def iter_text_batches(table, batch_size=50000, columns=COLUMNS):
+    """Yield one tuple of str Series per batch; nulls become '' and the index runs across batches"""
+    table = table.select(list(columns))
+    # Table slices are zero-copy views, whatever the chunking of the file
+    for start in range(0, table.num_rows, batch_size):
+        batch = table.slice(start, batch_size)
+        index = pd.RangeIndex(start, start + batch.num_rows)
+        yield tuple(
+            pd.Series(batch.column(c).to_pylist(), index=index, dtype=object).fillna('')
+            for c in columns
+        )
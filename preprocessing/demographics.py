@@ -0,0 +1,154 @@
+"""Fused age and gender extraction: one lowercase and one tokenizer pass per question.
+
+extractors.extract_age tries five regexes in turn and extract_gender runs
+fifteen searches, while extracted_features2.py runs its own age and gender
+regexes for the four-bin age groups and binary genders. extract_demographics
+lowercases a question once and walks a single tokenizer over it, which
+yields every digit run, every 'age' and every gender word. The rules of both
+schemes are then applied to those tokens, so each field equals what the
+separate functions return (check_equivalence.py checks this on a labeled
+fixture and on the data).
+"""
+
+import re
+from collections import namedtuple
+
+from extractors import female_patterns, male_patterns
+
+# extracted_features2.py's patterns; matched case-insensitively on the original text
+PEDIATRIC_AGE_PATTERN = r'(\d+)\s*-?\s*year\s*-?\s*old|age\s*(?:of)?\s*(\d+)'
+BINARY_MALE_PATTERN = r'\b(?:man|male|boy|gentleman)\b'
+BINARY_FEMALE_PATTERN = r'\b(?:woman|female|girl|lady)\b'
+
+# Every gender pattern is one whole word between \b anchors
+MALE_WORDS = frozenset(p[2:-2] for p in male_patterns)
+FEMALE_WORDS = frozenset(p[2:-2] for p in female_patterns)
+BINARY_MALE_WORDS = frozenset(['man', 'male', 'boy', 'gentleman'])
+BINARY_FEMALE_WORDS = frozenset(['woman', 'female', 'girl', 'lady'])
+
+Demographics = namedtuple('Demographics', [
+    'age',                  # extract_age's age, None if not stated
+    'age_unit',             # 'year', 'month', 'week' or 'day'; None if no age
+    'age_group',            # extract_age's seven-bin group
+    'pediatric_age_group',  # extracted_features2's four-bin group, None if no age
+    'male_score',           # male patterns found, as in extract_gender
+    'female_score',
+    'gender',               # extract_gender's Male/Female/Unknown
+    'binary_gender',        # extracted_features2's Male/Female, None if neither
+])
+
+# No token can start inside another, so finditer visits every occurrence; the
+# leading lookahead lets the scan skip positions that cannot start a token
+_words = sorted(MALE_WORDS | FEMALE_WORDS | BINARY_MALE_WORDS | BINARY_FEMALE_WORDS, key=len, reverse=True)
+_TOKENS = re.compile(
+    r'(?=[\da' + ''.join(sorted({w[0] for w in _words})) + r'])'
+    r'(?:(\d+)|(age)|\b(' + '|'.join(_words) + r')\b)'
+)
+# After a digit run; extract_age allows at most one '-' or space around the unit
+_UNIT = re.compile(r'(\s*-?\s*)(year|month|week|day)(\s*-?\s*)old')
+# After 'age': extract_age's 'aged?\s*(\d{1,3})' and extracted_features2's 'age\s*(?:of)?\s*(\d+)'
+_AGED = re.compile(r'd?\s*(\d{1,3})')
+_AGE_OF = re.compile(r'\s*(?:of)?\s*(\d+)')
+_UNITS = ['year', 'month', 'week', 'day']
+
+# re.I also folds these onto ASCII letters, and lower() changes their length,
+# so questions containing them take the original case-insensitive regexes
+_FOLDED = ('İ', 'ı', 'ſ', 'K')
+_pediatric_regex = re.compile(PEDIATRIC_AGE_PATTERN, re.I)
+_binary_male_regex = re.compile(BINARY_MALE_PATTERN, re.I)
+_binary_female_regex = re.compile(BINARY_FEMALE_PATTERN, re.I)
+
+
+def age_group(age):
+    """Seven-bin group used by the processed_data records"""
+    if age <= 1:
+        return 'Infant (0-1)'
+    elif age <= 12:
+        return 'Child (2-12)'
+    elif age <= 19:
+        return 'Adolescent (13-19)'
+    elif age <= 39:
+        return 'Young Adult (20-39)'
+    elif age <= 59:
+        return 'Middle Age (40-59)'
+    elif age <= 79:
+        return 'Senior (60-79)'
+    return 'Elderly (80+)'
+
+
+def pediatric_age_group(age):
+    """Four-bin group used by age_disease.json"""
+    if age <= 18:
+        return 'Pediatric (0-18)'
+    elif age <= 40:
+        return 'Young Adult (19-40)'
+    elif age <= 65:
+        return 'Adult (41-65)'
+    return 'Senior (65+)'
+
+
+def _binary_gender(male, female):
+    return 'Male' if male else 'Female' if female else None
+
+
+def _folded_fields(question):
+    """extracted_features2's age group and binary gender with its own regexes"""
+    match = _pediatric_regex.search(question)
+    group = pediatric_age_group(int(match.group(1) or match.group(2))) if match else None
+    return group, _binary_gender(_binary_male_regex.search(question), _binary_female_regex.search(question))
+
+
+def extract_demographics(question):
+    """Age, age unit, both age-group schemes and gender scores of one question"""
+    text = question.lower()
+    unit_ages = {}       # unit -> extract_age's age from the first '<n> <unit> old'
+    aged = None          # first 'aged <n>'
+    pediatric = None     # (position, age) of extracted_features2's first match
+    words = set()
+
+    for token in _TOKENS.finditer(text):
+        digits, age_word, word = token.groups()
+        if word is not None:
+            words.add(word)
+        elif digits is not None:
+            unit = _UNIT.match(text, token.end())
+            if unit is None:
+                continue
+            before, name, after = unit.groups()
+            if name not in unit_ages and len(before) <= 1 and len(after) <= 1:
+                unit_ages[name] = int(digits[-3:])
+            if name == 'year' and pediatric is None:
+                pediatric = (token.start(), int(digits))
+        else:
+            if aged is None:
+                match = _AGED.match(text, token.end())
+                if match:
+                    aged = int(match.group(1))
+            if pediatric is None or pediatric[0] > token.start():
+                match = _AGE_OF.match(text, token.end())
+                if match:
+                    pediatric = (token.start(), int(match.group(1)))
+
+    for unit in _UNITS:
+        if unit in unit_ages:
+            age = unit_ages[unit] if unit == 'year' else 0
+            break
+    else:
+        unit, age = ('year', aged) if aged is not None else (None, None)
+
+    male_score = len(words & MALE_WORDS)
+    female_score = len(words & FEMALE_WORDS)
+    if any(c in question for c in _FOLDED):
+        pediatric_group, binary_gender = _folded_fields(question)
+    else:
+        pediatric_group = pediatric_age_group(pediatric[1]) if pediatric else None
+        binary_gender = _binary_gender(words & BINARY_MALE_WORDS, words & BINARY_FEMALE_WORDS)
+
+    return Demographics(
+        age, unit,
+        age_group(age) if age is not None else 'Unknown',
+        pediatric_group,
+        male_score, female_score,
+        'Female' if female_score > male_score else 'Male' if male_score > female_score else 'Unknown',
+        binary_gender
+    )
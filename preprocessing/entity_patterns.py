@@ -0,0 +1,75 @@
+"""Compiled registry of named pattern sets, matched with one scan per text"""
+
+import re
+
+from keyword_matcher import KeywordMatcher
+
+# Alternatives made only of these characters are plain literals
+_LITERAL = re.compile(r'[A-Za-z0-9 ]+')
+
+# re.I also folds these onto ASCII letters, which lower() does not, so with
+# re.I texts containing them take the original patterns (as in demographics)
+_FOLDED = ('İ', 'ı', 'ſ', 'K')
+
+
+def literal_alternatives(pattern):
+    """Return the literals of a plain 'a|b|c' pattern, or None if it uses regex syntax"""
+    alternatives = pattern.split('|')
+    if all(_LITERAL.fullmatch(alt) for alt in alternatives):
+        return alternatives
+    return None
+
+
+class PatternRegistry:
+    """Categories of named patterns, e.g. {'symptom': {'Fever': r'fever'}}
+
+    Every literal alternation across all categories is merged into one
+    Aho-Corasick automaton, so a text is scanned once no matter how many
+    names are registered. Patterns that use real regex syntax are compiled
+    once and searched individually. With re.I the text is lowercased once
+    before matching, unless it has a character only re.I folds.
+    """
+
+    def __init__(self, categories, flags=0):
+        self.categories = {category: list(patterns) for category, patterns in categories.items()}
+        self.ignore_case = bool(flags & re.I)
+        self._regexes = []  # ((category, name), compiled pattern) for non-literal patterns
+        self._folded = []  # ((category, name), compiled pattern) for every pattern, with re.I
+        keywords = []
+        for category, patterns in categories.items():
+            for name, pattern in patterns.items():
+                if self.ignore_case:
+                    self._folded.append(((category, name), re.compile(pattern, flags)))
+                literals = literal_alternatives(pattern)
+                if literals is None:
+                    self._regexes.append(((category, name), re.compile(pattern, flags)))
+                else:
+                    keywords.extend(
+                        (literal.lower() if self.ignore_case else literal, (category, name))
+                        for literal in literals
+                    )
+        self._matcher = KeywordMatcher(keywords)
+
+    def labels(self):
+        """Every (category, name) pair, in registration order"""
+        return [(category, name) for category, names in self.categories.items() for name in names]
+
+    def match_labels(self, text):
+        """Return the set of (category, name) pairs whose pattern occurs in text"""
+        if self.ignore_case and any(c in text for c in _FOLDED):
+            return {label for label, regex in self._folded if regex.search(text)}
+        found = self._matcher.find(text.lower() if self.ignore_case else text)
+        labels = self._matcher.labels
+        hits = {labels[i] for i in found}
+        for label, regex in self._regexes:
+            if regex.search(text):
+                hits.add(label)
+        return hits
+
+    def match(self, text):
+        """Return {category: [matched names in registration order]}"""
+        hits = self.match_labels(text)
+        return {
+            category: [name for name in names if (category, name) in hits]
+            for category, names in self.categories.items()
+        }
@@ -1,233 +1,219 @@
+import argparse
 import pandas as pd
-import re
-import json
-from datasets import load_dataset
 
-# =======================
-# LOAD DATA
-# =======================
-ds = load_dataset("FreedomIntelligence/medical-o1-reasoning-SFT", "en")
-df = pd.DataFrame(ds['train'])
-
-df['Question'] = df['Question'].fillna('').astype(str)
-df['Response'] = df['Response'].fillna('').astype(str)
+from dataset_source import SNAPSHOT_PATH, iter_text_batches, load_source
+from demographics import BINARY_FEMALE_PATTERN, BINARY_MALE_PATTERN, PEDIATRIC_AGE_PATTERN, extract_demographics
+from extraction_cache import ExtractionCache, table_version
+from instrumentation import RunReport
+from json_export import JsonExporter
+from network import CooccurrenceNetwork
+from taxonomy import (
+    ARTIFACT_VERSION, load_taxonomy, network_registry as compiled_network_registry,
+    question_registry as compiled_question_registry
+)
+from vectorized import as_text, disease_crosstab, disease_flags
 
 # =======================
 # REGEX DEFINITIONS
 # =======================
-age_pattern = r'(\d+)\s*-?\s*year\s*-?\s*old|age\s*(?:of)?\s*(\d+)'
-male_pattern = r'\b(?:man|male|boy|gentleman)\b'
-female_pattern = r'\b(?:woman|female|girl|lady)\b'
-
-disease_map = {
-    'Gastrointestinal': r'stomach|abdominal|nausea|vomiting|diarrhea|gastric',
-    'Heart/Cardiac': r'heart attack|chest pain|angina|hypertension',
-    'Infectious Disease': r'fever|infection|sepsis|virus|bacteria',
-    'Neurological': r'stroke|weakness|headache|seizure',
-    'Respiratory': r'cough|asthma|shortness of breath|pneumonia',
-    'Endocrine/Diabetes': r'diabetes|thyroid|insulin',
-    'Dermatology': r'psoriasis|skin|rash|eczema',
-    'Orthopedic': r'fracture|joint pain|arthritis|muscle',
-    'Renal/Urology': r'kidney|renal|uti|urinary',
-    'Mental Health': r'anxiety|depression|stress|bipolar'
-}
+# Age and gender come from demographics.extract_demographics, which fuses
+# this script's age and gender rules with the processed_data ones
+
+# Disease categories and network entities, from taxonomies/medical_o1.json
+disease_map = load_taxonomy('medical_o1')['disease_categories']
+
+# Every category is merged into one automaton per text type; both registries
+# are compiled once per taxonomy and unpickled from taxonomies/compiled/
+question_registry = compiled_question_registry()
+network_registry = compiled_network_registry()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Build disease and network data from medical-o1-reasoning-SFT")
+    parser.add_argument('--snapshot', default=SNAPSHOT_PATH, metavar='PATH',
+                        help="local .arrow/.parquet copy of the split; fetched from Hugging Face only if missing")
+    parser.add_argument('--refresh-snapshot', action='store_true',
+                        help="fetch the split again and overwrite the snapshot")
+    parser.add_argument('--streaming', action='store_true',
+                        help="fetch the split with datasets streaming instead of a full download")
+    parser.add_argument('--batch-size', type=int, default=50000,
+                        help="rows per record batch read from the snapshot")
+    parser.add_argument('--cache', metavar='PATH',
+                        help="SQLite extraction cache; re-runs only extract new or changed questions")
+    parser.add_argument('--network-top-k', type=int, default=None,
+                        help="keep only each node's k heaviest links in medical_network.json")
+    parser.add_argument('--network-min-weight', type=int, default=1,
+                        help="drop network links that co-occur in fewer documents")
+    parser.add_argument('--pretty', action='store_true',
+                        help="indent the JSON outputs instead of writing them compact")
+    parser.add_argument('--digits', type=int, default=4,
+                        help="round floats in the JSON outputs to this many decimals")
+    parser.add_argument('--no-precompress', action='store_true',
+                        help="skip the .json.gz/.json.br siblings")
+    parser.add_argument('--profile', choices=['cprofile', 'pyinstrument'],
+                        help="profile each stage and save the profiles under data/profiles/")
+    return parser
+
 
 # =======================
 # 1. AGE × DISEASE (Pre-aggregated for D3)
 # =======================
-age_disease_raw = []
-
-for q in df['Question']:
-    for disease, pattern in disease_map.items():
-        if re.search(pattern, q, re.I):
-            age_match = re.search(age_pattern, q, re.I)
-            if age_match:
-                age = int(age_match.group(1) or age_match.group(2))
-                group = (
-                    'Pediatric (0-18)' if age <= 18 else
-                    'Young Adult (19-40)' if age <= 40 else
-                    'Adult (41-65)' if age <= 65 else
-                    'Senior (65+)'
-                )
-                age_disease_raw.append({
-                    'disease': disease,
-                    'age_group': group
-                })
-
-# Pre-aggregate for easier D3 consumption
-age_df = pd.DataFrame(age_disease_raw)
-if len(age_df) > 0:
-    age_pivot = age_df.groupby(['disease', 'age_group']).size().unstack(fill_value=0)
-    age_pivot['Total'] = age_pivot.sum(axis=1)
-    age_pivot = age_pivot.sort_values('Total', ascending=True).drop(columns=['Total'])
-    
-    age_disease = []
-    for disease in age_pivot.index:
-        row = {'disease': disease}
-        for col in age_pivot.columns:
-            row[col] = int(age_pivot.loc[disease, col])
-        age_disease.append(row)
-else:
-    age_disease = []
+def demographic_fields(questions):
+    """Four-bin age groups and binary genders; None where not stated"""
+    found = [extract_demographics(q) for q in questions]
+    ages = pd.Series([d.pediatric_age_group for d in found], index=questions.index, dtype=object)
+    genders = pd.Series([d.binary_gender for d in found], index=questions.index, dtype=object)
+    return ages, genders
+
+def cached_question_fields(questions, cache):
+    """Disease hits, age groups and genders, reusing cached values for unchanged questions"""
+    def series(values):
+        return as_text(pd.Series(values, dtype=object))
+
+    def disease_lists(qs, _):
+        flags = disease_flags(series(qs), question_registry)
+        names = list(flags.columns)
+        return [[name for name, hit in zip(names, row) if hit] for row in flags.to_numpy()]
+
+    fields = {
+        'disease_categories': (
+            # The registry's matching code is versioned with its compiled artifact
+            table_version(disease_map, ARTIFACT_VERSION),
+            disease_lists
+        ),
+        'pediatric_age_group': (
+            table_version(PEDIATRIC_AGE_PATTERN),
+            lambda qs, _: [extract_demographics(q).pediatric_age_group for q in qs]
+        ),
+        'binary_gender': (
+            table_version(BINARY_MALE_PATTERN, BINARY_FEMALE_PATTERN),
+            lambda qs, _: [extract_demographics(q).binary_gender for q in qs]
+        ),
+    }
+    # These fields only depend on the question, so rows are keyed on it alone
+    values = cache.extract(questions.tolist(), [''] * len(questions), fields)
+
+    hits = pd.DataFrame(
+        [[d in found for d in disease_map] for found in values['disease_categories']],
+        index=questions.index, columns=list(disease_map), dtype=bool
+    )
+    ages = pd.Series(values['pediatric_age_group'], index=questions.index, dtype=object)
+    genders = pd.Series(values['binary_gender'], index=questions.index, dtype=object)
+    return hits, ages, genders
+
+def question_fields(source, batch_size=50000, cache_path=None):
+    """Disease hits, age groups and genders of every question, matched once and shared by both views"""
+    cache = ExtractionCache(cache_path) if cache_path else None
+    parts = []
+    for (batch_questions,) in iter_text_batches(source, batch_size, columns=['Question']):
+        batch_questions = as_text(batch_questions)
+        if cache is not None:
+            parts.append(cached_question_fields(batch_questions, cache))
+        else:
+            parts.append((disease_flags(batch_questions, question_registry),) + demographic_fields(batch_questions))
+    if cache is not None:
+        cache.close()
+        print(f"Extraction cache: {cache.hits} hits, {cache.misses} misses")
+
+    # Only the per-question labels are kept in memory, not the question text
+    disease_hits = pd.concat([p[0] for p in parts]) if parts else pd.DataFrame(columns=list(disease_map), dtype=bool)
+    age_groups = pd.concat([p[1] for p in parts]) if parts else pd.Series(dtype=object)
+    genders = pd.concat([p[2] for p in parts]) if parts else pd.Series(dtype=object)
+    return disease_hits, age_groups, genders
+
+def build_age_disease(disease_hits, age_groups):
+    # Pre-aggregate for easier D3 consumption
+    age_pivot = disease_crosstab(disease_hits, age_groups, 'age_group')
+    if len(age_pivot) > 0:
+        age_pivot['Total'] = age_pivot.sum(axis=1)
+        age_pivot = age_pivot.sort_values('Total', ascending=True).drop(columns=['Total'])
+
+        age_disease = []
+        for disease in age_pivot.index:
+            row = {'disease': disease}
+            for col in age_pivot.columns:
+                row[col] = int(age_pivot.loc[disease, col])
+            age_disease.append(row)
+    else:
+        age_disease = []
+    return age_disease
 
 # =======================
 # 2. GENDER × DISEASE (Pre-aggregated for D3)
 # =======================
-gender_disease_raw = []
-
-for q in df['Question']:
-    gender = (
-        'Male' if re.search(male_pattern, q, re.I) else
-        'Female' if re.search(female_pattern, q, re.I) else None
-    )
-    if gender:
-        for disease, pattern in disease_map.items():
-            if re.search(pattern, q, re.I):
-                gender_disease_raw.append({
-                    'disease': disease,
-                    'gender': gender
-                })
-
-# Pre-aggregate for easier D3 consumption
-gender_df = pd.DataFrame(gender_disease_raw)
-if len(gender_df) > 0:
-    gender_pivot = gender_df.groupby(['disease', 'gender']).size().unstack(fill_value=0)
-    gender_pivot = gender_pivot.sort_values('Male', ascending=True)
-    
-    gender_disease = []
-    for disease in gender_pivot.index:
-        row = {'disease': disease}
-        for col in gender_pivot.columns:
-            row[col] = int(gender_pivot.loc[disease, col])
-        gender_disease.append(row)
-else:
-    gender_disease = []
+def build_gender_disease(disease_hits, genders):
+    # Pre-aggregate for easier D3 consumption
+    gender_pivot = disease_crosstab(disease_hits, genders, 'gender')
+    if len(gender_pivot) > 0:
+        gender_pivot = gender_pivot.sort_values('Male', ascending=True)
+
+        gender_disease = []
+        for disease in gender_pivot.index:
+            row = {'disease': disease}
+            for col in gender_pivot.columns:
+                row[col] = int(gender_pivot.loc[disease, col])
+            gender_disease.append(row)
+    else:
+        gender_disease = []
+    return gender_disease
 
 # =======================
 # 3. MEDICAL NETWORK (Enhanced)
 # =======================
-nodes = {}
-links_set = set()  # Use set to avoid duplicate links
-node_counts = {}   # Track connection counts for node sizing
-
-def add_node(name, group):
-    if name not in nodes:
-        nodes[name] = {'id': name, 'group': group}
-        node_counts[name] = 0
-    node_counts[name] += 1
-
-def add_link(source, target, link_type):
-    key = (source, target)
-    if key not in links_set:
-        links_set.add(key)
-
-for _, row in df.head(1000).iterrows():
-    text = (row['Question'] + " " + row['Response']).lower()
-
-    # Extended symptom patterns
-    symptoms = {
-        'Chest Pain': r'chest pain',
-        'Fever': r'fever',
-        'Headache': r'headache',
-        'Nausea': r'nausea',
-        'Weakness': r'weakness',
-        'Shortness of Breath': r'shortness of breath|dyspnea'
-    }
-    
-    # Extended disease patterns
-    diseases = {
-        'Heart Attack': r'heart attack|myocardial infarction',
-        'Stroke': r'stroke',
-        'Diabetes': r'diabetes',
-        'Hypertension': r'hypertension|high blood pressure',
-        'Asthma': r'asthma'
-    }
-    
-    # Extended medication patterns
-    meds = {
-        'Aspirin': r'aspirin',
-        'Insulin': r'insulin',
-        'Beta Blockers': r'beta blocker|metoprolol',
-        'Antibiotics': r'antibiotic'
-    }
-    
-    # Risk factors
-    risks = {
-        'Smoking': r'smoking|smoker',
-        'Obesity': r'obesity|obese',
-        'High Cholesterol': r'cholesterol',
-        'Family History': r'family history'
-    }
-    
-    # Diagnostic tests
-    diagnostics = {
-        'ECG': r'ecg|electrocardiogram',
-        'Blood Test': r'blood test',
-        'MRI': r'mri',
-        'CT Scan': r'ct scan'
-    }
-    
-    # Procedures
-    procedures = {
-        'Surgery': r'surgery',
-        'Angioplasty': r'angioplasty',
-        'Dialysis': r'dialysis',
-        'Inhaler': r'inhaler'
-    }
+def build_network(source, batch_size=50000):
+    """Entity co-occurrence counts; every record is matched once, pairs come from a sparse matrix product"""
+    network = CooccurrenceNetwork(network_registry)
+    network.add_texts(
+        (question + " " + response).lower()
+        for questions, responses in iter_text_batches(source, batch_size)
+        for question, response in zip(questions, responses)
+    )
+    return network
 
-    found_s = [k for k, p in symptoms.items() if re.search(p, text)]
-    found_d = [k for k, p in diseases.items() if re.search(p, text)]
-    found_m = [k for k, p in meds.items() if re.search(p, text)]
-    found_r = [k for k, p in risks.items() if re.search(p, text)]
-    found_diag = [k for k, p in diagnostics.items() if re.search(p, text)]
-    found_proc = [k for k, p in procedures.items() if re.search(p, text)]
-
-    for s in found_s:
-        add_node(s, 'symptom')
-    for d in found_d:
-        add_node(d, 'disease')
-    for m in found_m:
-        add_node(m, 'medication')
-    for r in found_r:
-        add_node(r, 'risk')
-    for diag in found_diag:
-        add_node(diag, 'diagnostic')
-    for proc in found_proc:
-        add_node(proc, 'procedure')
-
-    # Create links between entities
-    for d in found_d:
-        for s in found_s:
-            add_link(s, d, 'symptom')
-        for m in found_m:
-            add_link(d, m, 'treatment')
-        for r in found_r:
-            add_link(r, d, 'risk')
-        for diag in found_diag:
-            add_link(d, diag, 'diagnostic')
-        for proc in found_proc:
-            add_link(d, proc, 'procedure')
-
-# Convert links set to list with proper format
-links = [{'source': s, 'target': t} for s, t in links_set]
-
-# Add count to nodes for sizing
-for name in nodes:
-    nodes[name]['count'] = node_counts.get(name, 1)
 
-# =======================
-# SAVE JSON FILES
-# =======================
-with open('data/age_disease.json', 'w') as f:
-    json.dump(age_disease, f, indent=2)
+def main():
+    args = build_parser().parse_args()
+    report = RunReport('extracted_features2', profile=args.profile)
+
+    # =======================
+    # LOAD DATA
+    # =======================
+    # The split is memory-mapped and read in record batches, never as one DataFrame
+    report.start_stage('load')
+    source = load_source(args.snapshot, refresh=args.refresh_snapshot, streaming=args.streaming)
+    report.end_stage(rows=source.num_rows)
+
+    # Disease categories are matched once per question and shared by both views
+    report.start_stage('extract_questions')
+    disease_hits, age_groups, genders = question_fields(source, args.batch_size, args.cache)
+    report.end_stage(rows=len(disease_hits))
+
+    report.start_stage('age_disease')
+    age_disease = build_age_disease(disease_hits, age_groups)
+
+    report.start_stage('gender_disease')
+    gender_disease = build_gender_disease(disease_hits, genders)
+
+    report.start_stage('network')
+    network = build_network(source, args.batch_size)
+    medical_network = network.to_json(top_k=args.network_top_k, min_weight=args.network_min_weight)
+    report.end_stage(rows=network.documents)
+
+    # =======================
+    # SAVE JSON FILES
+    # =======================
+    report.start_stage('save_json')
+    exporter = JsonExporter(pretty=args.pretty, digits=args.digits, precompress=not args.no_precompress)
+    exporter.write('data/age_disease.json', age_disease)
+    exporter.write('data/gender_disease.json', gender_disease)
+    exporter.write('data/medical_network.json', medical_network)
+    exporter.write_manifest()
+
+    report.end_stage()
+    report.write()
 
-with open('data/gender_disease.json', 'w') as f:
-    json.dump(gender_disease, f, indent=2)
+    print("✅ Data preprocessing complete.")
 
-with open('data/medical_network.json', 'w') as f:
-    json.dump({
-        'nodes': list(nodes.values()),
-        'links': links
-    }, f, indent=2)
 
-print("✅ Data preprocessing complete.")
+if __name__ == '__main__':
+    main()
@@ -1,394 +1,290 @@
-import pandas as pd
-import re
-import json
-from collections import Counter, defaultdict
-
-# Load data
-df = pd.read_csv("data/medical_questions.csv")
-print(f"Loaded {len(df)} rows")
-
-# ============================================================
-# EXTRACTION PATTERNS
-# ============================================================
-
-# Age extraction patterns
-age_patterns = [
-    r'(\d{1,3})[-\s]?year[-\s]?old',
-    r'(\d{1,3})[-\s]?month[-\s]?old',
-    r'(\d{1,3})[-\s]?week[-\s]?old',
-    r'(\d{1,3})[-\s]?day[-\s]?old',
-    r'aged?\s*(\d{1,3})',
-]
-
-# Gender patterns
-male_patterns = [r'\bmale\b', r'\bman\b', r'\bbox\b', r'\bhis\b', r'\bhe\b', r'\bfather\b', r'\bhusband\b']
-female_patterns = [r'\bfemale\b', r'\bwoman\b', r'\bgirl\b', r'\bher\b', r'\bshe\b', r'\bmother\b', r'\bpregnant\b', r'\bwife\b']
-
-# Body system keywords mapping
-body_systems = {
-    'Brain/Neurological': {
-        'keywords': ['headache', 'seizure', 'stroke', 'confusion', 'memory', 'brain', 'neural', 'cognitive', 
-                     'alzheimer', 'parkinson', 'epilepsy', 'migraine', 'dementia', 'consciousness', 'coma',
-                     'meningitis', 'encephalitis', 'neuropathy', 'tremor', 'paralysis', 'numbness'],
-        'color': '#FF6B6B'
-    },
-    'Eyes': {
-        'keywords': ['vision', 'blind', 'eye', 'retina', 'cataract', 'glaucoma', 'optic', 'pupil', 
-                     'conjunctiv', 'cornea', 'visual', 'ophthalmol'],
-        'color': '#4ECDC4'
-    },
-    'Ears/Nose/Throat': {
-        'keywords': ['hearing', 'deaf', 'ear', 'throat', 'sinus', 'tinnitus', 'nasal', 'pharynx', 
-                     'larynx', 'tonsil', 'otitis', 'vertigo', 'nose', 'smell'],
-        'color': '#45B7D1'
-    },
-    'Cardiovascular': {
-        'keywords': ['heart', 'cardiac', 'chest pain', 'palpitation', 'hypertension', 'blood pressure',
-                     'arrhythmia', 'myocardial', 'coronary', 'angina', 'atrial', 'ventricular', 
-                     'murmur', 'infarction', 'cardiomyopathy', 'aorta', 'valve'],
-        'color': '#E74C3C'
-    },
-    'Respiratory': {
-        'keywords': ['lung', 'breath', 'cough', 'pneumonia', 'asthma', 'bronch', 'pulmonary', 
-                     'respiratory', 'dyspnea', 'wheez', 'copd', 'tuberculosis', 'chest x-ray',
-                     'sputum', 'pleural', 'emphysema'],
-        'color': '#3498DB'
-    },
-    'Gastrointestinal': {
-        'keywords': ['stomach', 'abdominal', 'nausea', 'vomit', 'diarrhea', 'constipation', 
-                     'gastric', 'intestin', 'bowel', 'liver', 'hepat', 'pancrea', 'gallbladder',
-                     'ulcer', 'gastritis', 'colitis', 'appendic', 'hernia', 'esophag', 'colon',
-                     'rectal', 'jaundice', 'cirrhosis', 'spleen'],
-        'color': '#F39C12'
-    },
-    'Kidney/Urinary': {
-        'keywords': ['kidney', 'renal', 'urinary', 'urine', 'bladder', 'ureter', 'creatinine',
-                     'dialysis', 'nephro', 'urolog', 'proteinuria', 'hematuria', 'cystitis'],
-        'color': '#9B59B6'
-    },
-    'Reproductive': {
-        'keywords': ['pregnan', 'menstrual', 'ovary', 'uterus', 'vaginal', 'cervix', 'obstetric',
-                     'gynec', 'fertility', 'contracepti', 'menopause', 'breast', 'mammary',
-                     'prostate', 'testicular', 'penile', 'erectile', 'fetus', 'delivery', 'labor'],
-        'color': '#E91E63'
-    },
-    'Musculoskeletal': {
-        'keywords': ['bone', 'fracture', 'joint', 'arthritis', 'muscle', 'osteo', 'spine', 'spinal',
-                     'back pain', 'neck pain', 'orthopedic', 'ligament', 'tendon', 'rheumat',
-                     'scoliosis', 'disc', 'lumbar', 'cervical', 'hip', 'knee', 'shoulder', 'ankle'],
-        'color': '#795548'
-    },
-    'Skin': {
-        'keywords': ['skin', 'rash', 'dermat', 'itch', 'lesion', 'wound', 'eczema', 'psoriasis',
-                     'acne', 'urticaria', 'melanoma', 'burn', 'ulcer', 'blister', 'pruritus'],
-        'color': '#FF9800'
-    },
-    'Blood/Immune': {
-        'keywords': ['anemia', 'bleeding', 'blood', 'platelet', 'leukemia', 'lymphoma', 'immune',
-                     'hiv', 'aids', 'autoimmune', 'allergy', 'hematol', 'coagulation', 'transfusion',
-                     'hemoglobin', 'wbc', 'rbc', 'infection', 'sepsis', 'fever'],
-        'color': '#F44336'
-    },
-    'Endocrine': {
-        'keywords': ['diabetes', 'thyroid', 'hormone', 'insulin', 'glucose', 'adrenal', 'pituitary',
-                     'endocrin', 'metabolic', 'obesity', 'hyperthyroid', 'hypothyroid', 'cortisol'],
-        'color': '#8BC34A'
-    },
-    'Mental Health': {
-        'keywords': ['depression', 'anxiety', 'psychiatric', 'psycho', 'schizophrenia', 'bipolar',
-                     'suicide', 'mood', 'mental', 'insomnia', 'panic', 'phobia', 'addiction',
-                     'substance abuse', 'alcohol', 'drug abuse', 'eating disorder'],
-        'color': '#673AB7'
-    }
-}
-
-# Symptom keywords
-symptom_keywords = [
-    'pain', 'fever', 'cough', 'headache', 'nausea', 'vomiting', 'diarrhea', 'fatigue',
-    'weakness', 'swelling', 'bleeding', 'rash', 'itching', 'dizziness', 'shortness of breath',
-    'chest pain', 'abdominal pain', 'back pain', 'weight loss', 'weight gain', 'loss of appetite',
-    'difficulty breathing', 'palpitations', 'numbness', 'tingling', 'confusion', 'seizure',
-    'tremor', 'blurred vision', 'hearing loss', 'sore throat', 'runny nose', 'constipation',
-    'frequent urination', 'blood in urine', 'blood in stool', 'jaundice', 'bruising'
-]
-
-# ============================================================
-# EXTRACTION FUNCTIONS
-# ============================================================
-
-def extract_age(text):
-    """Extract age and return age group"""
-    text = text.lower()
-    
-    for pattern in age_patterns:
-        match = re.search(pattern, text)
-        if match:
-            age = int(match.group(1))
-            
-            # Handle month/week/day old (convert to 0)
-            if 'month' in pattern or 'week' in pattern or 'day' in pattern:
-                return 0, 'Infant (0-1)'
-            
-            # Age groups
-            if age <= 1:
-                return age, 'Infant (0-1)'
-            elif age <= 12:
-                return age, 'Child (2-12)'
-            elif age <= 19:
-                return age, 'Adolescent (13-19)'
-            elif age <= 39:
-                return age, 'Young Adult (20-39)'
-            elif age <= 59:
-                return age, 'Middle Age (40-59)'
-            elif age <= 79:
-                return age, 'Senior (60-79)'
-            else:
-                return age, 'Elderly (80+)'
-    
-    return None, 'Unknown'
-
-def extract_gender(text):
-    """Extract gender from text"""
-    text = text.lower()
-    
-    male_score = sum(1 for p in male_patterns if re.search(p, text))
-    female_score = sum(1 for p in female_patterns if re.search(p, text))
-    
-    if female_score > male_score:
-        return 'Female'
-    elif male_score > female_score:
-        return 'Male'
-    else:
-        return 'Unknown'
-
-def extract_body_systems(text):
-    """Extract body systems mentioned in text"""
-    text = text.lower()
-    systems = []
-    
-    for system, data in body_systems.items():
-        for keyword in data['keywords']:
-            if keyword in text:
-                systems.append(system)
-                break
-    
-    return systems if systems else ['General/Other']
-
-def extract_symptoms(text):
-    """Extract symptoms from text"""
-    text = text.lower()
-    found_symptoms = []
-    
-    for symptom in symptom_keywords:
-        if symptom in text:
-            found_symptoms.append(symptom)
-    
-    return found_symptoms
-
-# ============================================================
-# PROCESS ALL DATA
-# ============================================================
-
-print("Processing data...")
-
-processed_data = []
-
-for idx, row in df.iterrows():
-    question = str(row['Open-ended Verifiable Question'])
-    answer = str(row['Ground-True Answer'])
-    
-    age, age_group = extract_age(question)
-    gender = extract_gender(question)
-    body_sys = extract_body_systems(question + " " + answer)
-    symptoms = extract_symptoms(question)
-    
-    processed_data.append({
-        'id': idx,
-        'question': question[:200] + '...' if len(question) > 200 else question,  # Truncate for JSON size
-        'answer': answer,
-        'age': age,
-        'age_group': age_group,
-        'gender': gender,
-        'body_systems': body_sys,
-        'primary_system': body_sys[0] if body_sys else 'General/Other',
-        'symptoms': symptoms,
-        'question_length': len(question.split())
-    })
-    
-    if (idx + 1) % 10000 == 0:
-        print(f"Processed {idx + 1} rows...")
-
-print(f"Processed all {len(processed_data)} rows")
-
-# ============================================================
-# GENERATE STATISTICS
-# ============================================================
-
-print("\nGenerating statistics...")
-
-# 1. Demographics for Sunburst
-demographics = defaultdict(lambda: defaultdict(int))
-for item in processed_data:
-    demographics[item['age_group']][item['gender']] += 1
-
-sunburst_data = {
-    "name": "Patients",
-    "children": []
-}
-
-for age_group, genders in demographics.items():
-    age_node = {
-        "name": age_group,
-        "children": [
-            {"name": gender, "value": count}
-            for gender, count in genders.items()
-        ]
-    }
-    sunburst_data["children"].append(age_node)
-
-# 2. Body System Stats for Anatomy Visualization
-body_system_stats = {}
-for system in list(body_systems.keys()) + ['General/Other']:
-    system_items = [item for item in processed_data if system in item['body_systems']]
-    
-    if system_items:
-        # Get top conditions (answers)
-        conditions = Counter([item['answer'] for item in system_items])
-        top_conditions = conditions.most_common(10)
-        
-        # Get top symptoms
-        all_symptoms = []
-        for item in system_items:
-            all_symptoms.extend(item['symptoms'])
-        top_symptoms = Counter(all_symptoms).most_common(10)
-        
-        # Age distribution
-        age_dist = Counter([item['age_group'] for item in system_items])
-        
-        # Gender distribution
-        gender_dist = Counter([item['gender'] for item in system_items])
-        
-        body_system_stats[system] = {
-            'count': len(system_items),
-            'top_conditions': [{'name': c[0], 'count': c[1]} for c in top_conditions],
-            'top_symptoms': [{'name': s[0], 'count': s[1]} for s in top_symptoms],
-            'age_distribution': dict(age_dist),
-            'gender_distribution': dict(gender_dist),
-            'color': body_systems.get(system, {}).get('color', '#95A5A6'),
-            'sample_questions': [item['question'] for item in system_items[:3]]
-        }
-
-# 3. Sankey Data (Symptom -> Diagnosis)
-symptom_diagnosis_pairs = defaultdict(int)
-for item in processed_data:
-    for symptom in item['symptoms'][:3]:  # Limit to first 3 symptoms per question
-        symptom_diagnosis_pairs[(symptom, item['answer'])] += 1
-
-# Get top pairs
-top_pairs = sorted(symptom_diagnosis_pairs.items(), key=lambda x: x[1], reverse=True)[:100]
-
-# Build Sankey structure
-all_symptoms_sankey = list(set([p[0][0] for p in top_pairs]))
-all_diagnoses_sankey = list(set([p[0][1] for p in top_pairs]))
-
-sankey_data = {
-    "nodes": [{"name": s, "type": "symptom"} for s in all_symptoms_sankey] + 
-             [{"name": d, "type": "diagnosis"} for d in all_diagnoses_sankey],
-    "links": []
-}
-
-for (symptom, diagnosis), count in top_pairs:
-    source_idx = all_symptoms_sankey.index(symptom)
-    target_idx = len(all_symptoms_sankey) + all_diagnoses_sankey.index(diagnosis)
-    sankey_data["links"].append({
-        "source": source_idx,
-        "target": target_idx,
-        "value": count
-    })
-
-# 4. Treemap Data (Specialty Hierarchy)
-treemap_data = {
-    "name": "Medical Questions",
-    "children": []
-}
-
-for system, stats in body_system_stats.items():
-    system_node = {
-        "name": system,
-        "color": stats['color'],
-        "children": [
-            {"name": cond['name'], "value": cond['count']}
-            for cond in stats['top_conditions'][:8]
-        ]
-    }
-    if system_node["children"]:  # Only add if has conditions
-        treemap_data["children"].append(system_node)
-
-# ============================================================
-# SAVE ALL JSON FILES
-# ============================================================
-
-print("\nSaving JSON files...")
-
-# Save processed data (sample for reference)
-with open('data/processed_data.json', 'w') as f:
-    json.dump(processed_data[:1000], f, indent=2)  # Save first 1000 for reference
-print("Saved: data/processed_data.json (sample of 1000 records)")
-
-# Save body system stats
-with open('data/body_system_stats.json', 'w') as f:
-    json.dump(body_system_stats, f, indent=2)
-print("Saved: data/body_system_stats.json")
-
-# Save demographics
-with open('data/demographics.json', 'w') as f:
-    json.dump(sunburst_data, f, indent=2)
-print("Saved: data/demographics.json")
-
-# Save sankey data
-with open('data/sankey_data.json', 'w') as f:
-    json.dump(sankey_data, f, indent=2)
-print("Saved: data/sankey_data.json")
-
-# Save treemap data
-with open('data/treemap_data.json', 'w') as f:
-    json.dump(treemap_data, f, indent=2)
-print("Saved: data/treemap_data.json")
-
-# ============================================================
-# PRINT SUMMARY STATISTICS
-# ============================================================
-
-print("\n" + "="*60)
-print("EXTRACTION SUMMARY")
-print("="*60)
-
-# Age extraction rate
-ages_found = sum(1 for item in processed_data if item['age'] is not None)
-print(f"\nAge extracted: {ages_found} / {len(processed_data)} ({100*ages_found/len(processed_data):.1f}%)")
-
-# Gender extraction rate
-genders_found = sum(1 for item in processed_data if item['gender'] != 'Unknown')
-print(f"Gender extracted: {genders_found} / {len(processed_data)} ({100*genders_found/len(processed_data):.1f}%)")
-
-# Body system distribution
-print(f"\nBody System Distribution:")
-system_counts = Counter([item['primary_system'] for item in processed_data])
-for system, count in system_counts.most_common():
-    print(f"  {system}: {count} ({100*count/len(processed_data):.1f}%)")
-
-# Age group distribution
-print(f"\nAge Group Distribution:")
-age_counts = Counter([item['age_group'] for item in processed_data])
-for age, count in age_counts.most_common():
-    print(f"  {age}: {count} ({100*count/len(processed_data):.1f}%)")
-
-# Gender distribution
-print(f"\nGender Distribution:")
-gender_counts = Counter([item['gender'] for item in processed_data])
-for gender, count in gender_counts.most_common():
-    print(f"  {gender}: {count} ({100*count/len(processed_data):.1f}%)")
-
-print("\n" + "="*60)
-print("DATA PREPROCESSING COMPLETE!")
-print("="*60)
\ No newline at end of file
+import argparse
+import pandas as pd
+
+from aggregation import build_body_system_stats, build_demographics, build_treemap, decode
+from cube import DEFAULT_CAPACITY as CUBE_CAPACITY, write_cube
+from extractors import AGE_GROUPS, ALL_SYSTEMS, GENDERS
+from instrumentation import RunReport
+from json_export import JsonExporter
+from sankey import build_sankey
+from sharding import aggregate_chunks, aggregate_partial, extract_chunk_columns, read_chunks, run_sharded
+from sketches import DEFAULTS as SKETCH_DEFAULTS, distinct_answers
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Extract features from data/medical_questions.csv")
+    parser.add_argument('--engine', choices=['rows', 'columnar'], default='rows',
+                        help="rows: per-row extraction loop; columnar: whole-column Arrow compute kernels")
+    parser.add_argument('--aggregation', choices=['counters', 'matrix'], default='matrix',
+                        help="counters: per-record Counter updates; matrix: cross-tabs counted over bitmask matrices")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="number of worker processes; chunks are aggregated in parallel and merged")
+    parser.add_argument('--chunk-rows', type=int, default=20000,
+                        help="rows per chunk for --workers and --stream")
+    parser.add_argument('--stream', action='store_true',
+                        help="read the CSV in chunks and aggregate on the fly with bounded memory")
+    parser.add_argument('--cache', metavar='PATH',
+                        help="SQLite extraction cache; re-runs only extract new or changed rows")
+    parser.add_argument('--write-extracted', metavar='PATH',
+                        help="also write every extracted record to a Parquet (or .arrow) file")
+    parser.add_argument('--from-extracted', metavar='PATH',
+                        help="skip extraction and aggregate a previously written extracted file")
+    parser.add_argument('--sketch', action='store_true',
+                        help="count conditions and symptom -> diagnosis flows with fixed-size mergeable sketches "
+                             "instead of exact Counters")
+    parser.add_argument('--sketch-capacity', type=int, default=SKETCH_DEFAULTS['capacity'],
+                        help="heavy-hitter candidates kept per counter; counts stay exact below this many distinct keys")
+    parser.add_argument('--sketch-epsilon', type=float, default=SKETCH_DEFAULTS['epsilon'],
+                        help="Count-Min overcount bound as a fraction of the counted total")
+    parser.add_argument('--sketch-delta', type=float, default=SKETCH_DEFAULTS['delta'],
+                        help="probability that a Count-Min estimate exceeds its bound")
+    parser.add_argument('--hll-precision', type=int, default=SKETCH_DEFAULTS['precision'],
+                        help="HyperLogLog registers (2**p) for distinct counts; error ~1.04/sqrt(2**p)")
+    parser.add_argument('--sankey-top-k', type=int, default=100,
+                        help="number of flows kept in sankey_data.json (per hop with --sankey-levels 3)")
+    parser.add_argument('--sankey-min-count', type=int, default=1,
+                        help="drop Sankey flows seen fewer times")
+    parser.add_argument('--sankey-levels', type=int, choices=[2, 3], default=2,
+                        help="2: symptom -> diagnosis; 3: symptom -> body system -> diagnosis")
+    parser.add_argument('--sample-per-stratum', type=int, default=0, metavar='N',
+                        help="save a seeded sample of N records per body system x age group x gender as "
+                             "processed_data.json and draw sample_questions from it, instead of the first rows")
+    parser.add_argument('--sample-seed', type=int, default=0,
+                        help="seed of the stratified sample; the same seed and input give the same sample")
+    parser.add_argument('--cube', action='store_true',
+                        help="also write the drill-down cube slices in data/cube/")
+    parser.add_argument('--cube-top-symptoms', type=int, default=10,
+                        help="symptoms kept as a cube dimension, most frequent first")
+    parser.add_argument('--cube-top-conditions', type=int, default=5,
+                        help="top conditions listed per cube cell")
+    parser.add_argument('--cube-capacity', type=int, default=CUBE_CAPACITY,
+                        help="conditions kept per cube cell when chunks or workers merge; listed counts are "
+                             "then lower bounds, within the cell's error_bound of at most N/(capacity+1)")
+    parser.add_argument('--pretty', action='store_true',
+                        help="indent the JSON outputs instead of writing them compact")
+    parser.add_argument('--digits', type=int, default=4,
+                        help="round floats in the JSON outputs to this many decimals")
+    parser.add_argument('--no-precompress', action='store_true',
+                        help="skip the .json.gz/.json.br siblings")
+    parser.add_argument('--profile', choices=['cprofile', 'pyinstrument'],
+                        help="profile each stage and save the profiles under data/profiles/")
+    return parser
+
+
+def sketch_options(args):
+    """HeavyHitters parameters for --sketch, or None for exact counters"""
+    sketch = None
+    if args.sketch:
+        sketch = {'capacity': args.sketch_capacity, 'epsilon': args.sketch_epsilon,
+                  'delta': args.sketch_delta, 'precision': args.hll_precision}
+    return sketch
+
+
+def cube_options(args):
+    """Cube parameters for --cube, or None when the cube is not written"""
+    if not args.cube:
+        return None
+    if args.cube_top_conditions > args.cube_capacity:
+        raise SystemExit(f"--cube-top-conditions ({args.cube_top_conditions}) cannot exceed "
+                         f"--cube-capacity ({args.cube_capacity})")
+    return {'capacity': args.cube_capacity}
+
+
+def sample_options(args):
+    """StratifiedSample parameters for --sample-per-stratum, or None for the first rows"""
+    if args.sample_per_stratum <= 0:
+        return None
+    return {'per_stratum': args.sample_per_stratum, 'seed': args.sample_seed}
+
+
+# ============================================================
+# PROCESS ALL DATA
+# ============================================================
+
+def compute_aggregates(args, report, sketch=None, sample=None, cube=None):
+    """Load, extract and aggregate data/medical_questions.csv as the options ask"""
+    writer = None
+    if args.write_extracted:
+        from columnar_store import ExtractedWriter
+        writer = ExtractedWriter(args.write_extracted)
+
+    if args.from_extracted:
+        # Recompute every view from a previous run's extracted table
+        from columnar_store import aggregate_extracted
+        print(f"Loading extracted records from {args.from_extracted}...")
+        report.start_stage('aggregate_extracted')
+        aggregates = aggregate_extracted(args.from_extracted, aggregation=args.aggregation, cube=cube,
+                                         sketch=sketch, sample=sample)
+        report.end_stage(rows=aggregates.total)
+    elif args.stream:
+        # Chunks are extracted and folded into the aggregates as they are read
+        print(f"Streaming data/medical_questions.csv in chunks of {args.chunk_rows} rows...")
+        report.start_stage('load_extract_aggregate')
+        chunks = read_chunks("data/medical_questions.csv", args.chunk_rows)
+        aggregates = aggregate_chunks(chunks, args.workers, args.engine, cache_path=args.cache, writer=writer,
+                                      aggregation=args.aggregation, cube=cube, sketch=sketch,
+                                      sample=sample)
+        report.end_stage(rows=aggregates.total)
+    else:
+        # Load data
+        report.start_stage('load')
+        df = pd.read_csv("data/medical_questions.csv")
+        report.end_stage(rows=len(df))
+        print(f"Loaded {len(df)} rows")
+
+        print("Processing data...")
+
+        if args.workers > 1:
+            # Each worker extracts and aggregates a chunk; partials are merged in order
+            report.start_stage('extract_aggregate')
+            aggregates = run_sharded(df, args.workers, args.engine, args.chunk_rows, cache_path=args.cache, writer=writer,
+                                     aggregation=args.aggregation, cube=cube, sketch=sketch,
+                                     sample=sample)
+            report.end_stage(rows=aggregates.total)
+        else:
+            report.start_stage('extract')
+            columns = extract_chunk_columns(df, args.engine, args.cache)
+            report.end_stage(rows=len(columns))
+
+            if writer is not None:
+                report.start_stage('write_extracted')
+                writer.write_records(columns.records())
+                report.end_stage(rows=len(columns))
+
+            report.start_stage('aggregate')
+            # Every record is at hand, so cube cells are kept only for the symptoms that will be exported
+            aggregates = aggregate_partial(columns, args.aggregation, sketch=sketch, cube=cube, sample=sample,
+                                           top_symptoms=args.cube_top_symptoms)
+            report.end_stage(rows=aggregates.total)
+
+    if writer is not None:
+        writer.close()
+        print(f"Saved: {args.write_extracted} ({writer.rows} extracted records)")
+
+    print(f"Processed all {aggregates.total} rows")
+    return aggregates
+
+
+def main():
+    args = build_parser().parse_args()
+
+    report = RunReport('extracting_features1', profile=args.profile)
+    sketch = sketch_options(args)
+    sample = sample_options(args)
+    cube = cube_options(args)
+    aggregates = compute_aggregates(args, report, sketch, sample, cube)
+
+    # ============================================================
+    # GENERATE STATISTICS
+    # ============================================================
+
+    print("\nGenerating statistics...")
+
+    # 1. Demographics for Sunburst
+    report.start_stage('demographics')
+    sunburst_data = build_demographics(aggregates)
+
+    # 2. Body System Stats for Anatomy Visualization
+    report.start_stage('body_system_stats')
+    body_system_stats = build_body_system_stats(aggregates)
+
+    # 3. Sankey Data (Symptom -> Diagnosis, or Symptom -> Body System -> Diagnosis)
+    report.start_stage('sankey')
+    sankey_data = build_sankey(aggregates, args.sankey_top_k, args.sankey_min_count, args.sankey_levels)
+
+    # 4. Treemap Data (Specialty Hierarchy)
+    report.start_stage('treemap')
+    treemap_data = build_treemap(body_system_stats)
+    report.end_stage()
+
+    # ============================================================
+    # SAVE ALL JSON FILES
+    # ============================================================
+
+    print("\nSaving JSON files...")
+    report.start_stage('save_json')
+    exporter = JsonExporter(pretty=args.pretty, digits=args.digits, precompress=not args.no_precompress)
+
+    # Save processed data (sample for reference)
+    processed_sample = [record.to_dict() for record in aggregates.reference_records()]
+    exporter.write('data/processed_data.json', processed_sample)  # First 1000, or the stratified sample
+    print(f"Saved: data/processed_data.json (sample of {len(processed_sample)} records)")
+
+    # Save body system stats
+    exporter.write('data/body_system_stats.json', body_system_stats)
+    print("Saved: data/body_system_stats.json")
+
+    # Save demographics
+    exporter.write('data/demographics.json', sunburst_data)
+    print("Saved: data/demographics.json")
+
+    # Save sankey data
+    exporter.write('data/sankey_data.json', sankey_data)
+    print("Saved: data/sankey_data.json")
+
+    # Save treemap data
+    exporter.write('data/treemap_data.json', treemap_data)
+    print("Saved: data/treemap_data.json")
+
+    # Save drill-down cube slices
+    if aggregates.cube is not None:
+        index = write_cube(aggregates.cube, exporter, aggregates.total,
+                           top_symptoms=args.cube_top_symptoms, top_conditions=args.cube_top_conditions)
+        print(f"Saved: data/cube/ ({len(index['slices'])} body system slices)")
+    exporter.write_manifest()
+    report.end_stage()
+    report.write()
+
+    print_summary(aggregates, args, sketch)
+
+
+# ============================================================
+# PRINT SUMMARY STATISTICS
+# ============================================================
+
+def print_summary(aggregates, args, sketch=None):
+    print("\n" + "="*60)
+    print("EXTRACTION SUMMARY")
+    print("="*60)
+
+    total = aggregates.total
+
+    # Age extraction rate
+    ages_found = aggregates.ages_found
+    print(f"\nAge extracted: {ages_found} / {total} ({100*ages_found/total:.1f}%)")
+
+    # Gender extraction rate
+    genders_found = aggregates.genders_found
+    print(f"Gender extracted: {genders_found} / {total} ({100*genders_found/total:.1f}%)")
+
+    # Body system distribution
+    print(f"\nBody System Distribution:")
+    for system, count in decode(aggregates.primary_counts, ALL_SYSTEMS).most_common():
+        print(f"  {system}: {count} ({100*count/total:.1f}%)")
+
+    # Age group distribution
+    print(f"\nAge Group Distribution:")
+    for age, count in decode(aggregates.age_counts, AGE_GROUPS).most_common():
+        print(f"  {age}: {count} ({100*count/total:.1f}%)")
+
+    # Gender distribution
+    print(f"\nGender Distribution:")
+    for gender, count in decode(aggregates.gender_counts, GENDERS).most_common():
+        print(f"  {gender}: {count} ({100*count/total:.1f}%)")
+
+    # Sketch accuracy
+    if sketch is not None:
+        pairs = aggregates.pairs
+        worst = max([stats.conditions.error_bound() for stats in aggregates.systems.values()] + [pairs.error_bound()])
+        print(f"\nSketches (capacity {args.sketch_capacity}, epsilon {args.sketch_epsilon}, delta {args.sketch_delta}):")
+        print(f"  Distinct diagnoses: ~{distinct_answers(aggregates)}")
+        print(f"  Distinct symptom -> diagnosis pairs: ~{pairs.distinct()}")
+        print(f"  Largest possible overcount of a reported count: {worst}")
+
+    print("\n" + "="*60)
+    print("DATA PREPROCESSING COMPLETE!")
+    print("="*60)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Persistent per-row extraction cache keyed by row content and extractor version.
+
+Each extracted field (age, gender, body systems, ...) is stored separately,
+tagged with a version hash of the keyword table it was computed from. Editing
+one table therefore only invalidates that field; other fields keep hitting.
+"""
+
+import hashlib
+import json
+import sqlite3
+
+# Bump when extraction code changes in a way the keyword tables do not show
+EXTRACTOR_VERSION = 1
+
+
+def table_version(*tables):
+    """Version hash for a field computed from the given keyword tables"""
+    payload = json.dumps([EXTRACTOR_VERSION, *tables], sort_keys=True)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def row_hash(*columns):
+    """Content hash of one source row"""
+    payload = '\x1f'.join(columns)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class ExtractionCache:
+    """SQLite-backed store of extracted field values"""
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS extracted ('
+            'row_hash TEXT, field TEXT, version TEXT, value TEXT, '
+            'PRIMARY KEY (row_hash, field))'
+        )
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        self.conn.close()
+
+    def lookup(self, hashes, field, version, batch_size=500):
+        """Return {row_hash: json value} for rows cached at this field version"""
+        found = {}
+        unique = list(set(hashes))
+        for start in range(0, len(unique), batch_size):
+            batch = unique[start:start + batch_size]
+            rows = self.conn.execute(
+                f"SELECT row_hash, value FROM extracted WHERE field = ? AND version = ? "
+                f"AND row_hash IN ({','.join('?' * len(batch))})",
+                [field, version, *batch]
+            )
+            found.update(rows)
+        return found
+
+    def store(self, field, version, values):
+        """Store {row_hash: json value} for a field version, replacing older versions"""
+        with self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO extracted VALUES (?, ?, ?, ?)',
+                ((h, field, version, value) for h, value in values.items())
+            )
+
+    def extract(self, questions, answers, fields):
+        """Extract fields for aligned question/answer lists, computing only cache misses
+
+        fields maps a field name to (version, compute) where compute takes the
+        missing questions and answers and returns one JSON-serializable value per
+        row. Returns {field: [value per row]}; cached and fresh values both come
+        back through JSON, so their types always match.
+        """
+        hashes = [row_hash(q, a) for q, a in zip(questions, answers)]
+        results = {}
+        for field, (version, compute) in fields.items():
+            cached = self.lookup(hashes, field, version)
+            missing = [i for i, h in enumerate(hashes) if h not in cached]
+            self.hits += len(hashes) - len(missing)
+            self.misses += len(missing)
+            if missing:
+                values = compute([questions[i] for i in missing], [answers[i] for i in missing])
+                fresh = {hashes[i]: json.dumps(value) for i, value in zip(missing, values)}
+                self.store(field, version, fresh)
+                cached.update(fresh)
+            decoded = {}
+            results[field] = [
+                decoded[h] if h in decoded else decoded.setdefault(h, json.loads(cached[h]))
+                for h in hashes
+            ]
+        return results
@@ -0,0 +1,148 @@
+import re
+
+from taxonomy import keyword_matcher as compiled_keyword_matcher, load_taxonomy
+
+# ============================================================
+# EXTRACTION PATTERNS
+# ============================================================
+
+# Age extraction patterns
+age_patterns = [
+    r'(\d{1,3})[-\s]?year[-\s]?old',
+    r'(\d{1,3})[-\s]?month[-\s]?old',
+    r'(\d{1,3})[-\s]?week[-\s]?old',
+    r'(\d{1,3})[-\s]?day[-\s]?old',
+    r'aged?\s*(\d{1,3})',
+]
+
+# Gender patterns
+male_patterns = [r'\bmale\b', r'\bman\b', r'\bbox\b', r'\bhis\b', r'\bhe\b', r'\bfather\b', r'\bhusband\b']
+female_patterns = [r'\bfemale\b', r'\bwoman\b', r'\bgirl\b', r'\bher\b', r'\bshe\b', r'\bmother\b', r'\bpregnant\b', r'\bwife\b']
+
+# Body system keywords mapping and symptom keywords, from taxonomies/*.json
+body_systems = load_taxonomy('body_systems')['body_systems']
+symptom_keywords = load_taxonomy('symptoms')['symptoms']
+
+# Category values, in a fixed order so they can be stored as small codes
+AGE_GROUPS = [
+    'Infant (0-1)', 'Child (2-12)', 'Adolescent (13-19)', 'Young Adult (20-39)',
+    'Middle Age (40-59)', 'Senior (60-79)', 'Elderly (80+)', 'Unknown'
+]
+GENDERS = ['Male', 'Female', 'Unknown']
+ALL_SYSTEMS = list(body_systems.keys()) + ['General/Other']
+
+# ============================================================
+# KEYWORD MATCHER
+# ============================================================
+
+# One automaton covers both keyword tables, so a single pass over the text
+# finds every body system and symptom hit. It is compiled once per taxonomy
+# and unpickled from taxonomies/compiled/ after that. For symptoms alone,
+# 38 'in' scans of a question are slightly faster than the automaton's Python
+# loop (0.59 s against 0.63 s on 100k questions), so extract_symptoms keeps them.
+SYSTEM_NAMES = list(body_systems.keys())
+
+keyword_matcher = compiled_keyword_matcher()
+
+# Matcher label id -> position in SYSTEM_NAMES / symptom_keywords, -1 for the other table
+_label_system = [SYSTEM_NAMES.index(name) if kind == 'system' else -1 for kind, name in keyword_matcher.labels]
+_label_symptom = [symptom_keywords.index(name) if kind == 'symptom' else -1 for kind, name in keyword_matcher.labels]
+
+# ============================================================
+# EXTRACTION FUNCTIONS
+# ============================================================
+
+def extract_age(text):
+    """Extract age and return age group"""
+    text = text.lower()
+    
+    for pattern in age_patterns:
+        match = re.search(pattern, text)
+        if match:
+            age = int(match.group(1))
+            
+            # Handle month/week/day old (convert to 0)
+            if 'month' in pattern or 'week' in pattern or 'day' in pattern:
+                return 0, 'Infant (0-1)'
+            
+            # Age groups
+            if age <= 1:
+                return age, 'Infant (0-1)'
+            elif age <= 12:
+                return age, 'Child (2-12)'
+            elif age <= 19:
+                return age, 'Adolescent (13-19)'
+            elif age <= 39:
+                return age, 'Young Adult (20-39)'
+            elif age <= 59:
+                return age, 'Middle Age (40-59)'
+            elif age <= 79:
+                return age, 'Senior (60-79)'
+            else:
+                return age, 'Elderly (80+)'
+    
+    return None, 'Unknown'
+
+def extract_gender(text):
+    """Extract gender from text"""
+    text = text.lower()
+    
+    male_score = sum(1 for p in male_patterns if re.search(p, text))
+    female_score = sum(1 for p in female_patterns if re.search(p, text))
+    
+    if female_score > male_score:
+        return 'Female'
+    elif male_score > female_score:
+        return 'Male'
+    else:
+        return 'Unknown'
+
+def _systems_from_ids(found):
+    # Only the few ids found are decoded, in table order
+    codes = sorted(_label_system[i] for i in found if _label_system[i] >= 0)
+    return [SYSTEM_NAMES[code] for code in codes] if codes else ['General/Other']
+
+def _symptoms_from_ids(found):
+    return [symptom_keywords[code] for code in sorted(_label_symptom[i] for i in found if _label_symptom[i] >= 0)]
+
+def extract_body_systems(text):
+    """Extract body systems mentioned in text"""
+    return _systems_from_ids(keyword_matcher.find(text.lower()))
+
+def extract_symptoms(text):
+    """Extract symptoms from text"""
+    text = text.lower()
+    return [symptom for symptom in symptom_keywords if symptom in text]
+
+def keyword_ids(question, answer):
+    """Matcher label ids in question + " " + answer, and the ids inside the question alone, from one pass"""
+    question = question.lower()
+    question_ids, ids = keyword_matcher.find_split(question + " " + answer.lower(), len(question))
+    return ids, question_ids
+
+def extract_systems_and_symptoms(question, answer):
+    """Extract body systems from question + answer and symptoms from the question, in one pass"""
+    system_ids, symptom_ids = keyword_ids(question, answer)
+    return _systems_from_ids(system_ids), _symptoms_from_ids(symptom_ids)
+
+def make_record(idx, question, answer, age, age_group, gender, body_sys, symptoms):
+    """Assemble one processed_data record from extracted fields"""
+    return {
+        'id': idx,
+        'question': question[:200] + '...' if len(question) > 200 else question,  # Truncate for JSON size
+        'answer': answer,
+        'age': age,
+        'age_group': age_group,
+        'gender': gender,
+        'body_systems': body_sys,
+        'primary_system': body_sys[0] if body_sys else 'General/Other',
+        'symptoms': symptoms,
+        'question_length': len(question.split())
+    }
+
+def extract_record(idx, question, answer):
+    """Build one processed_data record"""
+    age, age_group = extract_age(question)
+    gender = extract_gender(question)
+    body_sys, symptoms = extract_systems_and_symptoms(question, answer)
+    return make_record(idx, question, answer, age, age_group, gender, body_sys, symptoms)
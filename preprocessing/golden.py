@@ -0,0 +1,631 @@
+"""Golden-output harness: the baseline scripts and every accelerated implementation on a frozen corpus.
+
+The reference is the code before any optimization: extracting_features1.py
+and extracted_features2.py at BASELINE_COMMIT, read from the git history.
+Two kinds of comparison run on preprocessing/fixtures/medical_questions_sample.csv
+(or --corpus):
+
+- per-record extraction: the baseline's own extract_* functions and
+  regexes against every faster implementation of the same field, reporting
+  the rows that differ and the speed ratio
+- output files: the baseline scripts and the current scripts, with the
+  rows/counters configuration and with each accelerated one (matrix
+  aggregation, columnar engine, workers, streaming, extraction cache,
+  extracted file, sketches, ...), are run as subprocesses. Every data/*.json
+  file the baseline writes is diffed field by field against the baseline's
+  copy, and every file is also diffed exactly against the current
+  rows/counters run, which is the only reference for files the baseline
+  never wrote (cube/)
+
+The baseline's files are frozen in preprocessing/fixtures/golden/baseline/ and
+the current rows/counters run's cube/ files in fixtures/golden/new/, so a
+change in the environment or in the cube shows up too; --update rewrites
+them. An engine is safe to make the default when its row says
+'equivalent'. The exit status is 1 on any mismatch.
+
+Usage (from the repo root):
+    python preprocessing/golden.py [--only columnar workers] [--report golden_report.json]
+    python preprocessing/golden.py --update
+"""
+
+import argparse
+import ast
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+import pyarrow as pa
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIXTURE = os.path.join(HERE, 'fixtures', 'medical_questions_sample.csv')
+GOLDEN_DIR = os.path.join(HERE, 'fixtures', 'golden')
+BASELINE_COMMIT = 'cdce9de'
+QUESTION_COL = 'Open-ended Verifiable Question'
+ANSWER_COL = 'Ground-True Answer'
+
+# Files that describe a run rather than the data
+SKIPPED_FILES = re.compile(r'^(run_report_.*|manifest)\.json$')
+MAX_DIFFS = 10
+
+
+# ============================================================
+# FIELD-BY-FIELD DIFF
+# ============================================================
+
+def diff_json(expected, actual, path=''):
+    """Yield 'path: expected != actual' for every differing field, including key order"""
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        for key in expected:
+            if key not in actual:
+                yield f"{path}.{key}: missing"
+            else:
+                yield from diff_json(expected[key], actual[key], f"{path}.{key}")
+        for key in actual:
+            if key not in expected:
+                yield f"{path}.{key}: unexpected"
+        if list(expected) != list(actual) and set(expected) == set(actual):
+            yield f"{path or '.'}: key order {list(expected)[:5]}... != {list(actual)[:5]}..."
+    elif isinstance(expected, list) and isinstance(actual, list):
+        for i, (e, a) in enumerate(zip(expected, actual)):
+            yield from diff_json(e, a, f"{path}[{i}]")
+        if len(expected) != len(actual):
+            yield f"{path}: length {len(expected)} != {len(actual)}"
+    elif type(expected) is not type(actual) or expected != actual:
+        yield f"{path}: {expected!r} != {actual!r}"
+
+
+def load_outputs(data_dir):
+    """Relative path -> parsed JSON for every output file under a data directory"""
+    outputs = {}
+    for root, dirs, files in os.walk(data_dir):
+        dirs[:] = [d for d in dirs if not d.startswith('.') and d not in ('profiles', 'snapshots')]
+        for name in files:
+            if name.endswith('.json') and not SKIPPED_FILES.match(name):
+                path = os.path.join(root, name)
+                with open(path, encoding='utf-8') as f:
+                    outputs[os.path.relpath(path, data_dir)] = json.load(f)
+    return outputs
+
+
+def diff_outputs(expected, actual, ignore=()):
+    """{file: [differences]} for every file that differs, is missing or is unexpected"""
+    diffs = {}
+    for name in sorted(set(expected) | set(actual)):
+        if name.startswith(tuple(ignore)):
+            continue
+        if name not in actual:
+            diffs[name] = ['file missing']
+        elif name not in expected:
+            diffs[name] = ['unexpected file']
+        else:
+            found = list(diff_json(expected[name], actual[name]))
+            if found:
+                diffs[name] = found
+    return diffs
+
+
+# ============================================================
+# BASELINE
+# ============================================================
+
+# Intended output changes since the baseline, applied to its source before it runs
+BASELINE_PATCHES = {
+    'extracted_features2.py': [
+        # medical_network.json is built from every record, not the first 1000
+        ('for _, row in df.head(1000).iterrows():', 'for _, row in df.iterrows():'),
+    ],
+}
+
+# Runs a baseline script in the current directory; extracted_features2.py
+# downloads its split with datasets.load_dataset, which is served the snapshot
+BASELINE_RUNNER = """
+import runpy, sys, types
+import pyarrow as pa
+
+def load_dataset(*args, **kwargs):
+    with pa.memory_map(sys.argv[1]) as source:
+        return {'train': pa.ipc.open_file(source).read_all().to_pandas()}
+
+sys.modules['datasets'] = types.SimpleNamespace(load_dataset=load_dataset)
+runpy.run_path(sys.argv[2], run_name='__main__')
+"""
+
+
+def baseline_source(script):
+    """A preprocessing script's source at BASELINE_COMMIT, with BASELINE_PATCHES applied"""
+    try:
+        source = subprocess.check_output(
+            ['git', 'show', f'{BASELINE_COMMIT}:preprocessing/{script}'], cwd=HERE, stderr=subprocess.DEVNULL
+        ).decode('utf-8')
+    except (OSError, subprocess.CalledProcessError):
+        raise SystemExit(f"golden.py needs the git history: cannot read {script} at {BASELINE_COMMIT}")
+    for old, new in BASELINE_PATCHES.get(script, ()):
+        if old not in source:
+            raise SystemExit(f"Baseline patch for {script} no longer applies: {old!r}")
+        source = source.replace(old, new)
+    return source
+
+
+def baseline_definitions(script, names):
+    """The baseline script's imports, functions and the named tables, without running its body"""
+    tree = ast.parse(baseline_source(script))
+    body = [
+        node for node in tree.body
+        if isinstance(node, ast.FunctionDef)
+        or isinstance(node, ast.Import) and all(alias.name != 'datasets' for alias in node.names)
+        or isinstance(node, ast.ImportFrom) and node.module != 'datasets'
+        or isinstance(node, ast.Assign) and any(getattr(t, 'id', None) in names for t in node.targets)
+    ]
+    namespace = {}
+    exec(compile(ast.Module(body, type_ignores=[]), f'{BASELINE_COMMIT}:{script}', 'exec'), namespace)
+    return namespace
+
+
+def canonical_sankey(data):
+    """Nodes as a set and links by node name: the baseline ordered nodes by set() iteration"""
+    names = [(node['type'], node['name']) for node in data['nodes']]
+    return {
+        'nodes': sorted(names),
+        'links': [[names[link['source']], names[link['target']], link['value']] for link in data['links']],
+    }
+
+
+def canonical_network(data):
+    """Nodes by id and links as a set of (source, target): the baseline kept links in a set, untyped and unweighted"""
+    return {
+        'nodes': sorted(data['nodes'], key=lambda node: node['id']),
+        'links': sorted([link['source'], link['target']] for link in data['links']),
+    }
+
+
+# Files whose baseline form leaves an order unspecified, or that gained fields since
+BASELINE_CANONICAL = {
+    'sankey_data.json': canonical_sankey,
+    'medical_network.json': canonical_network,
+}
+
+
+def baseline_view(outputs, names):
+    """The given files of a run, in the form they are compared with the baseline in"""
+    return {name: BASELINE_CANONICAL.get(name, lambda data: data)(outputs[name]) for name in names if name in outputs}
+
+
+# ============================================================
+# PER-RECORD EXTRACTION
+# ============================================================
+
+def extraction_checks(questions, answers):
+    """(field, reference, {implementation: run}); each run() returns one value per row"""
+    import extractors
+    import reference
+    import vectorized
+    from demographics import (
+        BINARY_FEMALE_PATTERN, BINARY_MALE_PATTERN, PEDIATRIC_AGE_PATTERN, extract_demographics
+    )
+    from extracted_features2 import disease_map, question_registry
+    from records import extract_record
+
+    base1 = baseline_definitions(
+        'extracting_features1.py', {'age_patterns', 'male_patterns', 'female_patterns', 'body_systems', 'symptom_keywords'}
+    )
+    base2 = baseline_definitions(
+        'extracted_features2.py', {'age_pattern', 'male_pattern', 'female_pattern', 'disease_map'}
+    )
+
+    def baseline_record(idx, question, answer):
+        # The body of the baseline's processing loop
+        age, age_group = base1['extract_age'](question)
+        body_sys = base1['extract_body_systems'](question + " " + answer)
+        return {
+            'id': idx,
+            'question': question[:200] + '...' if len(question) > 200 else question,
+            'answer': answer,
+            'age': age,
+            'age_group': age_group,
+            'gender': base1['extract_gender'](question),
+            'body_systems': body_sys,
+            'primary_system': body_sys[0] if body_sys else 'General/Other',
+            'symptoms': base1['extract_symptoms'](question),
+            'question_length': len(question.split())
+        }
+
+    def baseline_pediatric_age_group(q):
+        age_match = re.search(base2['age_pattern'], q, re.I)
+        if not age_match:
+            return None
+        age = int(age_match.group(1) or age_match.group(2))
+        return (
+            'Pediatric (0-18)' if age <= 18 else
+            'Young Adult (19-40)' if age <= 40 else
+            'Adult (41-65)' if age <= 65 else
+            'Senior (65+)'
+        )
+
+    def baseline_binary_gender(q):
+        return (
+            'Male' if re.search(base2['male_pattern'], q, re.I) else
+            'Female' if re.search(base2['female_pattern'], q, re.I) else None
+        )
+
+    texts = [q + " " + a for q, a in zip(questions, answers)]
+    q_series = pd.Series(questions, dtype=object)
+    lower_q = q_series.str.lower()
+    lower_text = pd.Series(texts, dtype=object).str.lower()
+    pediatric_regex = re.compile(PEDIATRIC_AGE_PATTERN, re.I)
+    male_regex = re.compile(BINARY_MALE_PATTERN, re.I)
+    female_regex = re.compile(BINARY_FEMALE_PATTERN, re.I)
+
+    def none_for_nan(series):
+        return series.where(series.notna(), None).tolist()
+
+    return [
+        ('body_systems', lambda: [base1['extract_body_systems'](t) for t in texts], {
+            'keyword_scan': lambda: [reference.extract_body_systems(t) for t in texts],
+            'keyword_matcher': lambda: [extractors.extract_body_systems(t) for t in texts],
+            'systems_and_symptoms': lambda: [extractors.extract_systems_and_symptoms(q, a)[0]
+                                             for q, a in zip(questions, answers)],
+            'vectorized': lambda: vectorized.extract_body_systems(lower_text),
+        }),
+        ('symptoms', lambda: [base1['extract_symptoms'](q) for q in questions], {
+            'keyword_scan': lambda: [reference.extract_symptoms(q) for q in questions],
+            'keyword_matcher': lambda: [extractors.extract_symptoms(q) for q in questions],
+            'systems_and_symptoms': lambda: [extractors.extract_systems_and_symptoms(q, a)[1]
+                                             for q, a in zip(questions, answers)],
+            'vectorized': lambda: vectorized.extract_symptoms(lower_q),
+        }),
+        ('age', lambda: [base1['extract_age'](q) for q in questions], {
+            'extract_age': lambda: [extractors.extract_age(q) for q in questions],
+            'demographics': lambda: [(d.age, d.age_group) for d in map(extract_demographics, questions)],
+            'vectorized': lambda: list(zip(*vectorized.extract_ages(lower_q))),
+        }),
+        ('gender', lambda: [base1['extract_gender'](q) for q in questions], {
+            'extract_gender': lambda: [extractors.extract_gender(q) for q in questions],
+            'demographics': lambda: [extract_demographics(q).gender for q in questions],
+            'vectorized': lambda: vectorized.extract_genders(lower_q).tolist(),
+        }),
+        ('pediatric_age_group', lambda: [baseline_pediatric_age_group(q) for q in questions], {
+            'demographics': lambda: [extract_demographics(q).pediatric_age_group for q in questions],
+            'vectorized': lambda: none_for_nan(vectorized.pediatric_age_groups(q_series, pediatric_regex)),
+        }),
+        ('binary_gender', lambda: [baseline_binary_gender(q) for q in questions], {
+            'demographics': lambda: [extract_demographics(q).binary_gender for q in questions],
+            'vectorized': lambda: none_for_nan(vectorized.binary_genders(q_series, male_regex, female_regex)),
+        }),
+        ('disease_categories',
+         lambda: [[name for name, pattern in base2['disease_map'].items() if re.search(pattern, q, re.I)]
+                  for q in questions], {
+             'pattern_registry': lambda: [[name for name, hit in zip(disease_map, row) if hit]
+                                          for row in vectorized.disease_flags(q_series, question_registry).to_numpy()],
+         }),
+        ('record', lambda: [baseline_record(i, q, a) for i, (q, a) in enumerate(zip(questions, answers))], {
+            'make_record': lambda: [extractors.extract_record(i, q, a) for i, (q, a) in enumerate(zip(questions, answers))],
+            'compact_record': lambda: [extract_record(i, q, a).to_dict()
+                                       for i, (q, a) in enumerate(zip(questions, answers))],
+            'vectorized': lambda: [r.to_dict() for r in vectorized.extract_records(q_series, pd.Series(answers, dtype=object))],
+        }),
+    ]
+
+
+def timed(run):
+    start = time.perf_counter()
+    values = run()
+    return values, time.perf_counter() - start
+
+
+def compare_extraction(questions, answers):
+    """One result per (field, implementation): mismatching rows and speed against the reference"""
+    results = []
+    for field, reference, candidates in extraction_checks(questions, answers):
+        expected, reference_seconds = timed(reference)
+        for name, run in candidates.items():
+            actual, seconds = timed(run)
+            mismatches = [
+                {'row': i, 'question': questions[i][:80], 'expected': e, 'actual': a}
+                for i, (e, a) in enumerate(zip(expected, actual)) if e != a
+            ]
+            if len(actual) != len(expected):
+                mismatches.append({'row': None, 'expected': f"{len(expected)} rows", 'actual': f"{len(actual)} rows"})
+            results.append({
+                'field': field, 'implementation': name, 'rows': len(expected), 'mismatches': mismatches,
+                'reference_seconds': round(reference_seconds, 4), 'seconds': round(seconds, 4),
+                'speedup': round(reference_seconds / seconds, 2) if seconds > 0 else None,
+            })
+    return results
+
+
+# ============================================================
+# OUTPUT FILES
+# ============================================================
+
+# name -> (script, options, files left out of the comparison); '{tmp}' is the shared scratch directory.
+# Configurations run in this order, so later ones can reuse what earlier ones wrote. REFERENCE is the
+# current script's slowest configuration and the reference for files the baseline does not write.
+REFERENCE = ('extracting_features1.py', ['--cube', '--engine', 'rows', '--aggregation', 'counters'], ())
+CONFIGURATIONS = {
+    'matrix': ('extracting_features1.py', ['--cube', '--aggregation', 'matrix'], ()),
+    'columnar': ('extracting_features1.py', ['--cube', '--engine', 'columnar'], ()),
+    # Merged cube cells are summaries of capacity conditions, so chunked runs match exactly only with
+    # room for every condition; at the default capacity their cube/ files are checked against the bounds
+    'workers': ('extracting_features1.py',
+                ['--cube', '--cube-capacity', '1000000', '--workers', '2', '--chunk-rows', '97'], ()),
+    'stream': ('extracting_features1.py',
+               ['--cube', '--cube-capacity', '1000000', '--stream', '--chunk-rows', '89'], ()),
+    'workers_capped': ('extracting_features1.py', ['--cube', '--workers', '2', '--chunk-rows', '97'], ('cube/',)),
+    'stream_capped': ('extracting_features1.py', ['--cube', '--stream', '--chunk-rows', '89'], ('cube/',)),
+    'cache_cold': ('extracting_features1.py', ['--cube', '--cache', '{tmp}/features1.sqlite'], ()),
+    'cache_warm': ('extracting_features1.py', ['--cube', '--cache', '{tmp}/features1.sqlite'], ()),
+    'write_extracted': ('extracting_features1.py', ['--cube', '--write-extracted', '{tmp}/extracted.arrow'], ()),
+    'from_extracted': ('extracting_features1.py', ['--cube', '--from-extracted', '{tmp}/extracted.arrow'], ()),
+    'from_extracted_counters': ('extracting_features1.py',
+                                ['--cube', '--from-extracted', '{tmp}/extracted.arrow', '--aggregation', 'counters'], ()),
+    # Exact while every counter has fewer distinct keys than the capacity
+    'sketch': ('extracting_features1.py', ['--cube', '--sketch', '--sketch-capacity', '1000000'], ()),
+}
+# Configurations whose cube/ files are held to the error bounds instead of diffed exactly
+BOUNDED_CUBE = ('workers_capped', 'stream_capped')
+REFERENCE2 = ('extracted_features2.py', [], ())
+CONFIGURATIONS2 = {
+    'batches': ('extracted_features2.py', ['--batch-size', '97'], ()),
+    'cache_cold2': ('extracted_features2.py', ['--cache', '{tmp}/features2.sqlite'], ()),
+    'cache_warm2': ('extracted_features2.py', ['--cache', '{tmp}/features2.sqlite'], ()),
+}
+
+
+def prepare_workdir(path, corpus):
+    """A scratch repo root whose data/medical_questions.csv is the corpus"""
+    os.makedirs(os.path.join(path, 'data'), exist_ok=True)
+    shutil.copyfile(corpus, os.path.join(path, 'data', 'medical_questions.csv'))
+
+
+def run_configuration(script, options, workdir, tmp, snapshot):
+    """Run one script in workdir; returns (seconds, outputs)"""
+    options = [option.replace('{tmp}', tmp) for option in options]
+    if script == 'extracted_features2.py':
+        options = ['--snapshot', snapshot] + options
+    command = [sys.executable, os.path.join(HERE, script), '--no-precompress'] + options
+    env = dict(os.environ, PYTHONHASHSEED='0')
+    start = time.perf_counter()
+    result = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True)
+    seconds = time.perf_counter() - start
+    if result.returncode:
+        raise SystemExit(f"{' '.join(command)} failed:\n{result.stdout[-2000:]}\n{result.stderr[-2000:]}")
+    return seconds, load_outputs(os.path.join(workdir, 'data'))
+
+
+def write_snapshot(corpus, path):
+    """The corpus as a medical-o1 style Question/Response snapshot for extracted_features2.py"""
+    from dataset_source import SCHEMA
+    df = pd.read_csv(corpus, keep_default_na=False)
+    table = pa.table({'Question': df[QUESTION_COL].astype(str), 'Response': df[ANSWER_COL].astype(str)},
+                     schema=SCHEMA)
+    with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, SCHEMA) as writer:
+        writer.write_table(table)
+
+
+def run_baseline(script, workdir, snapshot):
+    """Run the baseline version of a script in workdir; returns (seconds, outputs)"""
+    path = os.path.join(workdir, 'baseline_' + script)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(baseline_source(script))
+    command = [sys.executable, '-c', BASELINE_RUNNER, snapshot, path]
+    env = dict(os.environ, PYTHONHASHSEED='0', PYTHONIOENCODING='utf-8')
+    start = time.perf_counter()
+    result = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True)
+    seconds = time.perf_counter() - start
+    if result.returncode:
+        raise SystemExit(f"baseline {script} failed:\n{result.stdout[-2000:]}\n{result.stderr[-2000:]}")
+    return seconds, load_outputs(os.path.join(workdir, 'data'))
+
+
+def exact_conditions(corpus):
+    """(cell, condition) -> count over the whole corpus, from one cube chunk, which is never evicted"""
+    from cube import Cube
+    from sharding import extract_chunk_columns
+    cube = Cube.from_columns(extract_chunk_columns(pd.read_csv(corpus), 'rows'))
+    names = cube.condition_names[cube.condition_codes]
+    return dict(zip(zip(cube.condition_cells.tolist(), names.tolist()), cube.condition_counts.tolist()))
+
+
+def without_conditions(data):
+    """A cube slice with only the exact cell counts"""
+    if isinstance(data, dict):
+        return {key: without_conditions(value) for key, value in data.items()
+                if key not in ('top_conditions', 'error_bound')}
+    return data
+
+
+def cube_bound_diffs(exact, expected, actual):
+    """{file: [differences]} where a capped cube breaks its bounds
+
+    Cell counts must equal the reference's. A listed count must be at most
+    error_bound below the exact count, error_bound at most count / (capacity + 1),
+    and a cell listing fewer than top_conditions must list every condition
+    counted more than error_bound times.
+    """
+    from cube import ALL, DEFAULT_CAPACITY, cell_code
+    from extractors import AGE_GROUPS, ALL_SYSTEMS, GENDERS, symptom_keywords
+
+    def code(name, names):
+        return len(names) if name == ALL else names.index(name)
+
+    cubes = lambda outputs: {name: data for name, data in outputs.items() if name.startswith('cube/')}
+    diffs = diff_outputs({name: without_conditions(data) for name, data in cubes(expected).items()},
+                         {name: without_conditions(data) for name, data in cubes(actual).items()})
+    listed = actual.get('cube/index.json', {}).get('top_conditions', 0)
+    for name, data in cubes(actual).items():
+        if name == 'cube/index.json':
+            continue
+        system = ALL_SYSTEMS.index(data['body_system'])
+        found = []
+        for age, genders in data['cells'].items():
+            for gender, symptoms in genders.items():
+                for symptom, cell in symptoms.items():
+                    path = f".cells.{age}.{gender}.{symptom}"
+                    key = cell_code(code(age, AGE_GROUPS), code(gender, GENDERS), system,
+                                    code(symptom, symptom_keywords))
+                    bound = cell.get('error_bound', 0)
+                    if bound > cell['count'] // (DEFAULT_CAPACITY + 1):
+                        found.append(f"{path}: error_bound {bound} above count / {DEFAULT_CAPACITY + 1}")
+                    shown = {c['name'] for c in cell['top_conditions']}
+                    for c in cell['top_conditions']:
+                        true = exact.get((key, c['name']), 0)
+                        if not true - bound <= c['count'] <= true:
+                            found.append(f"{path}: {c['name']!r} listed {c['count']}, exact {true}, bound {bound}")
+                    if len(shown) < listed:
+                        missing = sorted(n for (k, n), true in exact.items() if k == key and true > bound
+                                         and n not in shown)
+                        if missing:
+                            found.append(f"{path}: {missing[:3]} counted over error_bound {bound} but not listed")
+        if found:
+            diffs.setdefault(name, []).extend(found)
+    return diffs
+
+
+def compare_outputs(corpus, only=None, keep=None):
+    """Baseline and reference comparison of every configuration's output files
+
+    Returns the results, the baseline's outputs and the reference run's outputs.
+    """
+    tmp = keep or tempfile.mkdtemp(prefix='golden-')
+    os.makedirs(tmp, exist_ok=True)
+    snapshot = os.path.join(tmp, 'medical-o1-sample.arrow')
+    write_snapshot(corpus, snapshot)
+    results = []
+    baselines = {}
+    references = {}
+    try:
+        for reference, configurations in ((REFERENCE, CONFIGURATIONS), (REFERENCE2, CONFIGURATIONS2)):
+            script = reference[0]
+            workdir = os.path.join(tmp, 'baseline-' + script.split('.')[0])
+            prepare_workdir(workdir, corpus)
+            baseline_seconds, baseline = run_baseline(script, workdir, snapshot)
+            baselines.update(baseline)
+            expected = None
+            for name, (script, options, ignore) in [('reference', reference)] + list(configurations.items()):
+                if only and name not in only and name != 'reference':
+                    continue
+                workdir = os.path.join(tmp, name + '-' + script.split('.')[0])
+                prepare_workdir(workdir, corpus)
+                seconds, actual = run_configuration(script, options, workdir, tmp, snapshot)
+                if expected is None:
+                    expected = actual
+                    references.update(actual)
+                diffs = diff_outputs(expected, actual, ignore)
+                if name in BOUNDED_CUBE:
+                    diffs.update(cube_bound_diffs(exact_conditions(corpus), expected, actual))
+                results.append({
+                    'configuration': name, 'script': script, 'options': options, 'files': len(actual),
+                    'baseline_diffs': diff_outputs(baseline_view(baseline, baseline), baseline_view(actual, baseline),
+                                                   ignore),
+                    'diffs': diffs,
+                    'baseline_seconds': round(baseline_seconds, 4), 'seconds': round(seconds, 4),
+                    'speedup': round(baseline_seconds / seconds, 2) if seconds > 0 else None,
+                })
+    finally:
+        if keep is None:
+            shutil.rmtree(tmp, ignore_errors=True)
+    return results, baselines, references
+
+
+def write_golden(outputs, directory=GOLDEN_DIR):
+    shutil.rmtree(directory, ignore_errors=True)
+    for name, data in outputs.items():
+        path = os.path.join(directory, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=1, ensure_ascii=False)
+            f.write('\n')
+
+
+# ============================================================
+# REPORT
+# ============================================================
+
+def print_extraction(results):
+    print(f"\nPer-record extraction ({results[0]['rows'] if results else 0} rows, reference = baseline {BASELINE_COMMIT})")
+    for r in results:
+        status = 'equivalent' if not r['mismatches'] else f"{len(r['mismatches'])} rows differ"
+        print(f"  {r['field']:<20} {r['implementation']:<22} {status:<16} {r['speedup']}x")
+        for m in r['mismatches'][:MAX_DIFFS]:
+            print(f"      row {m['row']}: {m['expected']!r} != {m['actual']!r}")
+
+
+def print_diffs(diffs):
+    for name, found in diffs.items():
+        for line in found[:MAX_DIFFS]:
+            print(f"      {name}{line if line.startswith(('.', '[')) else ': ' + line}")
+
+
+def print_outputs(results):
+    print(f"\nOutput files (baseline = {BASELINE_COMMIT}; reference = rows engine, counters aggregation, "
+          f"default extracted_features2; speed against the baseline)")
+    for r in results:
+        statuses = [
+            f"{label}: " + ('equivalent' if not diffs else f"{len(diffs)} files differ")
+            for label, diffs in (('baseline', r['baseline_diffs']), ('reference', r['diffs']))
+        ]
+        print(f"  {r['configuration']:<24} {r['files']:>3} files  {statuses[0]:<26} {statuses[1]:<27} {r['speedup']}x")
+        print_diffs({'baseline ' + name: found for name, found in r['baseline_diffs'].items()})
+        print_diffs({'reference ' + name: found for name, found in r['diffs'].items()})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare reference and accelerated implementations on a frozen corpus")
+    parser.add_argument('--corpus', default=FIXTURE,
+                        help="CSV with the medical_questions.csv columns (default: the frozen fixture)")
+    parser.add_argument('--only', nargs='+', metavar='NAME', choices=list(CONFIGURATIONS) + list(CONFIGURATIONS2),
+                        help="output-file configurations to run (default: all)")
+    parser.add_argument('--skip-outputs', action='store_true', help="only compare per-record extraction")
+    parser.add_argument('--update', action='store_true',
+                        help="rewrite fixtures/golden/ from the baseline and reference runs instead of comparing with it")
+    parser.add_argument('--keep', metavar='DIR', help="keep every configuration's outputs in DIR")
+    parser.add_argument('--report', metavar='PATH', help="also write the results as JSON")
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.corpus)
+    # The same str() conversion the extraction engines apply to CSV cells
+    questions = [str(q) for q in df[QUESTION_COL]]
+    answers = [str(a) for a in df[ANSWER_COL]]
+
+    extraction = compare_extraction(questions, answers)
+    print_extraction(extraction)
+    failed = any(r['mismatches'] for r in extraction)
+
+    outputs, golden = [], {}
+    if not args.skip_outputs:
+        outputs, baseline, reference = compare_outputs(args.corpus, args.only, args.keep)
+        print_outputs(outputs)
+        failed = failed or any(r['baseline_diffs'] or r['diffs'] for r in outputs)
+        # Files the baseline never wrote are frozen from the reference run
+        new_outputs = {name: data for name, data in reference.items() if name not in baseline}
+        if args.update:
+            write_golden(baseline, os.path.join(GOLDEN_DIR, 'baseline'))
+            write_golden(new_outputs, os.path.join(GOLDEN_DIR, 'new'))
+            print(f"\nWrote {len(baseline)} baseline and {len(new_outputs)} new golden files to {GOLDEN_DIR}")
+        elif args.corpus != FIXTURE:
+            print("\nGolden files: skipped, they belong to the frozen fixture")
+        else:
+            golden = {
+                f"{kind}/{name}": found
+                for kind, outputs_of_kind in (('baseline', baseline), ('new', new_outputs))
+                for name, found in diff_outputs(load_outputs(os.path.join(GOLDEN_DIR, kind)), outputs_of_kind).items()
+            }
+            print(f"\nGolden files: {'baseline and new outputs unchanged' if not golden else f'{len(golden)} files differ'}")
+            print_diffs(golden)
+            failed = failed or bool(golden)
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump({'extraction': extraction, 'outputs': outputs, 'golden': golden}, f, indent=2, default=str)
+        print(f"Saved: {args.report}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
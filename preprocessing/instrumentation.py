@@ -0,0 +1,154 @@
+"""Stage timers, memory snapshots and optional profiling for preprocessing runs.
+
+A RunReport collects one entry per stage (seconds, rows, rows/sec, current
+RSS, the stage's own RSS high-water mark and the process's) and is written as
+JSON next to the data/*.json outputs. With
+profile='cprofile' or 'pyinstrument' each stage is also profiled and the
+profile is saved beside the report.
+"""
+
+import datetime
+import json
+import os
+import resource
+import sys
+import time
+
+
+# Process high-water mark from before the last reset_peak_rss(), which also resets ru_maxrss
+_process_peak_mb = 0.0
+
+
+def peak_rss_mb():
+    """High-water mark of this process's resident set size since it started, in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+    # VmHWM can run slightly ahead of ru_maxrss, which reads the RSS counters separately
+    return max(peak, _process_peak_mb, stage_peak_rss_mb() or 0)
+
+
+def reset_peak_rss():
+    """Start a new RSS high-water mark for stage_peak_rss_mb(); False where the kernel does not allow it"""
+    global _process_peak_mb
+    _process_peak_mb = peak_rss_mb()
+    try:
+        # Linux 4.0+: writing 5 to clear_refs resets VmHWM to the current RSS
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        return False
+    return True
+
+
+def stage_peak_rss_mb():
+    """RSS high-water mark since the last reset_peak_rss(), in MB, where /proc is available"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def current_rss_mb():
+    """Current resident set size in MB, where /proc is available"""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return round(pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024), 1)
+
+
+class RunReport:
+    """Structured timing report for one script run"""
+
+    def __init__(self, script, output_dir='data', profile=None, stage_peaks=True):
+        if profile not in (None, 'cprofile', 'pyinstrument'):
+            raise ValueError(f"Unknown profiler {profile!r}")
+        self.script = script
+        self.output_dir = output_dir
+        self.profile = profile
+        # The high-water mark is per process, so stages running alongside others skip it
+        self.stage_peaks = stage_peaks
+        self.started = time.perf_counter()
+        self.started_at = datetime.datetime.now(datetime.timezone.utc)
+        self.stages = []
+        self._current = None
+        self._profiler = None
+
+    def start_stage(self, name):
+        if self._current is not None:
+            self.end_stage()
+        self._current = {'stage': name, 'start': time.perf_counter(), 'start_rss': current_rss_mb(),
+                         'reset': self.stage_peaks and reset_peak_rss()}
+        if self.profile == 'cprofile':
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        elif self.profile == 'pyinstrument':
+            try:
+                from pyinstrument import Profiler
+            except ImportError:
+                raise SystemExit("--profile pyinstrument requires the pyinstrument package")
+            self._profiler = Profiler()
+            self._profiler.start()
+
+    def end_stage(self, rows=None):
+        stage = self._current
+        seconds = time.perf_counter() - stage.pop('start')
+        start_rss = stage.pop('start_rss')
+        reset = stage.pop('reset')
+        self._current = None
+        if self._profiler is not None:
+            self._save_profile(stage['stage'])
+        rss = current_rss_mb()
+        stage.update({
+            'seconds': round(seconds, 4),
+            'rows': rows,
+            'rows_per_sec': round(rows / seconds, 1) if rows and seconds > 0 else None,
+            'rss_mb': rss,
+            'rss_delta_mb': round(rss - start_rss, 1) if rss is not None and start_rss is not None else None,
+            # Highest RSS while this stage ran; None where the high-water mark cannot be reset
+            'stage_peak_rss_mb': stage_peak_rss_mb() if reset else None,
+            'process_peak_rss_mb': peak_rss_mb(),
+        })
+        self.stages.append(stage)
+        return stage
+
+    def _save_profile(self, stage_name):
+        profile_dir = os.path.join(self.output_dir, 'profiles')
+        os.makedirs(profile_dir, exist_ok=True)
+        base = os.path.join(profile_dir, f"{self.script}.{stage_name}")
+        if self.profile == 'cprofile':
+            self._profiler.disable()
+            self._profiler.dump_stats(base + '.prof')
+        else:
+            self._profiler.stop()
+            with open(base + '.txt', 'w') as f:
+                f.write(self._profiler.output_text())
+        self._profiler = None
+
+    def to_dict(self):
+        return {
+            'script': self.script,
+            'started_at': self.started_at.isoformat(timespec='seconds'),
+            'total_seconds': round(time.perf_counter() - self.started, 4),
+            'argv': sys.argv[1:],
+            'python': sys.version.split()[0],
+            'profile': self.profile,
+            'stages': self.stages,
+        }
+
+    def write(self, path=None):
+        """Write the report as JSON; defaults to <output_dir>/run_report_<script>.json"""
+        if self._current is not None:
+            self.end_stage()
+        path = path or os.path.join(self.output_dir, f"run_report_{self.script}.json")
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        print(f"Saved: {path}")
+        return path
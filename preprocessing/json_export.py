@@ -0,0 +1,120 @@
+"""Compact, precompressed and atomic JSON export for the dashboard data files.
+
+Each file is written with compact separators and rounded floats, together
+with a .json.gz sibling and, when the brotli package is installed, a .json.br
+sibling. Files are written to a temporary name and renamed into place, so the
+dashboard never fetches a half-written file. data/manifest.json records the
+content hash and sizes of every exported file for cache-busting.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MANIFEST_PATH = 'data/manifest.json'
+
+# mkstemp creates 0600 files; exported files get the usual umask-based mode
+_umask = os.umask(0)
+os.umask(_umask)
+FILE_MODE = 0o666 & ~_umask
+
+
+def round_floats(value, digits=4):
+    """Round every float in a nested JSON value"""
+    if isinstance(value, float):
+        return round(value, digits)
+    if isinstance(value, dict):
+        return {k: round_floats(v, digits) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [round_floats(v, digits) for v in value]
+    return value
+
+
+def encode(data, pretty=False, digits=4):
+    if digits is not None:
+        data = round_floats(data, digits)
+    if pretty:
+        text = json.dumps(data, indent=2)
+    else:
+        text = json.dumps(data, separators=(',', ':'))
+    return text.encode('utf-8')
+
+
+def write_atomic(path, payload):
+    """Write bytes to a temp file in the same directory, then rename it over path"""
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+        os.chmod(tmp_path, FILE_MODE)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _remove_stale(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+class JsonExporter:
+    """Writes JSON files plus compressed siblings and keeps the manifest up to date"""
+
+    def __init__(self, pretty=False, digits=4, precompress=True, manifest_path=MANIFEST_PATH):
+        self.pretty = pretty
+        self.digits = digits
+        self.precompress = precompress
+        self.manifest_path = manifest_path
+        self.entries = {}
+        if precompress and brotli is None:
+            print("Note: brotli is not installed, writing .json.gz siblings only")
+
+    def write(self, path, data):
+        payload = encode(data, self.pretty, self.digits)
+        write_atomic(path, payload)
+        entry = {
+            'sha256': hashlib.sha256(payload).hexdigest(),
+            'bytes': len(payload),
+            'encodings': {},
+        }
+        if self.precompress:
+            # mtime=0 keeps the gzip bytes identical for identical content
+            write_atomic(path + '.gz', gzip.compress(payload, compresslevel=9, mtime=0))
+            entry['encodings']['gzip'] = os.path.getsize(path + '.gz')
+            if brotli is not None:
+                write_atomic(path + '.br', brotli.compress(payload, quality=11))
+                entry['encodings']['br'] = os.path.getsize(path + '.br')
+            else:
+                _remove_stale(path + '.br')
+        else:
+            _remove_stale(path + '.gz')
+            _remove_stale(path + '.br')
+        self.entries[path] = entry
+        return entry
+
+    def write_manifest(self):
+        """Merge this run's entries into the manifest, keeping other scripts' files"""
+        manifest = {'files': {}}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        base = os.path.dirname(self.manifest_path)
+        for path, entry in self.entries.items():
+            name = os.path.relpath(path, base) if base else path
+            manifest['files'][name] = dict(entry, version=entry['sha256'][:12])
+        # Forget files that have since been removed (e.g. stale cube slices)
+        manifest['files'] = {
+            name: entry for name, entry in manifest['files'].items() if os.path.exists(os.path.join(base, name))
+        }
+        manifest['files'] = dict(sorted(manifest['files'].items()))
+        write_atomic(self.manifest_path, json.dumps(manifest, indent=2).encode('utf-8'))
+        print(f"Saved: {self.manifest_path}")
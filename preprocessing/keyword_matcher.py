@@ -0,0 +1,90 @@
+from collections import deque
+
+
+class KeywordMatcher:
+    """Aho-Corasick automaton that finds every keyword occurrence in one pass.
+
+    Keywords are attached to one or more owner labels (a body system, a
+    symptom name, ...). Matching is plain substring matching, exactly like
+    ``keyword in text``, including overlapping and nested keywords.
+    """
+
+    def __init__(self, keywords):
+        # keywords: iterable of (keyword, label) pairs
+        self.labels = []
+        label_ids = {}
+        goto = [{}]
+        outputs = [set()]
+
+        for keyword, label in keywords:
+            if not keyword:
+                raise ValueError(f"Empty keyword for label {label!r}")
+            if label not in label_ids:
+                label_ids[label] = len(self.labels)
+                self.labels.append(label)
+            state = 0
+            for ch in keyword:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    outputs.append(set())
+                state = nxt
+            outputs[state].add(label_ids[label])
+
+        # Breadth-first pass: resolve failure links into a full transition
+        # table so matching never has to follow failure chains.
+        fail = [0] * len(goto)
+        delta = [dict(edges) for edges in goto]
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            outputs[state] |= outputs[fail[state]]
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                fail[nxt] = delta[fail[state]].get(ch, 0)
+            for ch, nxt in delta[fail[state]].items():
+                delta[state].setdefault(ch, nxt)
+
+        self._delta = delta
+        self._outputs = [frozenset(o) for o in outputs]
+
+    def scan(self, text):
+        """Yield (end_index, label_ids) for every state that emits a match"""
+        delta = self._delta
+        outputs = self._outputs
+        state = 0
+        for i, ch in enumerate(text):
+            state = delta[state].get(ch, 0)
+            if outputs[state]:
+                yield i, outputs[state]
+
+    def find(self, text, end=None):
+        """Return the set of label ids with a keyword fully inside text[:end]"""
+        delta = self._delta
+        outputs = self._outputs
+        found = set()
+        state = 0
+        for ch in (text if end is None else text[:end]):
+            state = delta[state].get(ch, 0)
+            if outputs[state]:
+                found |= outputs[state]
+        return found
+
+    def find_split(self, text, boundary):
+        """Return (label ids fully inside text[:boundary], label ids anywhere in text) in one pass"""
+        delta = self._delta
+        outputs = self._outputs
+        found = set()
+        state = 0
+        for ch in text[:boundary]:
+            state = delta[state].get(ch, 0)
+            if outputs[state]:
+                found |= outputs[state]
+        head = set(found)
+        for ch in text[boundary:]:
+            state = delta[state].get(ch, 0)
+            if outputs[state]:
+                found |= outputs[state]
+        return head, found
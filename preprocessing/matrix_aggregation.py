@@ -0,0 +1,135 @@
+"""Aggregates computed from boolean membership matrices instead of per-record updates.
+
+A chunk becomes code arrays (age group, gender, answer) plus boolean
+(rows x systems) and (rows x symptoms) matrices. Every cross-tab (system x
+age group, system x gender, system x condition, system x symptom, symptom x
+diagnosis, age group x gender) is one np.unique count over the expanded
+(row, label) pairs. The counts are loaded into an ordinary Aggregates, so
+merging and the output builders are unchanged.
+
+Pairs are expanded in the order the per-record loop visits them and counts
+are keyed by first occurrence. Counter order, and so most_common tie order,
+matches aggregation.aggregate_records exactly.
+"""
+
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from aggregation import Aggregates, SystemStats
+from extractors import AGE_GROUPS, ALL_SYSTEMS, GENDERS, symptom_keywords
+from records import UNKNOWN_GENDER
+
+
+def bit_matrix(masks, width):
+    """(rows,) integer bitmasks -> (rows x width) boolean membership matrix"""
+    masks = np.asarray(masks, dtype=np.uint64)
+    return ((masks[:, None] >> np.arange(width, dtype=np.uint64)) & np.uint64(1)).astype(bool)
+
+
+def ordered_counts(keys):
+    """Distinct keys and their counts, in order of first occurrence"""
+    keys, first, counts = np.unique(keys, return_index=True, return_counts=True)
+    order = np.argsort(first, kind='stable')
+    return keys[order].tolist(), counts[order].tolist()
+
+
+def expand(rows, indptr, indices):
+    """Pair each entry of rows with every label of that row (CSR indptr/indices), labels in order"""
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    entry = np.repeat(np.arange(len(rows)), lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return entry, indices[np.repeat(starts, lengths) + offsets]
+
+
+def _fill(systems, field, system_codes, values, width, names=None):
+    """Count (system, value) pairs into each SystemStats counter, first-seen order"""
+    keys, counts = ordered_counts(system_codes * width + values)
+    for key, count in zip(keys, counts):
+        value = key % width
+        getattr(systems[key // width], field)[names[value] if names is not None else value] = count
+
+
+def aggregate_columns(has_age, age_codes, gender_codes, system_masks, symptom_masks, answers, question_at,
+                      head, head_size=1000, sample_size=3):
+    """Build the Aggregates of one chunk from its column arrays
+
+    head holds the chunk's first Records (at least head_size of them, if the
+    chunk has that many); question_at(row) returns a row's stored question,
+    which is only needed for the few sample questions per system.
+    """
+    agg = Aggregates(head_size)
+    n = len(age_codes)
+    agg.total = n
+    agg.head = list(head[:head_size])
+    if not n:
+        return agg
+
+    age_codes = np.asarray(age_codes, dtype=np.int64)
+    gender_codes = np.asarray(gender_codes, dtype=np.int64)
+    systems = bit_matrix(system_masks, len(ALL_SYSTEMS))
+    symptoms = bit_matrix(symptom_masks, len(symptom_keywords))
+    # Answer codes in order of first appearance
+    answer_codes, answer_names = pd.factorize(pd.Series(answers, dtype=object))
+    answer_names = answer_names.tolist()
+    n_answers = len(answer_names)
+
+    # Row-level tallies
+    agg.ages_found = int(np.count_nonzero(has_age))
+    agg.genders_found = int(np.count_nonzero(gender_codes != UNKNOWN_GENDER))
+    agg.primary_counts = Counter(dict(zip(*ordered_counts(systems.argmax(axis=1)))))
+    agg.age_counts = Counter(dict(zip(*ordered_counts(age_codes))))
+    agg.gender_counts = Counter(dict(zip(*ordered_counts(gender_codes))))
+    for key, count in zip(*ordered_counts(age_codes * len(GENDERS) + gender_codes)):
+        agg.demographics.setdefault(key // len(GENDERS), Counter())[key % len(GENDERS)] = count
+
+    # (row, system) pairs, row-major like the record loop
+    system_rows, system_codes = np.nonzero(systems)
+    for code, count in zip(*ordered_counts(system_codes)):
+        stats = agg.systems[code] = SystemStats()
+        stats.count = count
+    by_system = np.argsort(system_codes, kind='stable')
+    starts = np.searchsorted(system_codes[by_system], np.arange(len(ALL_SYSTEMS)))
+    for code, stats in agg.systems.items():
+        rows = system_rows[by_system[starts[code]:starts[code] + min(sample_size, stats.count)]]
+        stats.samples = [question_at(row) for row in rows.tolist()]
+
+    _fill(agg.systems, 'conditions', system_codes, answer_codes[system_rows], n_answers, answer_names)
+    _fill(agg.systems, 'age', system_codes, age_codes[system_rows], len(AGE_GROUPS))
+    _fill(agg.systems, 'gender', system_codes, gender_codes[system_rows], len(GENDERS))
+
+    # (row, symptom) pairs as CSR, then joined to the system pairs
+    symptom_rows, symptom_codes = np.nonzero(symptoms)
+    indptr = np.concatenate(([0], np.cumsum(symptoms.sum(axis=1))))
+    entry, joined_symptoms = expand(system_rows, indptr, symptom_codes)
+    _fill(agg.systems, 'symptoms', system_codes[entry], joined_symptoms, len(symptom_keywords))
+
+    # Symptom -> diagnosis pairs from the first 3 symptoms of each question
+    first3 = np.arange(len(symptom_rows)) - indptr[symptom_rows] < 3
+    keys, counts = ordered_counts(symptom_codes[first3] * n_answers + answer_codes[symptom_rows[first3]])
+    agg.pairs = Counter({(key // n_answers, answer_names[key % n_answers]): count for key, count in zip(keys, counts)})
+    return agg
+
+
+def aggregate_records(records, head_size=1000):
+    """Matrix version of aggregation.aggregate_records for a list of Records"""
+    return aggregate_columns(
+        [r.age is not None for r in records],
+        [r.age_code for r in records],
+        [r.gender_code for r in records],
+        [r.systems for r in records],
+        [r.symptoms for r in records],
+        [r.answer for r in records],
+        lambda row: records[row].question,
+        records, head_size
+    )
+
+
+def aggregate_record_columns(columns, head_size=1000):
+    """Matrix aggregation of a records.RecordColumns chunk; Records are built only for the head"""
+    return aggregate_columns(
+        columns.has_age, columns.age_codes, columns.gender_codes, columns.system_masks, columns.symptom_masks,
+        columns.answers, columns.question, columns.records(range(min(head_size, len(columns)))), head_size
+    )
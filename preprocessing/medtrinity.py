@@ -0,0 +1,281 @@
+"""Build data/medtrinity_data.json from a local MedTrinity-25M metadata dump.
+
+js/treemap.js draws the anatomical regions with their structure counts and a
+word cloud of the same structures. This script streams the records of a
+JSONL (optionally gzipped), Parquet or Arrow dump in batches, counts the
+records whose caption mentions each structure of taxonomies/medtrinity.json,
+and folds the batch counts from a process pool. Only one count per structure
+and modality is kept, whatever the size of the dump; the modality counts are
+written next to the structures.
+
+A structure counts once per record whose caption contains it as a whole word
+('ear' is not counted in 'clear' or 'year', 'rib' not in 'describe').
+Modality terms are stems and padded words ('histolog', ' ct ') matched
+anywhere in the caption padded with spaces. A record's modality is its
+modality field when the dump has one, otherwise the first modality whose
+terms appear in the caption; --modality counts one modality only.
+
+Usage (from the repo root):
+    python preprocessing/medtrinity.py data/medtrinity_metadata.jsonl [--workers 4]
+    python preprocessing/medtrinity.py preprocessing/fixtures/medtrinity_sample.jsonl --output /tmp/medtrinity.json
+"""
+
+import argparse
+import gzip
+import json
+import os
+from collections import Counter, deque
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from instrumentation import RunReport
+from json_export import JsonExporter
+from sharding import worker_pool
+from taxonomy import load_taxonomy, medtrinity_matcher
+
+TEXT_COLUMN = 'caption'
+MODALITY_COLUMN = 'modality'
+UNKNOWN_MODALITY = 'Unknown'
+OUTPUT_PATH = 'data/medtrinity_data.json'
+
+REGIONS = load_taxonomy('medtrinity')['anatomical_regions']
+MODALITIES = list(load_taxonomy('medtrinity')['modalities'])
+STRUCTURES = list(dict.fromkeys(word for words in REGIONS.values() for word in words))
+
+# Compiled once per taxonomy and unpickled from taxonomies/compiled/
+matcher = medtrinity_matcher()
+_structure_index = {word: i for i, word in enumerate(STRUCTURES)}
+# Matcher label id -> structure index (-1 for modality terms), -> modality name (None for structures)
+# and -> length of the structure word, which is the label's only keyword (None for modality terms)
+_label_structure = [_structure_index[name] if kind == 'structure' else -1 for kind, name in matcher.labels]
+_label_modality = [name if kind == 'modality' else None for kind, name in matcher.labels]
+_label_length = [len(name) if kind == 'structure' else None for kind, name in matcher.labels]
+
+
+# ============================================================
+# READING
+# ============================================================
+
+def _column(batch, name):
+    if name not in batch.schema.names:
+        return None
+    return batch.column(name).to_pylist()
+
+
+def iter_batches(path, batch_size=50000, text_column=TEXT_COLUMN, modality_column=MODALITY_COLUMN):
+    """Yield (captions, modalities or None) lists per batch of a .jsonl[.gz], .parquet or .arrow dump"""
+    path = str(path)
+    if path.endswith('.parquet'):
+        parquet = pq.ParquetFile(path)
+        names = parquet.schema_arrow.names
+        if text_column not in names:
+            raise SystemExit(f"{path} has no {text_column!r} column; columns: {names}")
+        columns = [c for c in (text_column, modality_column) if c in names]
+        for batch in parquet.iter_batches(batch_size=batch_size, columns=columns):
+            yield _column(batch, text_column), _column(batch, modality_column)
+    elif path.endswith(('.arrow', '.feather')):
+        table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+        if text_column not in table.schema.names:
+            raise SystemExit(f"{path} has no {text_column!r} column; columns: {table.schema.names}")
+        # Table slices are zero-copy views of the memory-mapped file
+        for start in range(0, table.num_rows, batch_size):
+            batch = table.slice(start, batch_size)
+            yield _column(batch, text_column), _column(batch, modality_column)
+    else:
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8') as f:
+            captions, modalities = [], []
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                captions.append(record.get(text_column))
+                modalities.append(record.get(modality_column))
+                if len(captions) >= batch_size:
+                    yield captions, modalities
+                    captions, modalities = [], []
+            if captions:
+                yield captions, modalities
+
+
+# ============================================================
+# COUNTING
+# ============================================================
+
+def caption_labels(caption):
+    """Matcher label ids of a caption: modality terms anywhere, structures only between non-alphanumerics"""
+    # Dumps may hold numbers or null where a caption is missing
+    caption = '' if caption is None else str(caption)
+    # The padding gives every hit a character on both sides, as record_modality's does
+    text = f" {caption.lower()} "
+    found = set()
+    for end, labels in matcher.scan(text):
+        for label in labels:
+            length = _label_length[label]
+            if length is None or not (text[end - length].isalnum() or text[end + 1].isalnum()):
+                found.add(label)
+    return found
+
+
+def record_modality(value, found):
+    """The record's own modality label when it has one, else the first modality found in its caption"""
+    if value:
+        value = str(value).strip()
+        # 'CT', 'mri', 'X-Ray' ... map onto the taxonomy's names; other labels are kept as they are
+        labels = [label for label in matcher.find(f" {value.lower()} ") if _label_modality[label] is not None]
+        return _label_modality[min(labels)] if labels else value
+    labels = [label for label in found if _label_modality[label] is not None]
+    # Label ids follow the taxonomy order, so the smallest is its first modality
+    return _label_modality[min(labels)] if labels else UNKNOWN_MODALITY
+
+
+class StructureCounts:
+    """Rows read, counted records per modality and records mentioning each structure"""
+
+    def __init__(self):
+        self.rows = 0
+        self.modalities = Counter()
+        self.structures = np.zeros(len(STRUCTURES), dtype=np.int64)
+
+    @property
+    def records(self):
+        return sum(self.modalities.values())
+
+    def merge(self, other):
+        self.rows += other.rows
+        self.modalities.update(other.modalities)
+        self.structures += other.structures
+        return self
+
+
+def count_batch(task):
+    """Worker entry point: (captions, modalities or None, modality filter) -> StructureCounts"""
+    captions, modalities, only = task
+    counts = StructureCounts()
+    counts.rows = len(captions)
+    structures = counts.structures
+    for i, caption in enumerate(captions):
+        found = caption_labels(caption) if caption else set()
+        modality = record_modality(modalities[i] if modalities is not None else None, found)
+        if only is not None and modality != only:
+            continue
+        counts.modalities[modality] += 1
+        for label in found:
+            if _label_structure[label] >= 0:
+                structures[_label_structure[label]] += 1
+    return counts
+
+
+def count_structures(batches, workers=1, modality=None):
+    """Fold the counts of every batch; at most 2 * workers batches are held in flight"""
+    result = StructureCounts()
+
+    def fold(counts):
+        result.merge(counts)
+        print(f"Processed {result.rows} rows...")
+
+    if workers <= 1:
+        for captions, modalities in batches:
+            fold(count_batch((captions, modalities, modality)))
+        return result
+
+    with worker_pool(workers) as pool:
+        # Bounded in-flight queue: Pool.imap would read the whole dump ahead
+        pending = deque()
+        for captions, modalities in batches:
+            pending.append(pool.apply_async(count_batch, ((captions, modalities, modality),)))
+            if len(pending) >= 2 * workers:
+                fold(pending.popleft().get())
+        while pending:
+            fold(pending.popleft().get())
+    return result
+
+
+# ============================================================
+# OUTPUT
+# ============================================================
+
+def build_medtrinity(counts):
+    """treemap.js's anatomical_regions and wordcloud_data, most frequent first, with the records per modality"""
+    by_word = dict(zip(STRUCTURES, counts.structures.tolist()))
+    regions = []
+    for region, words in REGIONS.items():
+        structures = sorted(
+            [{'name': word, 'count': by_word[word]} for word in dict.fromkeys(words) if by_word[word]],
+            key=lambda s: s['count'], reverse=True
+        )
+        if structures:
+            regions.append({'name': region, 'total': sum(s['count'] for s in structures), 'structures': structures})
+    regions.sort(key=lambda r: r['total'], reverse=True)
+    words = sorted([(word, count) for word, count in by_word.items() if count], key=lambda w: w[1], reverse=True)
+    return {
+        'anatomical_regions': regions,
+        'wordcloud_data': dict(words),
+        'modalities': dict(counts.modalities.most_common()),
+    }
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Build data/medtrinity_data.json from a MedTrinity metadata dump")
+    parser.add_argument('input', help="metadata dump: .jsonl, .jsonl.gz, .parquet or .arrow with a caption column")
+    parser.add_argument('--output', default=OUTPUT_PATH, help=f"output file (default {OUTPUT_PATH})")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="number of worker processes counting batches in parallel")
+    parser.add_argument('--batch-size', type=int, default=50000,
+                        help="records per batch read from the dump")
+    parser.add_argument('--text-column', default=TEXT_COLUMN,
+                        help="column (or JSON key) holding the caption text")
+    parser.add_argument('--modality-column', default=MODALITY_COLUMN,
+                        help="column holding the imaging modality; captions are matched when it is missing")
+    parser.add_argument('--modality', choices=MODALITIES + [UNKNOWN_MODALITY],
+                        help="count only the records of this modality")
+    parser.add_argument('--pretty', action='store_true',
+                        help="indent the JSON output instead of writing it compact")
+    parser.add_argument('--digits', type=int, default=4,
+                        help="round floats in the JSON output to this many decimals")
+    parser.add_argument('--no-precompress', action='store_true',
+                        help="skip the .json.gz/.json.br siblings")
+    parser.add_argument('--profile', choices=['cprofile', 'pyinstrument'],
+                        help="profile each stage and save the profiles under data/profiles/")
+    return parser
+
+
+def count_dump(args):
+    """StructureCounts of the dump named by the options"""
+    batches = iter_batches(args.input, args.batch_size, args.text_column, args.modality_column)
+    return count_structures(batches, args.workers, args.modality)
+
+
+def main():
+    args = build_parser().parse_args()
+    # The manifest and run report go next to the output, data/ by default
+    output_dir = os.path.dirname(args.output) or '.'
+    report = RunReport('medtrinity', output_dir=output_dir, profile=args.profile)
+
+    print(f"Streaming {args.input} in batches of {args.batch_size} records...")
+    report.start_stage('count')
+    counts = count_dump(args)
+    report.end_stage(rows=counts.rows)
+
+    report.start_stage('save_json')
+    exporter = JsonExporter(pretty=args.pretty, digits=args.digits, precompress=not args.no_precompress,
+                            manifest_path=os.path.join(output_dir, 'manifest.json'))
+    medtrinity_data = build_medtrinity(counts)
+    exporter.write(args.output, medtrinity_data)
+    print(f"Saved: {args.output}")
+    exporter.write_manifest()
+    report.end_stage()
+    report.write()
+
+    mentioned = int(np.count_nonzero(counts.structures))
+    print(f"\nRecords counted: {counts.records} / {counts.rows}")
+    print(f"Structures mentioned: {mentioned} / {len(STRUCTURES)} in {len(medtrinity_data['anatomical_regions'])} regions")
+    print("Modalities:")
+    for name, count in counts.modalities.most_common():
+        print(f"  {name}: {count} ({100 * count / max(counts.records, 1):.1f}%)")
+
+
+if __name__ == '__main__':
+    main()
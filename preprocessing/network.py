@@ -0,0 +1,113 @@
+"""Weighted medical co-occurrence network built from a sparse incidence matrix"""
+
+import math
+
+import numpy as np
+from scipy import sparse
+
+# (source group, target group, link type), matching the original add_link calls
+LINK_RULES = [
+    ('symptom', 'disease', 'symptom'),
+    ('disease', 'medication', 'treatment'),
+    ('risk', 'disease', 'risk'),
+    ('disease', 'diagnostic', 'diagnostic'),
+    ('disease', 'procedure', 'procedure'),
+]
+
+
+class CooccurrenceNetwork:
+    """Accumulates entity co-occurrence counts over any number of documents
+
+    Each batch of documents becomes a (documents x entities) CSR incidence
+    matrix X; its co-occurrence counts X.T @ X are added to a running
+    (entities x entities) total, so memory depends on the number of entities,
+    not documents.
+    """
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.entities = registry.labels()  # column order: (group, name)
+        self._columns = {label: j for j, label in enumerate(self.entities)}
+        size = len(self.entities)
+        self.cooccurrence = sparse.csr_matrix((size, size), dtype=np.int64)
+        self.documents = 0
+
+    def incidence(self, texts):
+        """Return the (documents x entities) incidence matrix for a batch of texts"""
+        indptr = [0]
+        indices = []
+        for text in texts:
+            indices.extend(self._columns[label] for label in self.registry.match_labels(text))
+            indptr.append(len(indices))
+        data = np.ones(len(indices), dtype=np.int64)
+        return sparse.csr_matrix((data, indices, indptr), shape=(len(indptr) - 1, len(self.entities)))
+
+    def add_texts(self, texts, batch_size=10000):
+        """Match every text and fold its entities into the co-occurrence counts"""
+        batch = []
+        for text in texts:
+            batch.append(text)
+            if len(batch) >= batch_size:
+                self._add_batch(batch)
+                batch = []
+        if batch:
+            self._add_batch(batch)
+
+    def _add_batch(self, texts):
+        x = self.incidence(texts)
+        self.cooccurrence = self.cooccurrence + (x.T @ x).tocsr()
+        self.documents += x.shape[0]
+
+    def to_json(self, top_k=None, min_weight=1):
+        """Nodes with document counts and typed links weighted by co-occurrence
+
+        Each link carries its co-occurrence count (weight), lift and PMI. With
+        top_k, a link is kept only if it is among the top_k heaviest links of
+        its source or its target.
+        """
+        counts = self.cooccurrence.diagonal()
+        dense = self.cooccurrence.toarray()
+        groups = {}
+        for j, (group, _) in enumerate(self.entities):
+            groups.setdefault(group, []).append(j)
+
+        nodes = [
+            {'id': name, 'group': group, 'count': int(counts[j])}
+            for j, (group, name) in enumerate(self.entities)
+            if counts[j] > 0
+        ]
+
+        links = []
+        for source_group, target_group, link_type in LINK_RULES:
+            for i in groups.get(source_group, []):
+                for j in groups.get(target_group, []):
+                    weight = int(dense[i, j])
+                    if weight < min_weight or weight == 0:
+                        continue
+                    lift = weight * self.documents / (counts[i] * counts[j])
+                    links.append({
+                        'source': self.entities[i][1],
+                        'target': self.entities[j][1],
+                        'type': link_type,
+                        'weight': weight,
+                        'lift': round(float(lift), 4),
+                        'pmi': round(math.log2(lift), 4)
+                    })
+
+        if top_k is not None:
+            links = prune_top_k(links, top_k)
+        return {'nodes': nodes, 'links': links}
+
+
+def prune_top_k(links, top_k):
+    """Keep links that rank in the top_k by weight for at least one endpoint"""
+    by_node = {}
+    for position, link in enumerate(links):
+        by_node.setdefault(link['source'], []).append(position)
+        by_node.setdefault(link['target'], []).append(position)
+
+    keep = set()
+    for positions in by_node.values():
+        ranked = sorted(positions, key=lambda p: (-links[p]['weight'], p))
+        keep.update(ranked[:top_k])
+    return [link for position, link in enumerate(links) if position in keep]
@@ -0,0 +1,504 @@
+"""Dependency-tracked build of every data/*.json artifact of both preprocessing scripts.
+
+Each dataset is loaded once and extracted once per build, and every artifact
+made from it shares that pass. The stages and their dependencies:
+
+    medical_questions.csv -> aggregates -> processed_data.json, demographics.json,
+                                           sankey_data.json, cube (data/cube/, with --cube)
+                                        -> body_system_stats -> body_system_stats.json,
+                                                                treemap_data.json
+    medical_o1 (snapshot) -> question_fields -> age_disease.json, gender_disease.json
+                          -> network -> medical_network.json
+    MedTrinity dump (with --medtrinity-args) -> medtrinity_counts -> medtrinity_data.json
+
+The aggregates stage also writes the --write-extracted file, which is then
+one of its outputs.
+
+A stage's fingerprint hashes the options it reads, the source of the
+modules it runs (with everything they import from preprocessing/ and the
+taxonomy files), the size and mtime of its input files, and its
+dependencies' fingerprints. An artifact is skipped while its fingerprint and
+its output files are unchanged since the last build. The expensive
+intermediates (aggregates, question_fields, network) are pickled under
+data/.pipeline/ by fingerprint, so rebuilding one artifact reruns only its
+own last step. Stages whose dependencies are ready run in parallel threads;
+the process pools of --workers start from a forkserver, not by forking
+those threads.
+
+Usage (from the repo root):
+    python preprocessing/pipeline.py                       # rebuild what changed
+    python preprocessing/pipeline.py treemap_data.json     # one artifact and what it needs
+    python preprocessing/pipeline.py --dry-run             # show what would run
+    python preprocessing/pipeline.py --features1-args "--workers 4 --sketch" \\
+                                     --features2-args "--network-top-k 10"
+    python preprocessing/pipeline.py --medtrinity-args "data/medtrinity_metadata.jsonl --workers 4"
+"""
+
+import argparse
+import ast
+import fnmatch
+import glob
+import hashlib
+import json
+import os
+import pickle
+import shlex
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from instrumentation import RunReport, peak_rss_mb
+from json_export import JsonExporter, write_atomic
+from taxonomy import TAXONOMY_DIR
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+STATE_DIR = 'data/.pipeline'
+
+_print_lock = threading.Lock()
+
+
+def log(message):
+    """print() for stages running in parallel threads, one whole line at a time"""
+    with _print_lock:
+        print(message)
+
+
+# ============================================================
+# FINGERPRINTS
+# ============================================================
+
+def local_imports(*modules):
+    """The given preprocessing modules and every preprocessing module they import, transitively"""
+    seen = set()
+    todo = list(modules)
+    while todo:
+        name = todo.pop()
+        path = os.path.join(HERE, name + '.py')
+        if name in seen or not os.path.exists(path):
+            continue
+        seen.add(name)
+        with open(path, encoding='utf-8') as f:
+            tree = ast.parse(f.read(), path)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                todo.extend(alias.name.split('.')[0] for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                todo.append(node.module.split('.')[0])
+    return sorted(seen)
+
+
+def code_hash(*modules):
+    """Hash of the modules' source, their local imports and, if they use them, the taxonomy files"""
+    names = local_imports(*modules)
+    paths = [os.path.join(HERE, name + '.py') for name in names]
+    if 'taxonomy' in names:
+        paths += sorted(glob.glob(os.path.join(TAXONOMY_DIR, '*.json')))
+    digest = hashlib.blake2b(digest_size=8)
+    for path in paths:
+        with open(path, 'rb') as f:
+            digest.update(os.path.basename(path).encode('utf-8') + b'\0' + f.read() + b'\0')
+    return digest.hexdigest()
+
+
+def file_stamp(path):
+    """[size, mtime_ns] of a file, or None if it does not exist"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def output_files(patterns):
+    """Output paths with glob patterns expanded to the files that exist now"""
+    files = []
+    for pattern in patterns:
+        files.extend(sorted(glob.glob(pattern)) if any(c in pattern for c in '*?[') else [pattern])
+    return files
+
+
+def fingerprint(*parts):
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=8).hexdigest()
+
+
+# ============================================================
+# STAGES
+# ============================================================
+
+class Stage:
+    """One build step: run(*dependency values) -> value
+
+    options are the settings the result depends on, code the modules that
+    compute it, inputs the files it reads and outputs the data files it
+    writes; an output may be a glob pattern when the file names depend on the
+    data (data/cube/*.json). Only stages with outputs are build targets;
+    cached stages pickle their value for later builds.
+    """
+
+    def __init__(self, name, run, deps=(), options=None, code=(), inputs=(), outputs=(), cache=False):
+        self.name = name
+        self.run = run
+        self.deps = list(deps)
+        self.options = options
+        self.code = list(code)
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.cache = cache
+
+
+class Pipeline:
+    """Plans and runs stages, skipping artifacts and reusing intermediates whose fingerprints are unchanged"""
+
+    def __init__(self, stages, state_dir=STATE_DIR):
+        self.stages = {}
+        self.fingerprints = {}
+        self._code_hashes = {}
+        # Stages are declared after their dependencies, so one pass fingerprints them all
+        for stage in stages:
+            unknown = [dep for dep in stage.deps if dep not in self.stages]
+            if unknown:
+                raise ValueError(f"stage {stage.name} depends on undeclared stages {unknown}")
+            self.stages[stage.name] = stage
+            self._fingerprint(stage)
+        self.state_dir = state_dir
+        self.state_path = os.path.join(state_dir, 'state.json')
+        self.state = {}
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                self.state = json.load(f)
+        self._lock = threading.Lock()
+
+    def _fingerprint(self, stage):
+        code = tuple(stage.code)
+        if code not in self._code_hashes:
+            self._code_hashes[code] = code_hash(*code)
+        self.fingerprints[stage.name] = fingerprint(
+            stage.name, stage.options, self._code_hashes[code],
+            {path: file_stamp(path) for path in stage.inputs},
+            [self.fingerprints[dep] for dep in stage.deps]
+        )
+
+    def _refingerprint(self, name):
+        """Fingerprint a stage again, and every stage depending on it, after its inputs changed"""
+        changed = {name}
+        for stage in self.stages.values():
+            if stage.name in changed or changed.intersection(stage.deps):
+                changed.add(stage.name)
+                self._fingerprint(stage)
+
+    def targets(self):
+        return [name for name, stage in self.stages.items() if stage.outputs]
+
+    def resolve(self, target):
+        """Stage name for a target given as a stage name or an output path such as treemap_data.json"""
+        if target in self.stages and self.stages[target].outputs:
+            return target
+        for name in self.targets():
+            if any(target in (path, os.path.basename(path)) or fnmatch.fnmatch(target, path)
+                   for path in self.stages[name].outputs):
+                return name
+        raise SystemExit(f"Unknown target {target!r}; choose from {', '.join(self.targets())}")
+
+    def cache_path(self, name):
+        return os.path.join(self.state_dir, f"{name}-{self.fingerprints[name]}.pickle")
+
+    def fresh(self, name):
+        """Whether an artifact was built with this fingerprint and its outputs are untouched since
+
+        A glob output is fresh only while it matches exactly the files written
+        then, so a deleted or stray slice file also triggers a rebuild.
+        """
+        built = self.state.get(name)
+        if built is None or built['fingerprint'] != self.fingerprints[name]:
+            return False
+        files = output_files(self.stages[name].outputs)
+        return sorted(files) == sorted(built['outputs']) and all(
+            file_stamp(path) is not None and file_stamp(path) == built['outputs'][path] for path in files
+        )
+
+    def plan(self, targets=None, force=False):
+        """[(stage, 'run' | 'load' | 'skip')] in dependency order"""
+        actions = {}
+
+        def need(name):
+            if name in actions:
+                return
+            stage = self.stages[name]
+            # A cached value does not rewrite the stage's own output files
+            if stage.cache and not force and os.path.exists(self.cache_path(name)) and \
+                    (not stage.outputs or self.fresh(name)):
+                actions[name] = 'load'
+                return
+            actions[name] = 'run'
+            for dep in self.stages[name].deps:
+                need(dep)
+
+        for target in targets or self.targets():
+            if not force and self.fresh(target):
+                actions.setdefault(target, 'skip')
+            else:
+                need(target)
+        return [(name, actions[name]) for name in self.stages if name in actions]
+
+    def _execute(self, name, action, values):
+        stage = self.stages[name]
+        start = time.perf_counter()
+        if action == 'load':
+            with open(self.cache_path(name), 'rb') as f:
+                value = pickle.load(f)
+        else:
+            missing = [path for path in stage.inputs if file_stamp(path) is None]
+            value = stage.run(*[values[dep] for dep in stage.deps])
+            if any(file_stamp(path) is not None for path in missing):
+                # The stage created its own input (a first download): stamp what the next build will see.
+                # Its dependents only start once it is done, so they use the new fingerprints.
+                with self._lock:
+                    self._refingerprint(name)
+            if stage.cache:
+                self._save_cache(name, value)
+        if stage.outputs:
+            with self._lock:
+                self.state[name] = {
+                    'fingerprint': self.fingerprints[name],
+                    'outputs': {path: file_stamp(path) for path in output_files(stage.outputs)},
+                }
+        return value, time.perf_counter() - start
+
+    def _save_cache(self, name, value):
+        os.makedirs(self.state_dir, exist_ok=True)
+        path = self.cache_path(name)
+        write_atomic(path, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        # Only the latest value of each stage is kept
+        for old in glob.glob(os.path.join(self.state_dir, f"{name}-*.pickle")):
+            if old != path:
+                os.remove(old)
+
+    def run(self, plan, jobs=4, report=None):
+        """Run the planned stages, each as soon as its dependencies are done"""
+        todo = {name: action for name, action in plan if action != 'skip'}
+        values = {}
+        running = {}
+        try:
+            with ThreadPoolExecutor(max_workers=max(jobs, 1)) as pool:
+                while todo or running:
+                    for name, action in list(todo.items()):
+                        if action == 'load' or all(dep in values for dep in self.stages[name].deps):
+                            del todo[name]
+                            running[pool.submit(self._execute, name, action, values)] = (name, action)
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        name, action = running.pop(future)
+                        try:
+                            values[name], seconds = future.result()
+                        except BaseException:
+                            # Let the stages already running finish, then stop
+                            todo.clear()
+                            raise
+                        log(f"[{name}] {'loaded' if action == 'load' else 'done'} in {seconds:.2f}s")
+                        if report is not None:
+                            report.stages.append({'stage': name, 'action': action, 'seconds': round(seconds, 4),
+                                                  'process_peak_rss_mb': peak_rss_mb()})
+        finally:
+            self.save_state()
+        return values
+
+    def save_state(self):
+        os.makedirs(self.state_dir, exist_ok=True)
+        write_atomic(self.state_path, json.dumps(self.state, indent=2, sort_keys=True).encode('utf-8'))
+
+
+# ============================================================
+# BOTH SCRIPTS' STAGES
+# ============================================================
+
+# Options that change only how a result is computed (workers, chunk sizes,
+# caches) are left out of the fingerprints, as are the export options, which
+# only the artifact stages depend on. write_extracted names an output of the
+# aggregates stage, which writes the extracted file during its extraction pass
+AGGREGATE_OPTIONS = ['engine', 'aggregation', 'from_extracted', 'write_extracted', 'cube', 'cube_capacity',
+                     'cube_top_symptoms', 'sketch', 'sketch_capacity', 'sketch_epsilon', 'sketch_delta',
+                     'hll_precision', 'sample_per_stratum', 'sample_seed']
+
+
+def pick(args, *names):
+    return {name: getattr(args, name) for name in names}
+
+
+def features1_stages(args, exporter, report):
+    """extracting_features1.py: one load, extraction and aggregation for five artifacts and the cube"""
+    import extracting_features1 as script
+    from aggregation import build_body_system_stats, build_demographics, build_treemap
+    from cube import write_cube
+    from sankey import build_sankey
+
+    sketch = script.sketch_options(args)
+    sample = script.sample_options(args)
+    cube_params = script.cube_options(args)
+    export = {'pretty': exporter.pretty, 'digits': exporter.digits, 'precompress': exporter.precompress}
+
+    def aggregates():
+        # Other stages may be running in this process, so no per-stage high-water marks
+        inner = RunReport('extracting_features1', stage_peaks=False)
+        result = script.compute_aggregates(args, inner, sketch, sample, cube_params)
+        report.stages.extend(dict(stage, stage='aggregates.' + stage['stage']) for stage in inner.stages)
+        return result
+
+    def artifact(path, build):
+        def run(value):
+            exporter.write(path, build(value))
+            log(f"Saved: {path}")
+        return run
+
+    def cube(agg):
+        index = write_cube(agg.cube, exporter, agg.total,
+                           top_symptoms=args.cube_top_symptoms, top_conditions=args.cube_top_conditions)
+        log(f"Saved: data/cube/ ({len(index['slices'])} body system slices)")
+
+    source = args.from_extracted or 'data/medical_questions.csv'
+    stages = [
+        Stage('aggregates', aggregates, options=pick(args, *AGGREGATE_OPTIONS),
+              code=['extracting_features1'], inputs=[source],
+              outputs=[args.write_extracted] if args.write_extracted else [], cache=True),
+        Stage('body_system_stats', build_body_system_stats, deps=['aggregates'], code=['aggregation']),
+        Stage('processed_data.json',
+              artifact('data/processed_data.json', lambda agg: [record.to_dict() for record in agg.reference_records()]),
+              deps=['aggregates'], options=export, code=['records', 'json_export'],
+              outputs=['data/processed_data.json']),
+        Stage('body_system_stats.json', artifact('data/body_system_stats.json', lambda stats: stats),
+              deps=['body_system_stats'], options=export, code=['json_export'],
+              outputs=['data/body_system_stats.json']),
+        Stage('demographics.json', artifact('data/demographics.json', build_demographics),
+              deps=['aggregates'], options=export, code=['aggregation', 'json_export'],
+              outputs=['data/demographics.json']),
+        Stage('sankey_data.json',
+              artifact('data/sankey_data.json',
+                       lambda agg: build_sankey(agg, args.sankey_top_k, args.sankey_min_count, args.sankey_levels)),
+              deps=['aggregates'], options=dict(export, **pick(args, 'sankey_top_k', 'sankey_min_count', 'sankey_levels')),
+              code=['sankey', 'json_export'], outputs=['data/sankey_data.json']),
+        Stage('treemap_data.json', artifact('data/treemap_data.json', build_treemap),
+              deps=['body_system_stats'], options=export, code=['aggregation', 'json_export'],
+              outputs=['data/treemap_data.json']),
+    ]
+    if args.cube:
+        stages.append(Stage('cube', cube, deps=['aggregates'],
+                            options=dict(export, **pick(args, 'cube_top_symptoms', 'cube_top_conditions')),
+                            code=['cube', 'json_export'], outputs=['data/cube/*.json']))
+    return stages
+
+
+def features2_stages(args, exporter):
+    """extracted_features2.py: one snapshot load shared by the question fields and the network"""
+    import extracted_features2 as script
+    from dataset_source import load_source
+
+    export = {'pretty': exporter.pretty, 'digits': exporter.digits, 'precompress': exporter.precompress}
+
+    def artifact(path, build):
+        def run(*values):
+            exporter.write(path, build(*values))
+            log(f"Saved: {path}")
+        return run
+
+    return [
+        Stage('medical_o1', lambda: load_source(args.snapshot, refresh=args.refresh_snapshot, streaming=args.streaming),
+              options=pick(args, 'refresh_snapshot'), code=['dataset_source'], inputs=[args.snapshot]),
+        Stage('question_fields', lambda source: script.question_fields(source, args.batch_size, args.cache),
+              deps=['medical_o1'], code=['extracted_features2'], cache=True),
+        Stage('network', lambda source: script.build_network(source, args.batch_size),
+              deps=['medical_o1'], code=['extracted_features2'], cache=True),
+        Stage('age_disease.json',
+              artifact('data/age_disease.json', lambda fields: script.build_age_disease(fields[0], fields[1])),
+              deps=['question_fields'], options=export, code=['extracted_features2'],
+              outputs=['data/age_disease.json']),
+        Stage('gender_disease.json',
+              artifact('data/gender_disease.json', lambda fields: script.build_gender_disease(fields[0], fields[2])),
+              deps=['question_fields'], options=export, code=['extracted_features2'],
+              outputs=['data/gender_disease.json']),
+        Stage('medical_network.json',
+              artifact('data/medical_network.json',
+                       lambda network: network.to_json(top_k=args.network_top_k, min_weight=args.network_min_weight)),
+              deps=['network'], options=dict(export, **pick(args, 'network_top_k', 'network_min_weight')),
+              code=['network', 'json_export'], outputs=['data/medical_network.json']),
+    ]
+
+
+def medtrinity_stages(args, exporter):
+    """medtrinity.py: one pass over the metadata dump for the treemap and word cloud file"""
+    import medtrinity as script
+
+    export = {'pretty': exporter.pretty, 'digits': exporter.digits, 'precompress': exporter.precompress}
+
+    def artifact(counts):
+        exporter.write(args.output, script.build_medtrinity(counts))
+        log(f"Saved: {args.output}")
+
+    return [
+        Stage('medtrinity_counts', lambda: script.count_dump(args),
+              options=pick(args, 'text_column', 'modality_column', 'modality'), code=['medtrinity'],
+              inputs=[args.input], cache=True),
+        Stage('medtrinity_data.json', artifact, deps=['medtrinity_counts'], options=export,
+              code=['medtrinity', 'json_export'], outputs=[args.output]),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the data/*.json artifacts, rebuilding only what changed")
+    parser.add_argument('targets', nargs='*',
+                        help="artifacts to build, e.g. treemap_data.json or cube; default: all of them")
+    parser.add_argument('--jobs', type=int, default=4,
+                        help="stages run at the same time once their dependencies are done")
+    parser.add_argument('--force', action='store_true',
+                        help="rebuild the targets and everything they depend on, ignoring the stored state")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="print what would run, load from cache or be skipped, and exit")
+    parser.add_argument('--features1-args', default='', metavar='ARGS',
+                        help="extracting_features1.py options, e.g. \"--workers 4 --sketch\"")
+    parser.add_argument('--features2-args', default='', metavar='ARGS',
+                        help="extracted_features2.py options, e.g. \"--snapshot PATH --network-top-k 10\"")
+    parser.add_argument('--medtrinity-args', metavar='ARGS',
+                        help="medtrinity.py input and options, e.g. \"data/medtrinity_metadata.jsonl --workers 4\"; "
+                             "medtrinity_data.json is only built when given")
+    parser.add_argument('--pretty', action='store_true',
+                        help="indent the JSON outputs instead of writing them compact")
+    parser.add_argument('--digits', type=int, default=4,
+                        help="round floats in the JSON outputs to this many decimals")
+    parser.add_argument('--no-precompress', action='store_true',
+                        help="skip the .json.gz/.json.br siblings")
+    args = parser.parse_args()
+
+    import extracted_features2
+    import extracting_features1
+
+    # Each script's own parser, so the options and defaults stay in one place
+    args1 = extracting_features1.build_parser().parse_args(shlex.split(args.features1_args))
+    args2 = extracted_features2.build_parser().parse_args(shlex.split(args.features2_args))
+
+    report = RunReport('pipeline')
+    exporter = JsonExporter(pretty=args.pretty, digits=args.digits, precompress=not args.no_precompress)
+    stages = features1_stages(args1, exporter, report) + features2_stages(args2, exporter)
+    if args.medtrinity_args:
+        import medtrinity
+        stages += medtrinity_stages(medtrinity.build_parser().parse_args(shlex.split(args.medtrinity_args)), exporter)
+    pipeline = Pipeline(stages)
+
+    targets = [pipeline.resolve(target) for target in args.targets]
+    plan = pipeline.plan(targets, force=args.force)
+    for name, action in plan:
+        print(f"  {name}: {'up to date' if action == 'skip' else 'load cached' if action == 'load' else 'run'}")
+    if args.dry_run:
+        return
+    if all(action == 'skip' for _, action in plan):
+        print("Everything is up to date.")
+        return
+
+    pipeline.run(plan, jobs=args.jobs, report=report)
+    if exporter.entries:
+        exporter.write_manifest()
+    report.write()
+
+    print("✅ Pipeline complete.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,350 @@
+"""Local HTTP API answering aggregate queries over an extracted records file.
+
+The columnar file written by extracting_features1.py --write-extracted is
+loaded once. Every filter value gets a boolean row mask up front, so a query
+only ANDs masks and runs the matrix aggregation on the matching rows. The
+responses are the same structures the preprocessing writes to data/*.json.
+Responses are kept in a bounded LRU cache and served with ETags, so a
+repeated query is answered without recomputing.
+
+Usage (from the repo root):
+    python preprocessing/query_server.py data/extracted.parquet [--port 8765]
+
+Endpoints (filters: system, age_group, gender, symptom; a unique
+case-insensitive prefix is enough, e.g. age_group=Senior):
+    /stats           body_system_stats.json for the matching records
+    /demographics    demographics.json
+    /sankey          sankey_data.json; top, min_count, levels
+    /treemap         treemap_data.json
+    /summary         record count and age/gender/primary system distributions
+    /health          liveness check
+"""
+
+import argparse
+import asyncio
+import gzip
+import hashlib
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+
+from aggregation import build_body_system_stats, build_demographics, build_treemap, decode
+from columnar_store import category_codes, open_extracted
+from extractors import AGE_GROUPS, ALL_SYSTEMS, GENDERS, symptom_keywords
+from json_export import encode
+from matrix_aggregation import aggregate_columns
+from records import AGE_GROUP_CODES, GENDER_CODES
+from sankey import build_sankey
+
+FILTERS = {
+    'system': ALL_SYSTEMS,
+    'age_group': AGE_GROUPS,
+    'gender': GENDERS,
+    'symptom': symptom_keywords,
+}
+REASONS = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           500: 'Internal Server Error'}
+
+
+class QueryError(Exception):
+    """Invalid request; the message is returned to the client with status 400"""
+
+
+def resolve(value, names):
+    """Exact name, or a unique case-insensitive prefix of one"""
+    if value in names:
+        return value
+    matches = [name for name in names if name.lower().startswith(value.lower())]
+    if len(matches) != 1:
+        raise QueryError(f"{value!r} matches {len(matches)} of {names}")
+    return matches[0]
+
+
+def int_param(params, name, default):
+    try:
+        return int(params.get(name, default))
+    except ValueError:
+        raise QueryError(f"{name} must be an integer")
+
+
+# ============================================================
+# IN-MEMORY INDEX
+# ============================================================
+
+class RecordIndex:
+    """Code columns of an extracted file plus one boolean row mask per filter value"""
+
+    def __init__(self, path):
+        table = open_extracted(path)
+        self.path = path
+        self.total = table.num_rows
+        self.has_age = table.column('age').is_valid().to_numpy(zero_copy_only=False)
+        self.age_codes = np.array(category_codes(table.column('age_group'), AGE_GROUP_CODES), dtype=np.int64)
+        self.gender_codes = np.array(category_codes(table.column('gender'), GENDER_CODES), dtype=np.int64)
+        self.system_masks = table.column('body_systems').to_numpy().astype(np.uint64)
+        self.symptom_masks = table.column('symptoms').to_numpy()
+        self.answers = np.array(table.column('answer').to_pylist(), dtype=object)
+        # Questions stay in Arrow (memory-mapped for .arrow files); only samples are decoded
+        self.questions = table.column('question').combine_chunks()
+
+        self.masks = {
+            'system': {name: (self.system_masks >> np.uint64(i)) & np.uint64(1) == 1
+                       for i, name in enumerate(ALL_SYSTEMS)},
+            'age_group': {name: self.age_codes == i for i, name in enumerate(AGE_GROUPS)},
+            'gender': {name: self.gender_codes == i for i, name in enumerate(GENDERS)},
+            'symptom': {name: (self.symptom_masks >> np.uint64(i)) & np.uint64(1) == 1
+                        for i, name in enumerate(symptom_keywords)},
+        }
+
+    def rows(self, filters):
+        """Row numbers matching every (dimension, value) filter"""
+        selected = np.ones(self.total, dtype=bool)
+        for dimension, value in filters:
+            selected &= self.masks[dimension][value]
+        return np.flatnonzero(selected)
+
+    def aggregate(self, filters):
+        rows = self.rows(filters)
+        questions = self.questions
+        return aggregate_columns(
+            self.has_age[rows], self.age_codes[rows], self.gender_codes[rows],
+            self.system_masks[rows], self.symptom_masks[rows], self.answers[rows],
+            lambda row: questions[int(rows[row])].as_py(),
+            [], head_size=0
+        )
+
+
+# ============================================================
+# QUERIES
+# ============================================================
+
+def parse_filters(params):
+    return tuple(
+        (dimension, resolve(params[dimension], names)) for dimension, names in FILTERS.items() if dimension in params
+    )
+
+
+def summary(agg):
+    return {
+        'total': agg.total,
+        'ages_found': agg.ages_found,
+        'genders_found': agg.genders_found,
+        'primary_system': dict(decode(agg.primary_counts, ALL_SYSTEMS).most_common()),
+        'age_group': dict(decode(agg.age_counts, AGE_GROUPS).most_common()),
+        'gender': dict(decode(agg.gender_counts, GENDERS).most_common()),
+    }
+
+
+def sankey_options(params):
+    """(top, min_count, levels) with their defaults filled in"""
+    levels = int_param(params, 'levels', 2)
+    if levels not in (2, 3):
+        raise QueryError("levels must be 2 or 3")
+    return int_param(params, 'top', 100), int_param(params, 'min_count', 1), levels
+
+
+ENDPOINTS = {
+    '/stats': lambda agg, options: build_body_system_stats(agg),
+    '/demographics': lambda agg, options: build_demographics(agg),
+    '/sankey': lambda agg, options: build_sankey(agg, *options),
+    '/treemap': lambda agg, options: build_treemap(build_body_system_stats(agg)),
+    '/summary': lambda agg, options: summary(agg),
+}
+# Endpoints taking options besides the filters; any other parameter is ignored
+OPTIONS = {
+    '/sankey': sankey_options,
+}
+
+
+class LRUCache:
+    """Bounded mapping that evicts the least recently used entry; safe across threads"""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class QueryService:
+    """Computes and caches (etag, body, gzipped body) per normalized query"""
+
+    def __init__(self, index, cache_size=256):
+        self.index = index
+        self.cache = LRUCache(cache_size)
+        self._aggregates = LRUCache(max(cache_size // 8, 4))
+
+    def key(self, path, params):
+        if path not in ENDPOINTS:
+            return None
+        # Only parameters that change the response are part of the key (and so of the ETag)
+        options = OPTIONS[path](params) if path in OPTIONS else ()
+        return path, parse_filters(params), options
+
+    def compute(self, key):
+        path, filters, options = key
+        # Endpoints with the same filters share one aggregation
+        agg = self._aggregates.get(filters)
+        if agg is None:
+            agg = self.index.aggregate(filters)
+            self._aggregates.put(filters, agg)
+        body = encode(ENDPOINTS[path](agg, options))
+        etag = '"' + hashlib.sha256(body).hexdigest()[:20] + '"'
+        return etag, body, gzip.compress(body, mtime=0)
+
+    async def response(self, path, params):
+        """(status, headers, body, gzipped body or None) for one GET"""
+        if path == '/health':
+            return 200, {}, encode({'status': 'ok', 'records': self.index.total}), None
+        key = self.key(path, params)
+        if key is None:
+            return 404, {}, encode({'error': f"unknown endpoint {path}", 'endpoints': sorted(ENDPOINTS)}), None
+        entry = self.cache.get(key)
+        cached = entry is not None
+        if entry is None:
+            # Aggregation runs in a worker thread so other requests keep being served
+            entry = await asyncio.get_running_loop().run_in_executor(None, self.compute, key)
+            self.cache.put(key, entry)
+        etag, body, gzipped = entry
+        return 200, {'ETag': etag, 'X-Cache': 'hit' if cached else 'miss'}, body, gzipped
+
+
+# ============================================================
+# HTTP
+# ============================================================
+
+async def read_request(reader):
+    """Return (method, target, headers) or None when the client closed the connection"""
+    line = await reader.readline()
+    if not line:
+        return None
+    parts = line.decode('latin-1').split()
+    if len(parts) != 3:
+        raise QueryError("malformed request line")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return parts[0], parts[1], headers
+
+
+def write_response(writer, status, headers, body, head_only=False):
+    lines = [f"HTTP/1.1 {status} {REASONS[status]}"]
+    headers = dict(headers, **{
+        'Content-Type': 'application/json',
+        'Content-Length': str(len(body)),
+        'Access-Control-Allow-Origin': '*',
+        'Cache-Control': 'no-cache',
+    })
+    lines += [f"{name}: {value}" for name, value in headers.items()]
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+    if not head_only:
+        writer.write(body)
+
+
+def make_handler(service, log=True):
+    async def handle(reader, writer):
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except QueryError as e:
+                    write_response(writer, 400, {'Connection': 'close'}, encode({'error': str(e)}))
+                    break
+                if request is None:
+                    break
+                method, target, headers = request
+                start = time.perf_counter()
+                url = urlsplit(target)
+                params = dict(parse_qsl(url.query))
+                extra = {}
+                if method not in ('GET', 'HEAD'):
+                    status, body, gzipped = 405, encode({'error': "only GET and HEAD are supported"}), None
+                else:
+                    try:
+                        status, extra, body, gzipped = await service.response(url.path, params)
+                    except QueryError as e:
+                        status, body, gzipped = 400, encode({'error': str(e)}), None
+                    except Exception as e:
+                        traceback.print_exc()
+                        status, body, gzipped = 500, encode({'error': f"{type(e).__name__}: {e}"}), None
+                if status == 200 and extra.get('ETag') and extra['ETag'] in headers.get('if-none-match', ''):
+                    status, body = 304, b''
+                elif gzipped is not None and 'gzip' in headers.get('accept-encoding', ''):
+                    extra['Content-Encoding'] = 'gzip'
+                    body = gzipped
+                if gzipped is not None:
+                    extra['Vary'] = 'Accept-Encoding'
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                if not keep_alive:
+                    extra['Connection'] = 'close'
+                write_response(writer, status, extra, body, head_only=method == 'HEAD')
+                await writer.drain()
+                if log:
+                    print(f"{method} {target} {status} {extra.get('X-Cache', '-')} "
+                          f"{1000 * (time.perf_counter() - start):.1f} ms")
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+    return handle
+
+
+async def serve(service, host, port):
+    server = await asyncio.start_server(make_handler(service), host, port)
+    print(f"Serving {service.index.total} records from {service.index.path} on http://{host}:{port}/")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve aggregate queries over an extracted records file")
+    parser.add_argument('extracted', help="Parquet or .arrow file from extracting_features1.py --write-extracted")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--cache-size', type=int, default=256, help="responses kept in the LRU cache")
+    parser.add_argument('--no-warm', action='store_true', help="skip precomputing the unfiltered responses")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    service = QueryService(RecordIndex(args.extracted), args.cache_size)
+    print(f"Loaded {service.index.total} records in {time.perf_counter() - start:.2f}s")
+    if not args.no_warm:
+        for path in ENDPOINTS:
+            key = service.key(path, {})
+            service.cache.put(key, service.compute(key))
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
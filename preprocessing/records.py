@@ -0,0 +1,202 @@
+"""Compact processed records: category codes and bitmasks instead of per-row dicts.
+
+A Record stores age group and gender as small integer codes into AGE_GROUPS
+and GENDERS, and body systems and symptoms as bitmasks whose bit order is
+ALL_SYSTEMS and symptom_keywords. Aggregation counts the codes directly and
+names are only decoded for the JSON outputs. Bit order is the list order,
+so decoded lists come back in the same order make_record produced.
+"""
+
+import sys
+from functools import lru_cache
+
+import numpy as np
+
+from demographics import extract_demographics
+from extractors import AGE_GROUPS, ALL_SYSTEMS, GENDERS, keyword_ids, keyword_matcher, symptom_keywords
+
+AGE_GROUP_CODES = {age_group: i for i, age_group in enumerate(AGE_GROUPS)}
+GENDER_CODES = {gender: i for i, gender in enumerate(GENDERS)}
+SYSTEM_CODES = {system: i for i, system in enumerate(ALL_SYSTEMS)}
+UNKNOWN_GENDER = GENDER_CODES['Unknown']
+
+SYSTEM_BITS = {system: 1 << i for i, system in enumerate(ALL_SYSTEMS)}
+SYMPTOM_BITS = {symptom: 1 << i for i, symptom in enumerate(symptom_keywords)}
+GENERAL_BIT = SYSTEM_BITS['General/Other']
+
+
+def mask(values, bits):
+    result = 0
+    for value in values:
+        result |= bits[value]
+    return result
+
+
+@lru_cache(maxsize=4096)
+def bit_codes(value):
+    """Positions of the set bits, lowest first; masks repeat, so they are cached"""
+    return tuple(i for i in range(value.bit_length()) if value >> i & 1)
+
+
+# ============================================================
+# RECORD
+# ============================================================
+
+class Record:
+    """One processed row with coded categories; to_dict() gives the processed_data entry"""
+
+    __slots__ = (
+        'id', 'question', 'answer', 'age', 'age_code', 'gender_code', 'systems', 'symptoms', 'question_length'
+    )
+
+    def __init__(self, idx, question, answer, age, age_code, gender_code, systems, symptoms, question_length):
+        self.id = idx
+        self.question = question
+        self.answer = answer
+        self.age = age
+        self.age_code = age_code
+        self.gender_code = gender_code
+        self.systems = systems
+        self.symptoms = symptoms
+        self.question_length = question_length
+
+    @property
+    def primary_code(self):
+        # Lowest set bit: the first system in ALL_SYSTEMS order
+        return (self.systems & -self.systems).bit_length() - 1
+
+    @classmethod
+    def from_dict(cls, item):
+        return cls(
+            item['id'], item['question'], item['answer'], item['age'],
+            AGE_GROUP_CODES[item['age_group']], GENDER_CODES[item['gender']],
+            mask(item['body_systems'], SYSTEM_BITS), mask(item['symptoms'], SYMPTOM_BITS),
+            item['question_length']
+        )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'question': self.question,
+            'answer': self.answer,
+            'age': self.age,
+            'age_group': AGE_GROUPS[self.age_code],
+            'gender': GENDERS[self.gender_code],
+            'body_systems': [ALL_SYSTEMS[i] for i in bit_codes(self.systems)],
+            'primary_system': ALL_SYSTEMS[self.primary_code],
+            'symptoms': [symptom_keywords[i] for i in bit_codes(self.symptoms)],
+            'question_length': self.question_length
+        }
+
+    def __repr__(self):
+        return f"Record({self.to_dict()!r})"
+
+
+def compact_record(idx, question, answer, age, age_code, gender_code, systems, symptoms):
+    """make_record with codes and bitmasks; repeated answers share one interned string"""
+    return Record(
+        idx,
+        question[:200] + '...' if len(question) > 200 else question,  # Truncate for JSON size
+        sys.intern(answer),
+        age, age_code, gender_code, systems or GENERAL_BIT, symptoms,
+        len(question.split())
+    )
+
+
+class RecordColumns:
+    """A chunk of records as columns: numpy codes and bitmasks, with the text as lists
+
+    Aggregation, the cube and the stratified sample read the columns, so a
+    chunk extracted column by column never has to become Records; record(row)
+    builds one only for the rows that are kept (processed_data.json, samples).
+    """
+
+    def __init__(self, ids, questions, answers, ages, age_codes, gender_codes, system_masks, symptom_masks,
+                 records=None):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.questions = questions  # full question text
+        self.answers = answers
+        self.ages = np.asarray(ages, dtype=np.int64)  # -1 where no age was found
+        self.age_codes = np.asarray(age_codes, dtype=np.int64)
+        self.gender_codes = np.asarray(gender_codes, dtype=np.int64)
+        self.system_masks = np.asarray(system_masks, dtype=np.uint64)
+        self.symptom_masks = np.asarray(symptom_masks, dtype=np.uint64)
+        self._records = records
+
+    @classmethod
+    def from_records(cls, records):
+        return cls(
+            [r.id for r in records], [r.question for r in records], [r.answer for r in records],
+            [-1 if r.age is None else r.age for r in records], [r.age_code for r in records],
+            [r.gender_code for r in records], [r.systems for r in records], [r.symptoms for r in records],
+            records
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def has_age(self):
+        return self.ages >= 0
+
+    def question(self, row):
+        """A row's question as stored in its Record"""
+        if self._records is not None:
+            return self._records[row].question
+        question = self.questions[row]
+        return question[:200] + '...' if len(question) > 200 else question
+
+    def record(self, row):
+        if self._records is not None:
+            return self._records[row]
+        age = int(self.ages[row])
+        return compact_record(
+            int(self.ids[row]), self.questions[row], self.answers[row], None if age < 0 else age,
+            int(self.age_codes[row]), int(self.gender_codes[row]), int(self.system_masks[row]),
+            int(self.symptom_masks[row])
+        )
+
+    def records(self, rows=None):
+        """Records of the given rows, or of every row"""
+        if rows is None:
+            if self._records is not None:
+                return self._records
+            rows = range(len(self))
+        return [self.record(row) for row in rows]
+
+
+def encode_record(idx, question, answer, age, age_group, gender, body_sys, symptoms):
+    """Same arguments as extractors.make_record, returning a Record"""
+    return compact_record(
+        idx, question, answer, age, AGE_GROUP_CODES[age_group], GENDER_CODES[gender],
+        mask(body_sys, SYSTEM_BITS), mask(symptoms, SYMPTOM_BITS)
+    )
+
+
+# ============================================================
+# EXTRACTION
+# ============================================================
+
+# Keyword matcher label id -> its system bit and symptom bit
+_system_bit = [SYSTEM_BITS[name] if kind == 'system' else 0 for kind, name in keyword_matcher.labels]
+_symptom_bit = [SYMPTOM_BITS[name] if kind == 'symptom' else 0 for kind, name in keyword_matcher.labels]
+
+def extract_masks(question, answer):
+    """extract_systems_and_symptoms, returning (systems bitmask, symptoms bitmask)"""
+    system_ids, symptom_ids = keyword_ids(question, answer)
+    systems = symptoms = 0
+    for i in system_ids:
+        systems |= _system_bit[i]
+    for i in symptom_ids:
+        symptoms |= _symptom_bit[i]
+    return systems or GENERAL_BIT, symptoms
+
+
+def extract_record(idx, question, answer):
+    """extractors.extract_record, returning a Record"""
+    found = extract_demographics(question)
+    systems, symptoms = extract_masks(question, answer)
+    return compact_record(
+        idx, question, answer, found.age, AGE_GROUP_CODES[found.age_group], GENDER_CODES[found.gender],
+        systems, symptoms
+    )
@@ -0,0 +1,28 @@
+"""Original keyword-scan extractors, kept as the reference for equivalence checks"""
+
+from extractors import body_systems, symptom_keywords
+
+
+def extract_body_systems(text):
+    """Extract body systems mentioned in text"""
+    text = text.lower()
+    systems = []
+    
+    for system, data in body_systems.items():
+        for keyword in data['keywords']:
+            if keyword in text:
+                systems.append(system)
+                break
+    
+    return systems if systems else ['General/Other']
+
+def extract_symptoms(text):
+    """Extract symptoms from text"""
+    text = text.lower()
+    found_symptoms = []
+    
+    for symptom in symptom_keywords:
+        if symptom in text:
+            found_symptoms.append(symptom)
+    
+    return found_symptoms
@@ -0,0 +1,117 @@
+"""Deterministic stratified sample of records for processed_data.json and sample_questions.
+
+Without it processed_data.json holds the first 1000 records and each body
+system's sample_questions its first three, both taken from the top of the
+file. A StratifiedSample instead keeps, for every body system x age group x
+gender stratum, the per_stratum records with the smallest priority, where a
+record's priority is a seeded 64-bit hash of its id.
+
+Keeping the k smallest hashes (bottom-k) is reservoir sampling that merges:
+the sample of a union is the k smallest of the partial samples, so chunks
+and worker partials can be sampled independently and merged in any order.
+The result depends only on the seed and the record ids, not on chunking or
+worker count, and the sample stays per_stratum records per stratum however
+large the input grows. A record is a candidate in each of its body systems.
+"""
+
+import heapq
+
+import numpy as np
+
+from extractors import AGE_GROUPS, ALL_SYSTEMS, GENDERS
+from matrix_aggregation import bit_matrix
+from sketches import mix64
+
+N_AGES = len(AGE_GROUPS)
+N_GENDERS = len(GENDERS)
+
+
+def _priority(entry):
+    return entry[0]
+
+
+class StratifiedSample:
+    """Bottom-k sample per (body system, age group, gender); merge partials in any order"""
+
+    def __init__(self, per_stratum=5, seed=0):
+        self.per_stratum = per_stratum
+        self.seed = seed
+        self.strata = {}  # stratum code -> [(priority, Record)], lowest priority first
+
+    def priorities(self, ids):
+        """Seeded hash of each record id; a bijection, so distinct ids never tie"""
+        salt = mix64(np.array([self.seed + 1], dtype=np.uint64))[0]
+        return mix64(np.asarray(ids, dtype=np.int64).astype(np.uint64) ^ salt)
+
+    def add_columns(self, ids, age_codes, gender_codes, system_masks, record_at):
+        """Sample one chunk given as column arrays; record_at(row) returns a row's Record
+
+        Only the rows that win a place in some stratum are turned into Records.
+        """
+        if not len(ids):
+            return self
+        priorities = self.priorities(ids)
+        rows, systems = np.nonzero(bit_matrix(system_masks, len(ALL_SYSTEMS)))
+        strata = (systems * N_AGES + np.asarray(age_codes, dtype=np.int64)[rows]) * N_GENDERS + \
+            np.asarray(gender_codes, dtype=np.int64)[rows]
+        # Each stratum's rows by priority, then the first per_stratum of each
+        order = np.lexsort((priorities[rows], strata))
+        sorted_strata = strata[order]
+        starts = np.flatnonzero(np.r_[True, sorted_strata[1:] != sorted_strata[:-1]])
+        rank = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+        winners = order[rank < self.per_stratum]
+
+        records = {}
+        partial = {}
+        for row, stratum in zip(rows[winners].tolist(), strata[winners].tolist()):
+            record = records.get(row)
+            if record is None:
+                record = records[row] = record_at(row)
+            partial.setdefault(stratum, []).append((int(priorities[row]), record))
+        return self._fold(partial)
+
+    @classmethod
+    def from_records(cls, records, per_stratum=5, seed=0):
+        return cls(per_stratum, seed).add_columns(
+            [r.id for r in records], [r.age_code for r in records], [r.gender_code for r in records],
+            [r.systems for r in records], records.__getitem__
+        )
+
+    @classmethod
+    def from_columns(cls, columns, per_stratum=5, seed=0):
+        """Sample of a records.RecordColumns chunk; Records are built only for the rows kept"""
+        return cls(per_stratum, seed).add_columns(
+            columns.ids, columns.age_codes, columns.gender_codes, columns.system_masks, columns.record
+        )
+
+    def _fold(self, strata):
+        for stratum, entries in strata.items():
+            mine = self.strata.get(stratum)
+            self.strata[stratum] = entries if mine is None else \
+                heapq.nsmallest(self.per_stratum, mine + entries, key=_priority)
+        return self
+
+    def merge(self, other):
+        if (self.per_stratum, self.seed) != (other.per_stratum, other.seed):
+            raise ValueError("Stratified samples with different sizes or seeds cannot be merged")
+        return self._fold(other.strata)
+
+    def records(self):
+        """Every sampled record once, in input (id) order"""
+        by_id = {record.id: record for entries in self.strata.values() for _, record in entries}
+        return [by_id[idx] for idx in sorted(by_id)]
+
+    def system_questions(self, system, n=3):
+        """n questions of one body system, taking one from each of its age/gender strata in turn"""
+        strata = sorted(
+            (entries for stratum, entries in self.strata.items() if stratum // (N_AGES * N_GENDERS) == system),
+            key=lambda entries: entries[0][0]
+        )
+        questions = []
+        for i in range(max(map(len, strata), default=0)):
+            for entries in strata:
+                if i < len(entries):
+                    questions.append(entries[i][1].question)
+                    if len(questions) == n:
+                        return questions
+        return questions
@@ -0,0 +1,78 @@
+"""Sankey construction with heap top-k selection and dict-indexed nodes"""
+
+import heapq
+
+from extractors import ALL_SYSTEMS, symptom_keywords
+
+
+def top_flows(counts, top_k=100, min_count=1):
+    """Return the top_k ((source, target), count) items with count >= min_count
+
+    Equivalent to a stable sort by count, so ties keep first-seen order exactly
+    as the previous full sort did; merged partials preserve that order too.
+    """
+    candidates = ((pair, count) for pair, count in counts.items() if count >= min_count)
+    return heapq.nlargest(top_k, candidates, key=lambda item: item[1])
+
+
+class SankeyBuilder:
+    """Assigns stable node ids through a dict index as flows are added"""
+
+    def __init__(self):
+        self.nodes = []
+        self.links = []
+        self._index = {}
+
+    def node(self, name, node_type):
+        key = (node_type, name)
+        idx = self._index.get(key)
+        if idx is None:
+            idx = self._index[key] = len(self.nodes)
+            self.nodes.append({"name": name, "type": node_type})
+        return idx
+
+    def add_flows(self, flows, source_type, target_type):
+        for (source, target), count in flows:
+            self.links.append({
+                "source": self.node(source, source_type),
+                "target": self.node(target, target_type),
+                "value": count
+            })
+
+    def to_json(self):
+        return {"nodes": self.nodes, "links": self.links}
+
+
+def build_sankey(agg, top_k=100, min_count=1, levels=2):
+    """Symptom -> diagnosis flows, or symptom -> body system -> diagnosis with levels=3
+
+    Two levels use the symptom/answer pair counts (first 3 symptoms per
+    question). Three levels use the per-system symptom and condition counters,
+    with top_k flows selected for each hop.
+    """
+    builder = SankeyBuilder()
+    if levels == 2:
+        flows = [((symptom_keywords[symptom], answer), count)
+                 for (symptom, answer), count in top_flows(agg.pairs, top_k, min_count)]
+        # Symptoms first, then diagnoses, each in order of their heaviest flow
+        for (symptom, _), _ in flows:
+            builder.node(symptom, "symptom")
+        builder.add_flows(flows, "symptom", "diagnosis")
+    elif levels == 3:
+        symptom_system = {}
+        system_diagnosis = {}
+        for code, stats in agg.systems.items():
+            system = ALL_SYSTEMS[code]
+            for symptom, count in stats.symptoms.items():
+                symptom_system[(symptom_keywords[symptom], system)] = count
+            for answer, count in stats.conditions.items():
+                system_diagnosis[(system, answer)] = count
+        first_hop = top_flows(symptom_system, top_k, min_count)
+        second_hop = top_flows(system_diagnosis, top_k, min_count)
+        for (symptom, _), _ in first_hop:
+            builder.node(symptom, "symptom")
+        builder.add_flows(first_hop, "symptom", "body_system")
+        builder.add_flows(second_hop, "body_system", "diagnosis")
+    else:
+        raise ValueError(f"levels must be 2 or 3, not {levels!r}")
+    return builder.to_json()
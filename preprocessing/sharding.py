@@ -0,0 +1,217 @@
+"""Split extraction and aggregation across a process pool"""
+
+import multiprocessing
+from collections import deque
+
+import pandas as pd
+
+import matrix_aggregation
+import vectorized
+from aggregation import Aggregates, aggregate_records
+from extraction_cache import ExtractionCache, table_version
+from demographics import extract_demographics
+from extractors import (
+    age_patterns, body_systems, extract_body_systems, extract_symptoms, female_patterns, male_patterns,
+    symptom_keywords
+)
+from records import RecordColumns, encode_record, extract_record
+from vectorized import as_text
+
+QUESTION_COL = 'Open-ended Verifiable Question'
+ANSWER_COL = 'Ground-True Answer'
+
+# counters: per-record Counter updates; matrix: one count per cross-tab over bitmask matrices
+AGGREGATORS = {
+    'counters': lambda columns, head_size: aggregate_records(columns.records(), head_size),
+    'matrix': matrix_aggregation.aggregate_record_columns,
+}
+
+
+def worker_pool(workers):
+    """A process pool that is safe to start while other threads run (pipeline.py runs stages in threads)
+
+    A forked child inherits every lock another thread held at fork time and
+    can hang on it, so workers are started from a forkserver, or spawned
+    where there is none.
+    """
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return multiprocessing.get_context(method).Pool(workers)
+
+
+def _lower(values):
+    return as_text(pd.Series(values, dtype=object)).str.lower()
+
+
+def _columnar_ages(questions, answers):
+    ages, age_groups = vectorized.extract_ages(_lower(questions))
+    return list(zip(ages, age_groups))
+
+
+def _columnar_genders(questions, answers):
+    return vectorized.extract_genders(_lower(questions)).tolist()
+
+
+def _columnar_systems(questions, answers):
+    return vectorized.extract_body_systems(_lower(questions) + " " + _lower(answers))
+
+
+def _columnar_symptoms(questions, answers):
+    return vectorized.extract_symptoms(_lower(questions))
+
+
+def record_fields(engine='rows'):
+    """Cacheable extraction fields: name -> (version, compute(questions, answers))"""
+    versions = {
+        'age': table_version(age_patterns),
+        'gender': table_version(male_patterns, female_patterns),
+        'systems': table_version({system: data['keywords'] for system, data in body_systems.items()}),
+        'symptoms': table_version(symptom_keywords),
+    }
+    if engine == 'columnar':
+        compute = {
+            'age': _columnar_ages,
+            'gender': _columnar_genders,
+            'systems': _columnar_systems,
+            'symptoms': _columnar_symptoms,
+        }
+    else:
+        compute = {
+            'age': lambda qs, ans: [(d.age, d.age_group) for d in map(extract_demographics, qs)],
+            'gender': lambda qs, ans: [extract_demographics(q).gender for q in qs],
+            'systems': lambda qs, ans: [extract_body_systems(q + " " + a) for q, a in zip(qs, ans)],
+            'symptoms': lambda qs, ans: [extract_symptoms(q) for q in qs],
+        }
+    return {field: (versions[field], compute[field]) for field in versions}
+
+
+def extract_chunk(chunk, engine='rows', cache_path=None):
+    """Extract compact Records from a DataFrame chunk, keeping its row index as id
+
+    With cache_path, fields already extracted for identical rows are read from
+    the extraction cache and only new or changed rows are processed.
+    """
+    if cache_path:
+        questions = [str(q) for q in chunk[QUESTION_COL]]
+        answers = [str(a) for a in chunk[ANSWER_COL]]
+        cache = ExtractionCache(cache_path)
+        try:
+            fields = cache.extract(questions, answers, record_fields(engine))
+        finally:
+            cache.close()
+        return [
+            encode_record(idx, question, answer, age, age_group, gender, body_sys, symptoms)
+            for idx, question, answer, (age, age_group), gender, body_sys, symptoms in zip(
+                chunk.index, questions, answers,
+                fields['age'], fields['gender'], fields['systems'], fields['symptoms']
+            )
+        ]
+    if engine == 'columnar':
+        return vectorized.extract_records(chunk[QUESTION_COL], chunk[ANSWER_COL])
+    return [
+        extract_record(idx, str(question), str(answer))
+        for idx, question, answer in zip(chunk.index, chunk[QUESTION_COL], chunk[ANSWER_COL])
+    ]
+
+
+def extract_chunk_columns(chunk, engine='rows', cache_path=None):
+    """extract_chunk as records.RecordColumns; the columnar engine never builds Records for it"""
+    if engine == 'columnar' and not cache_path:
+        return vectorized.extract_columns(chunk[QUESTION_COL], chunk[ANSWER_COL])
+    return RecordColumns.from_records(extract_chunk(chunk, engine, cache_path))
+
+
+def aggregate_partial(columns, aggregation='counters', head_size=1000, sketch=None, cube=None, sample=None,
+                      top_symptoms=None):
+    """Aggregates of one extracted chunk, with its sketches, cube and sample as requested"""
+    partial = AGGREGATORS[aggregation](columns, head_size)
+    if sketch is not None:
+        from sketches import sketch_aggregates
+        sketch_aggregates(partial, **sketch)
+    if cube is not None:
+        from cube import Cube
+        partial.cube = Cube.from_columns(columns, top_symptoms=top_symptoms, **cube)
+    if sample is not None:
+        from sampling import StratifiedSample
+        partial.sample = StratifiedSample.from_columns(columns, **sample)
+    return partial
+
+
+def aggregate_chunk(task):
+    """Worker entry point: (chunk, options) -> (partial Aggregates, Arrow batch or None)"""
+    chunk, options = task
+    columns = extract_chunk_columns(chunk, options['engine'], options.get('cache_path'))
+    batch = None
+    if options.get('extracted'):
+        from columnar_store import records_to_batch
+        batch = records_to_batch(columns.records())
+    partial = aggregate_partial(
+        columns, options.get('aggregation', 'counters'), options['head_size'], options.get('sketch'),
+        options.get('cube'), options.get('sample')
+    )
+    return partial, batch
+
+
+def iter_chunks(df, chunk_rows):
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+def read_chunks(path, chunk_rows):
+    """Stream a CSV in chunks; row ids continue across chunks as in a full read"""
+    return pd.read_csv(path, chunksize=chunk_rows)
+
+
+def aggregate_chunks(chunks, workers=1, engine='rows', head_size=1000, cache_path=None, writer=None,
+                     aggregation='counters', cube=None, sketch=None, sample=None):
+    """Fold each chunk into one Aggregates as soon as it is extracted
+
+    Only the running aggregates and at most 2 * workers chunks in flight are
+    held in memory, so a streamed input never has to fit in RAM. With a
+    columnar_store.ExtractedWriter, every chunk's records are also appended to
+    the extracted file in input order. With cube, a dict of cube.Cube
+    parameters, each partial also carries a cube for the drill-down slices,
+    with a bounded number of conditions per cell. With sketch, a dict of
+    sketches.HeavyHitters parameters, each partial's answer-keyed counters
+    become fixed-size sketches before they are merged. With sample, a dict of
+    sampling.StratifiedSample parameters, each partial also carries its
+    stratified sample.
+    """
+    result = Aggregates(head_size)
+    options = {
+        'engine': engine, 'head_size': head_size, 'cache_path': cache_path,
+        'extracted': writer is not None, 'aggregation': aggregation, 'cube': cube, 'sketch': sketch,
+        'sample': sample,
+    }
+
+    def fold(output):
+        partial, batch = output
+        if writer is not None:
+            writer.write_batch(batch)
+        result.merge(partial)
+        print(f"Processed {result.total} rows...")
+
+    if workers <= 1:
+        for chunk in chunks:
+            fold(aggregate_chunk((chunk, options)))
+        return result
+
+    with worker_pool(workers) as pool:
+        # Bounded in-flight queue: Pool.imap would read the whole input ahead
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(aggregate_chunk, ((chunk, options),)))
+            if len(pending) >= 2 * workers:
+                fold(pending.popleft().get())
+        while pending:
+            fold(pending.popleft().get())
+    return result
+
+
+def run_sharded(df, workers, engine='rows', chunk_rows=20000, head_size=1000, cache_path=None, writer=None,
+                aggregation='counters', cube=None, sketch=None, sample=None):
+    """Extract and aggregate an in-memory df with a pool of workers"""
+    # Results are merged in chunk order, so counters match a serial run
+    return aggregate_chunks(
+        iter_chunks(df, chunk_rows), workers, engine, head_size, cache_path, writer, aggregation, cube, sketch,
+        sample
+    )
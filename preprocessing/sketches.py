@@ -0,0 +1,268 @@
+"""Fixed-memory, mergeable sketches for the counters keyed on free-text answers.
+
+The per-system condition counters and the symptom -> diagnosis pair counter
+grow with the number of distinct answers. With --sketch, each chunk's exact
+counters are folded into a HeavyHitters instead, whose size does not depend
+on the input:
+
+- a Misra-Gries / Space-Saving summary keeps at most `capacity` candidate
+  keys; a kept count is never above the true count and never more than
+  `offset` (at most N / (capacity + 1)) below it
+- a Count-Min sketch (width e/epsilon, depth ln(1/delta)) bounds every count
+  from above by true + epsilon * N with probability 1 - delta
+- a HyperLogLog (2**precision registers) estimates the number of distinct
+  keys with a relative standard error of 1.04 / sqrt(2**precision)
+
+A reported count is the smaller of the two upper bounds. While a counter
+has seen no more than `capacity` distinct keys nothing is evicted, and counts
+and most_common order equal those of the exact Counter.
+
+All three merge by addition or maximum, so chunk or worker partials merge in
+any order; hashes are stable across processes (blake2b, not hash()).
+"""
+
+import hashlib
+import math
+
+import numpy as np
+
+DEFAULTS = {'capacity': 2000, 'epsilon': 0.001, 'delta': 0.01, 'precision': 12}
+
+_MASK32 = np.uint64(0xFFFFFFFF)
+
+
+def mix64(values):
+    """splitmix64 finalizer over a uint64 array"""
+    x = values.astype(np.uint64)
+    x ^= x >> np.uint64(30)
+    x *= np.uint64(0xBF58476D1CE4E5B9)
+    x ^= x >> np.uint64(27)
+    x *= np.uint64(0x94D049BB133111EB)
+    x ^= x >> np.uint64(31)
+    return x
+
+
+def hash_text(values):
+    """Stable 64-bit hashes of strings as a uint64 array"""
+    return np.array(
+        [int.from_bytes(hashlib.blake2b(v.encode('utf-8', 'surrogatepass'), digest_size=8).digest(), 'little')
+         for v in values],
+        dtype=np.uint64
+    )
+
+
+def _bit_length(values):
+    """Bit length of each uint64, vectorized"""
+    values = values.copy()
+    lengths = np.zeros(len(values), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        high = values >= (np.uint64(1) << np.uint64(shift))
+        lengths[high] += shift
+        values[high] >>= np.uint64(shift)
+    return lengths + (values > 0)
+
+
+class CountMinSketch:
+    """depth x width table of counters; estimates never undercount"""
+
+    def __init__(self, epsilon=DEFAULTS['epsilon'], delta=DEFAULTS['delta']):
+        self.epsilon = epsilon
+        self.delta = delta
+        self.width = math.ceil(math.e / epsilon)
+        self.depth = math.ceil(math.log(1 / delta))
+        self.table = np.zeros((self.depth, self.width), dtype=np.int64)
+
+    def _columns(self, hashes):
+        # Double hashing: row i uses h1 + i * h2
+        h1 = hashes & _MASK32
+        h2 = (hashes >> np.uint64(32)) | np.uint64(1)
+        width = np.uint64(self.width)
+        return [((h1 + np.uint64(i) * h2) % width).astype(np.int64) for i in range(self.depth)]
+
+    def add(self, hashes, counts):
+        counts = np.asarray(counts, dtype=np.float64)
+        for row, columns in zip(self.table, self._columns(hashes)):
+            row += np.bincount(columns, weights=counts, minlength=self.width).astype(np.int64)
+
+    def estimate(self, hashes):
+        return np.min([row[columns] for row, columns in zip(self.table, self._columns(hashes))], axis=0)
+
+    def merge(self, other):
+        if (self.width, self.depth) != (other.width, other.depth):
+            raise ValueError("Count-Min sketches with different epsilon/delta cannot be merged")
+        self.table += other.table
+        return self
+
+
+class HyperLogLog:
+    """Distinct count estimate from 2**precision max-rank registers"""
+
+    def __init__(self, precision=DEFAULTS['precision']):
+        if not 4 <= precision <= 18:
+            raise ValueError(f"HyperLogLog precision must be between 4 and 18, not {precision}")
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add(self, hashes):
+        if not len(hashes):
+            return
+        p = np.uint64(self.precision)
+        index = (hashes >> (np.uint64(64) - p)).astype(np.int64)
+        rest = hashes << p
+        # Rank: position of the first 1 bit of the remaining 64 - p bits
+        rank = np.where(rest == 0, 64 - self.precision + 1, 65 - _bit_length(rest)).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def merge(self, other):
+        if self.precision != other.precision:
+            raise ValueError("HyperLogLogs with different precision cannot be merged")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+
+def eviction_thresholds(groups, counts, capacity):
+    """Misra-Gries threshold of every entry's group: the group's (capacity + 1)-th largest count
+
+    groups and counts are parallel arrays, one entry per key; a group with at
+    most capacity keys has threshold 0. Keeping the entries above their
+    threshold, less the threshold, is one eviction step for every group.
+    """
+    if not len(counts):
+        return np.zeros(0, dtype=np.int64)
+    order = np.lexsort((-counts, groups))
+    sorted_groups = groups[order]
+    starts = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]])
+    sizes = np.diff(np.r_[starts, len(order)])
+    at = np.minimum(starts + capacity, len(order) - 1)
+    per_group = np.where(sizes > capacity, counts[order[at]], 0)
+    thresholds = np.empty(len(counts), dtype=np.int64)
+    thresholds[order] = np.repeat(per_group, sizes)
+    return thresholds
+
+
+class HeavyHitters:
+    """Counter-like top-k summary: Space-Saving candidates, Count-Min counts, HyperLogLog distinct
+
+    Supports the Counter calls the output builders make: most_common(n),
+    items() and len(). Keys are answers or (symptom code, answer) pairs.
+    """
+
+    def __init__(self, capacity=DEFAULTS['capacity'], epsilon=DEFAULTS['epsilon'], delta=DEFAULTS['delta'],
+                 precision=DEFAULTS['precision']):
+        self.capacity = capacity
+        self.counts = {}  # candidate key -> lower bound, in first-seen order
+        self.hashes = {}  # candidate key -> its 64-bit hash
+        self.offset = 0  # total subtracted by evictions; true count <= count + offset
+        self.total = 0
+        self.cms = CountMinSketch(epsilon, delta)
+        self.hll = HyperLogLog(precision)
+
+    @classmethod
+    def from_counts(cls, keys, counts, hashes, **params):
+        """Summary of exact counts; keys in first-seen order, hashes a matching uint64 array"""
+        sketch = cls(**params)
+        sketch.total = int(np.sum(counts))
+        sketch.cms.add(hashes, counts)
+        sketch.hll.add(hashes)
+        sketch.counts = dict(zip(keys, counts))
+        sketch.hashes = dict(zip(keys, hashes.tolist()))
+        sketch._evict()
+        return sketch
+
+    def _evict(self):
+        """Misra-Gries step: subtract the (capacity + 1)-th largest count and drop what reaches zero"""
+        if len(self.counts) <= self.capacity:
+            return
+        values = np.fromiter(self.counts.values(), dtype=np.int64, count=len(self.counts))
+        threshold = int(eviction_thresholds(np.zeros(len(values), dtype=np.int64), values, self.capacity)[0])
+        self.counts = {key: count - threshold for key, count in self.counts.items() if count > threshold}
+        self.hashes = {key: self.hashes[key] for key in self.counts}
+        self.offset += threshold
+
+    def merge(self, other):
+        if self.capacity != other.capacity:
+            raise ValueError("HeavyHitters with different capacities cannot be merged")
+        self.total += other.total
+        self.offset += other.offset
+        self.cms.merge(other.cms)
+        self.hll.merge(other.hll)
+        counts = self.counts
+        for key, count in other.counts.items():
+            counts[key] = counts.get(key, 0) + count
+        self.hashes.update(other.hashes)
+        self._evict()
+        return self
+
+    def items(self):
+        """(key, estimated count) for every candidate, in first-seen order"""
+        if not self.counts:
+            return []
+        hashes = np.fromiter(self.hashes.values(), dtype=np.uint64, count=len(self.hashes))
+        # hashes and counts hold the same keys in the same order
+        upper = np.fromiter(self.counts.values(), dtype=np.int64, count=len(self.counts)) + self.offset
+        estimates = np.minimum(upper, self.cms.estimate(hashes))
+        return list(zip(self.counts, estimates.tolist()))
+
+    def most_common(self, n=None):
+        ranked = sorted(self.items(), key=lambda item: item[1], reverse=True)
+        return ranked if n is None else ranked[:n]
+
+    def distinct(self):
+        return self.hll.count()
+
+    def error_bound(self):
+        """Largest possible overcount: the eviction offset, or epsilon * N (probability 1 - delta)"""
+        return min(self.offset, math.ceil(self.cms.epsilon * self.total))
+
+    def __len__(self):
+        return len(self.counts)
+
+
+# ============================================================
+# AGGREGATES
+# ============================================================
+
+def sketch_aggregates(agg, **params):
+    """Replace a partial's answer-keyed Counters with HeavyHitters, in place"""
+    params = dict(DEFAULTS, **params)
+    answers = {}
+    for stats in agg.systems.values():
+        answers.update(dict.fromkeys(stats.conditions))
+    answers.update(dict.fromkeys(answer for _, answer in agg.pairs))
+    answer_hash = dict(zip(answers, hash_text(list(answers)).tolist()))
+
+    for stats in agg.systems.values():
+        if isinstance(stats.conditions, HeavyHitters):
+            continue
+        keys = list(stats.conditions)
+        hashes = np.array([answer_hash[key] for key in keys], dtype=np.uint64)
+        stats.conditions = HeavyHitters.from_counts(keys, list(stats.conditions.values()), hashes, **params)
+
+    if not isinstance(agg.pairs, HeavyHitters):
+        keys = list(agg.pairs)
+        symptoms = np.array([symptom for symptom, _ in keys], dtype=np.uint64)
+        hashes = mix64(np.array([answer_hash[answer] for _, answer in keys], dtype=np.uint64)
+                       ^ mix64(symptoms + np.uint64(1)))
+        agg.pairs = HeavyHitters.from_counts(keys, list(agg.pairs.values()), hashes, **params)
+    return agg
+
+
+def distinct_answers(agg):
+    """Estimated distinct diagnoses across every body system (HyperLogLog union)"""
+    union = None
+    for stats in agg.systems.values():
+        hll = stats.conditions.hll
+        if union is None:
+            union = HyperLogLog(hll.precision)
+        union.merge(hll)
+    return union.count() if union is not None else 0
@@ -0,0 +1,95 @@
+"""Seeded generator of synthetic medical-question rows for benchmarks.
+
+Rows follow the schema of data/medical_questions.csv ('Open-ended Verifiable
+Question', 'Ground-True Answer') and of the Hugging Face split used by
+extracted_features2.py ('Question', 'Response'), so both scripts can run
+offline on any number of rows.
+
+Usage:
+    python preprocessing/synthetic.py 100000 data/medical_questions.csv [--seed 0]
+"""
+
+import argparse
+import random
+
+import pandas as pd
+
+from extractors import body_systems, symptom_keywords
+
+PATIENTS = [
+    'man', 'woman', 'boy', 'girl', 'male', 'female', 'patient', 'gentleman', 'lady',
+    'pregnant woman', 'infant', 'child', 'husband', 'wife', 'father', 'mother'
+]
+AGE_PHRASES = [
+    '{n}-year-old', '{n} year old', '{n}-month-old', '{n} week old', '{n}-day-old', 'aged {n}', ''
+]
+EXTRA_TERMS = [
+    'aspirin', 'insulin', 'metoprolol', 'antibiotic', 'smoker', 'obese', 'cholesterol',
+    'family history', 'ecg', 'blood test', 'mri', 'ct scan', 'surgery', 'angioplasty',
+    'dialysis', 'inhaler', 'heart attack', 'myocardial infarction', 'diabetes', 'asthma',
+    'hypertension', 'high blood pressure', 'stroke', 'dyspnea', 'stress', 'virus'
+]
+DIAGNOSES = [
+    'Gastric ulcer', 'Myocardial infarction', 'Pneumonia', 'Migraine', 'Type 2 diabetes mellitus',
+    'Acute appendicitis', 'Iron deficiency anemia', 'Hypothyroidism', 'Major depressive disorder',
+    'Osteoarthritis', 'Psoriasis', 'Pyelonephritis', 'Preeclampsia', 'Glaucoma', 'Otitis media',
+    'Tuberculosis', 'Sepsis', 'Cirrhosis', 'Asthma exacerbation', 'Atrial fibrillation'
+]
+FILLER = [
+    'presents with', 'reports', 'has a history of', 'is brought in with', 'complains of',
+    'was found to have', 'shows', 'after two days of'
+]
+
+
+class SyntheticCorpus:
+    """Deterministic stream of synthetic rows for a given seed"""
+
+    def __init__(self, seed=0, n_diagnoses=2000):
+        self.rng = random.Random(seed)
+        self.system_keywords = [k for data in body_systems.values() for k in data['keywords']]
+        # A long tail of distinct answers, like the free-text ground truths
+        self.diagnoses = DIAGNOSES + [f"{self.rng.choice(DIAGNOSES)} type {i}" for i in range(n_diagnoses)]
+
+    def row(self):
+        rng = self.rng
+        age = rng.choice(AGE_PHRASES).format(n=rng.randint(1, 95))
+        terms = (
+            rng.sample(symptom_keywords, rng.randint(0, 3)) +
+            rng.sample(self.system_keywords, rng.randint(0, 3)) +
+            rng.sample(EXTRA_TERMS, rng.randint(0, 2))
+        )
+        rng.shuffle(terms)
+        question = (
+            f"A {age} {rng.choice(PATIENTS)} {rng.choice(FILLER)} {', '.join(terms) or 'nonspecific complaints'}. "
+            f"{rng.choice(['His', 'Her', 'The'])} vitals are stable. What is the most likely diagnosis?"
+        )
+        # Skewed answer distribution so top-k lists have clear heavy hitters
+        answer = self.diagnoses[min(int(rng.paretovariate(1.2)) - 1, len(self.diagnoses) - 1)]
+        response = f"The findings suggest {answer.lower()}. {' '.join(rng.sample(EXTRA_TERMS, 2))}."
+        return question, answer, response
+
+    def frame(self, n_rows):
+        """DataFrame with both the CSV and the Hugging Face column names"""
+        rows = [self.row() for _ in range(n_rows)]
+        questions, answers, responses = zip(*rows) if rows else ((), (), ())
+        return pd.DataFrame({
+            'Open-ended Verifiable Question': questions,
+            'Ground-True Answer': answers,
+            'Question': questions,
+            'Response': responses,
+        })
+
+
+def generate(n_rows, seed=0):
+    return SyntheticCorpus(seed).frame(n_rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Write a synthetic medical_questions.csv")
+    parser.add_argument('rows', type=int)
+    parser.add_argument('output')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    generate(args.rows, args.seed).to_csv(args.output, index=False)
+    print(f"Saved: {args.output} ({args.rows} rows, seed {args.seed})")
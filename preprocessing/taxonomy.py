@@ -0,0 +1,165 @@
+"""Versioned keyword taxonomies and their compiled matchers, cached on disk by hash.
+
+The keyword tables live in JSON files under preprocessing/taxonomies/, or
+under the directory named by the TAXONOMY_DIR environment variable:
+
+    body_systems.json   body systems with their keywords and colors
+    symptoms.json       symptom keywords
+    medical_o1.json     extracted_features2's disease categories and network entities
+    medtrinity.json     anatomical regions with their structures, and imaging modalities
+
+Each matcher built from them (the body system/symptom automaton, the
+PatternRegistry objects) is pickled under <taxonomy dir>/compiled/, named by
+a hash of the tables it was built from. Every process that loads the same
+tables, including pool workers and the query server, unpickles one shared
+artifact instead of recompiling, and an edited table gets a new artifact.
+
+Build every artifact ahead of time and drop stale ones with:
+    python preprocessing/taxonomy.py
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import re
+import tempfile
+
+from entity_patterns import PatternRegistry
+from keyword_matcher import KeywordMatcher
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TAXONOMY_DIR = os.environ.get('TAXONOMY_DIR', os.path.join(HERE, 'taxonomies'))
+COMPILED_DIR = os.path.join(TAXONOMY_DIR, 'compiled')
+
+# Bump when KeywordMatcher or PatternRegistry change how they match or what they pickle
+ARTIFACT_VERSION = 2
+
+# Body systems (with General/Other) and symptoms are bits of one uint64 mask per
+# record, in the records, the extracted file, the cube and the matrix cross-tabs
+MASK_BITS = 64
+MASKED_TABLES = {
+    'body_systems': lambda taxonomy: len(taxonomy['body_systems']) + 1,
+    'symptoms': lambda taxonomy: len(taxonomy['symptoms']),
+}
+
+_taxonomies = {}
+_artifacts = {}  # matcher name -> (artifact path, whether this process built it)
+
+
+def load_taxonomy(name):
+    """Parsed taxonomy file, read once per process"""
+    taxonomy = _taxonomies.get(name)
+    if taxonomy is None:
+        path = os.path.join(TAXONOMY_DIR, name + '.json')
+        with open(path, encoding='utf-8') as f:
+            taxonomy = json.load(f)
+        if name in MASKED_TABLES and MASKED_TABLES[name](taxonomy) > MASK_BITS:
+            raise ValueError(
+                f"{path} needs {MASKED_TABLES[name](taxonomy)} bits per record, but the {name} bitmasks have "
+                f"{MASK_BITS}; split the table or widen the masks"
+            )
+        _taxonomies[name] = taxonomy
+    return taxonomy
+
+
+def taxonomy_hash(*tables):
+    payload = json.dumps([ARTIFACT_VERSION, *tables], sort_keys=True)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def artifact_path(name, *tables):
+    return os.path.join(COMPILED_DIR, f"{name}-{taxonomy_hash(*tables)}.pickle")
+
+
+def compiled(name, build, *tables):
+    """Unpickle the artifact built from tables, or build() it and save it for the next process"""
+    path = artifact_path(name, *tables)
+    try:
+        with open(path, 'rb') as f:
+            matcher = pickle.load(f)
+        _artifacts[name] = (path, False)
+        return matcher
+    except (OSError, EOFError, pickle.UnpicklingError):
+        pass
+    matcher = build()
+    _artifacts[name] = (path, True)
+    try:
+        os.makedirs(COMPILED_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=COMPILED_DIR, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(matcher, f, protocol=pickle.HIGHEST_PROTOCOL)
+        # Concurrent builders write identical bytes, so the last rename wins harmlessly
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Could not cache {name} in {COMPILED_DIR}: {e}")
+    return matcher
+
+
+# ============================================================
+# MATCHERS
+# ============================================================
+
+def keyword_matcher():
+    """One automaton over the body system and symptom keywords, labeled ('system'|'symptom', name)"""
+    body_systems = load_taxonomy('body_systems')['body_systems']
+    symptoms = load_taxonomy('symptoms')['symptoms']
+    keywords = {system: data['keywords'] for system, data in body_systems.items()}
+    return compiled(
+        'keyword_matcher',
+        lambda: KeywordMatcher(
+            [(keyword, ('system', system)) for system, words in keywords.items() for keyword in words] +
+            [(symptom, ('symptom', symptom)) for symptom in symptoms]
+        ),
+        keywords, symptoms
+    )
+
+
+def question_registry():
+    """extracted_features2's case-insensitive disease categories"""
+    categories = {'disease': load_taxonomy('medical_o1')['disease_categories']}
+    return compiled('question_registry', lambda: PatternRegistry(categories, re.I), categories)
+
+
+def network_registry():
+    """extracted_features2's network entities, matched on lowercased text"""
+    categories = load_taxonomy('medical_o1')['network']
+    return compiled('network_registry', lambda: PatternRegistry(categories), categories)
+
+
+def medtrinity_matcher():
+    """One automaton over the MedTrinity structure words and modality terms, labeled ('structure'|'modality', name)"""
+    taxonomy = load_taxonomy('medtrinity')
+    regions = taxonomy['anatomical_regions']
+    modalities = taxonomy['modalities']
+    return compiled(
+        'medtrinity_matcher',
+        lambda: KeywordMatcher(
+            [(word, ('structure', word)) for words in regions.values() for word in words] +
+            [(term, ('modality', name)) for name, terms in modalities.items() for term in terms]
+        ),
+        regions, modalities
+    )
+
+
+MATCHERS = [keyword_matcher, question_registry, network_registry, medtrinity_matcher]
+
+
+def build_all():
+    """Compile every matcher and delete the artifacts of older taxonomies"""
+    for matcher in MATCHERS:
+        matcher()
+    kept = set()
+    for name, (path, built) in _artifacts.items():
+        kept.add(os.path.basename(path))
+        print(f"{name}: {'built' if built else 'up to date'} ({os.path.basename(path)})")
+    for filename in sorted(os.listdir(COMPILED_DIR)):
+        if filename not in kept:
+            os.remove(os.path.join(COMPILED_DIR, filename))
+            print(f"Removed stale {filename}")
+
+
+if __name__ == '__main__':
+    for name in ['body_systems', 'symptoms', 'medical_o1', 'medtrinity']:
+        print(f"{name}.json: version {load_taxonomy(name)['version']}")
+    build_all()
@@ -0,0 +1,353 @@
+"""Columnar extraction: the extract_* logic as whole-column Arrow compute kernels
+
+Keyword and pattern matches run as pyarrow.compute kernels over a whole
+chunk, and the results become numpy code and bitmask columns
+(records.RecordColumns) without a Python step per row.
+
+Arrow's regex engine is RE2. Its literal matching is the same as Python's
+`in` on any text, and on ASCII text its \\b and \\d are the same as the re
+module's (\\s is rewritten to the same character class). The rare non-ASCII
+rows are matched with the re module instead, so every row gets exactly what
+the row loop would give it.
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from extractors import AGE_GROUPS, age_patterns, body_systems, female_patterns, male_patterns, symptom_keywords
+from records import AGE_GROUP_CODES, GENDER_CODES, GENERAL_BIT, RecordColumns
+
+SYSTEM_NAMES = list(body_systems.keys())
+
+# One alternation per body system: a row hits the system if any keyword occurs
+system_patterns = {
+    system: '|'.join(re.escape(keyword) for keyword in data['keywords'])
+    for system, data in body_systems.items()
+}
+
+AGE_BINS = [
+    (1, 'Infant (0-1)'),
+    (12, 'Child (2-12)'),
+    (19, 'Adolescent (13-19)'),
+    (39, 'Young Adult (20-39)'),
+    (59, 'Middle Age (40-59)'),
+    (79, 'Senior (60-79)'),
+]
+
+MALE_WORDS = [p[2:-2] for p in male_patterns]
+FEMALE_WORDS = [p[2:-2] for p in female_patterns]
+
+# Python's \s also matches \v and \x1c-\x1f in str patterns; RE2's does not
+_ASCII_SPACE = r'\t\n\x0b\x0c\r \x1c-\x1f'
+
+
+def ascii_pattern(pattern):
+    """Rewrite a re pattern for RE2 so that both match the same on ASCII text"""
+    out = []
+    in_class = False
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\':
+            token = pattern[i:i + 2]
+            if token == r'\s':
+                token = _ASCII_SPACE if in_class else f'[{_ASCII_SPACE}]'
+            out.append(token)
+            i += 2
+            continue
+        if char == '[' and not in_class:
+            in_class = True
+        elif char == ']' and in_class:
+            in_class = False
+        out.append(char)
+        i += 1
+    return ''.join(out)
+
+
+# Each age pattern's one group, named as Arrow's extract_regex requires
+_AGE_REGEXES = [ascii_pattern(pattern.replace('(', '(?P<age>', 1)) for pattern in age_patterns]
+_INFANT_UNITS = [any(unit in pattern for unit in ('month', 'week', 'day')) for pattern in age_patterns]
+
+
+def as_text(series):
+    """Return a column as Python str objects so .str methods use the re module"""
+    # pandas may back string columns with pyarrow, whose regex engine treats
+    # \b and \d differently; object dtype keeps the row-by-row semantics.
+    # str() per cell, like the row loop: astype(str) leaves NaN as NaN on pandas 3.
+    return pd.Series([str(value) for value in series], index=series.index, dtype=object)
+
+
+def literal_text(series):
+    """Return an Arrow-backed copy for pure literal matching, when pyarrow is available"""
+    # Escaped keyword alternations contain no \b, \d or case folding, so the
+    # Arrow regex engine gives the same hits as re, only much faster.
+    try:
+        return series.astype('string[pyarrow]')
+    except (ImportError, UnicodeEncodeError):
+        # No pyarrow, or lone surrogates that UTF-8 cannot encode
+        return series
+
+
+def arrow_text(lower):
+    """A lowercased str column as an Arrow array, or None if it cannot be encoded as UTF-8"""
+    try:
+        return pa.array(lower.tolist(), type=pa.large_string())
+    except (UnicodeEncodeError, pa.ArrowInvalid):
+        # Lone surrogates: leave the whole chunk to the re module
+        return None
+
+
+def _non_ascii(text):
+    return np.flatnonzero(~pc.string_is_ascii(text).to_numpy(zero_copy_only=False))
+
+
+def _flags(array):
+    return array.to_numpy(zero_copy_only=False)
+
+
+def _mask_array(flags):
+    """Turn a (rows x names) boolean matrix into one uint64 bitmask per row, bit j for column j"""
+    weights = np.uint64(1) << np.arange(flags.shape[1], dtype=np.uint64)
+    return flags.astype(np.uint64) @ weights
+
+
+def _masks(flags):
+    """Turn a (rows x names) boolean matrix into one bitmask per row, bit j for column j"""
+    return _mask_array(flags).tolist()
+
+
+def _mask_lists(flags, names):
+    """Turn a (rows x names) boolean matrix into one list of names per row"""
+    masks = _masks(flags)
+    cache = {}
+    lists = []
+    for mask in masks:
+        names_for_mask = cache.get(mask)
+        if names_for_mask is None:
+            names_for_mask = cache[mask] = [n for j, n in enumerate(names) if mask >> j & 1]
+        lists.append(list(names_for_mask))
+    return lists
+
+
+# ============================================================
+# AGE AND GENDER
+# ============================================================
+
+def _age_values_re(lower):
+    """Ages with the re module, -1 where none is stated; the patterns are tried in order like extract_age"""
+    age = np.full(len(lower), -1, dtype=np.int64)
+    pending = np.ones(len(lower), dtype=bool)
+    for pattern, infant in zip(age_patterns, _INFANT_UNITS):
+        if not pending.any():
+            break
+        matched = lower[pending].str.extract(pattern, expand=False)
+        found = np.flatnonzero(pending)[matched.notna().to_numpy()]
+        age[found] = 0 if infant else matched.dropna().map(int).to_numpy()
+        pending[found] = False
+    return age
+
+
+def age_values(lower, text=None):
+    """Age of each row, -1 where none is stated; month/week/day-old ages are 0, as in extract_age"""
+    if text is None:
+        text = arrow_text(lower)
+    if text is None:
+        return _age_values_re(lower)
+    age = np.full(len(lower), -1, dtype=np.int64)
+    pending = np.ones(len(lower), dtype=bool)
+    for regex, infant in zip(_AGE_REGEXES, _INFANT_UNITS):
+        if not pending.any():
+            break
+        found = pc.extract_regex(text, regex)
+        matched = _flags(found.is_valid()) & pending
+        if infant:
+            age[matched] = 0
+        else:
+            digits = found.field('age').filter(pa.array(matched))
+            age[matched] = pc.cast(digits, pa.int64()).to_numpy()
+        pending &= ~matched
+    rows = _non_ascii(text)
+    if len(rows):
+        age[rows] = _age_values_re(lower.iloc[rows])
+    return age
+
+
+def age_group_codes(ages):
+    """AGE_GROUPS codes of age values, Unknown for -1"""
+    conditions = [ages <= upper for upper, _ in AGE_BINS]
+    codes = np.select(conditions, [AGE_GROUP_CODES[label] for _, label in AGE_BINS],
+                      default=AGE_GROUP_CODES['Elderly (80+)'])
+    return np.where(ages < 0, AGE_GROUP_CODES['Unknown'], codes)
+
+
+def _gender_codes_re(lower):
+    """extract_gender with one findall over all gender terms instead of 15 searches"""
+    # Every pattern is a whole word between \b anchors, so matches cannot
+    # overlap and one alternation finds the same terms as separate searches.
+    male_words = set(MALE_WORDS)
+    female_words = set(FEMALE_WORDS)
+    terms = sorted(male_words | female_words, key=len, reverse=True)
+    codes = []
+    for words in lower.str.findall(r'\b(?:' + '|'.join(terms) + r')\b'):
+        words = set(words)
+        male_score = len(words & male_words)
+        female_score = len(words & female_words)
+        codes.append(GENDER_CODES['Female'] if female_score > male_score else
+                     GENDER_CODES['Male'] if male_score > female_score else GENDER_CODES['Unknown'])
+    return np.array(codes, dtype=np.int64)
+
+
+def gender_codes(lower, text=None):
+    """GENDERS code of each row: the side with more distinct gender words, as in extract_gender"""
+    if text is None:
+        text = arrow_text(lower)
+    if text is None:
+        return _gender_codes_re(lower)
+
+    def score(words):
+        return sum(_flags(pc.match_substring_regex(text, rf'\b{re.escape(word)}\b')).astype(np.int64)
+                   for word in words)
+
+    male_score = score(MALE_WORDS)
+    female_score = score(FEMALE_WORDS)
+    codes = np.select([female_score > male_score, male_score > female_score],
+                      [GENDER_CODES['Female'], GENDER_CODES['Male']], default=GENDER_CODES['Unknown'])
+    rows = _non_ascii(text)
+    if len(rows):
+        codes[rows] = _gender_codes_re(lower.iloc[rows])
+    return codes
+
+
+def extract_ages(lower):
+    """Vectorized extract_age: returns a list of ages (None if missing) and an age_group Series"""
+    ages = age_values(lower)
+    groups = [AGE_GROUPS[code] for code in age_group_codes(ages).tolist()]
+    return [None if age < 0 else age for age in ages.tolist()], pd.Series(groups, index=lower.index, dtype=object)
+
+
+def extract_genders(lower):
+    """Vectorized extract_gender: one Series of 'Male', 'Female' or 'Unknown'"""
+    names = list(GENDER_CODES)
+    return pd.Series([names[code] for code in gender_codes(lower).tolist()], index=lower.index, dtype=object)
+
+
+# ============================================================
+# BODY SYSTEMS AND SYMPTOMS
+# ============================================================
+
+def _system_flags(lower_text, text=None):
+    """(rows x SYSTEM_NAMES) keyword hits; literal alternations match the same in RE2 and re"""
+    if text is None:
+        text = arrow_text(lower_text)
+    if text is None:
+        lower_text = literal_text(lower_text)
+        return np.column_stack([lower_text.str.contains(system_patterns[s]).to_numpy(dtype=bool)
+                                for s in SYSTEM_NAMES])
+    return np.column_stack([_flags(pc.match_substring_regex(text, system_patterns[s])) for s in SYSTEM_NAMES])
+
+
+def _symptom_flags(lower, text=None):
+    """(rows x symptom_keywords) substring hits"""
+    if text is None:
+        text = arrow_text(lower)
+    if text is None:
+        return np.column_stack([lower.str.contains(s, regex=False).to_numpy(dtype=bool) for s in symptom_keywords])
+    # An escaped literal is matched byte for byte, so this is exact on every row;
+    # RE2's literal search is about 3x faster than the match_substring kernel
+    return np.column_stack([_flags(pc.match_substring_regex(text, re.escape(s))) for s in symptom_keywords])
+
+
+def extract_body_systems(lower_text):
+    """Vectorized extract_body_systems: one list of systems per row"""
+    return [systems if systems else ['General/Other'] for systems in _mask_lists(_system_flags(lower_text), SYSTEM_NAMES)]
+
+
+def extract_symptoms(lower):
+    """Vectorized extract_symptoms: one list of symptoms per row"""
+    return _mask_lists(_symptom_flags(lower), symptom_keywords)
+
+
+def extract_columns(questions, answers):
+    """Extract a chunk column by column into records.RecordColumns, ids from the question index"""
+    questions = as_text(questions)
+    answers = as_text(answers)
+    lower_q = questions.str.lower()
+    lower_text = lower_q + " " + answers.str.lower()
+    question_text = arrow_text(lower_q)
+    full_text = arrow_text(lower_text) if question_text is not None else None
+
+    ages = age_values(lower_q, question_text)
+    # Bit order is SYSTEM_NAMES and symptom_keywords, the same as records.SYSTEM_BITS/SYMPTOM_BITS
+    systems = _mask_array(_system_flags(lower_text, full_text))
+    return RecordColumns(
+        questions.index.to_numpy(), questions.tolist(), answers.tolist(), ages, age_group_codes(ages),
+        gender_codes(lower_q, question_text),
+        np.where(systems == 0, np.uint64(GENERAL_BIT), systems),
+        _mask_array(_symptom_flags(lower_q, question_text))
+    )
+
+
+def extract_records(questions, answers):
+    """Build the same Records as the row loop, column by column"""
+    return extract_columns(questions, answers).records()
+
+
+# ============================================================
+# extracted_features2.py helpers
+# ============================================================
+
+def disease_flags(questions, registry, category='disease'):
+    """Return a (rows x names) boolean DataFrame for one PatternRegistry category"""
+    # Case-insensitive alternations are slow in the re module, column-wise or
+    # not; the registry's merged automaton scans each question once instead.
+    names = registry.categories[category]
+    rows = [registry.match(q)[category] for q in questions]
+    return pd.DataFrame(
+        [[name in found for name in names] for found in rows],
+        index=questions.index, columns=names, dtype=bool
+    )
+
+
+def pediatric_age_groups(questions, age_regex):
+    """Four-bin age groups used by age_disease.json; None where no age is stated"""
+    matched = questions.str.extract(age_regex)
+    age = matched[0].fillna(matched[1]).dropna().map(int)
+    groups = pd.Series(None, index=questions.index, dtype=object)
+    groups.loc[age.index] = [
+        'Pediatric (0-18)' if a <= 18 else
+        'Young Adult (19-40)' if a <= 40 else
+        'Adult (41-65)' if a <= 65 else
+        'Senior (65+)'
+        for a in age
+    ]
+    return groups
+
+
+def binary_genders(questions, male_regex, female_regex):
+    """Male if a male term occurs, else Female if a female term occurs, else None"""
+    male = questions.str.contains(male_regex)
+    female = questions.str.contains(female_regex)
+    genders = pd.Series(None, index=questions.index, dtype=object)
+    genders[female] = 'Female'
+    genders[male] = 'Male'
+    return genders
+
+
+def disease_crosstab(flags, labels, label_name):
+    """(disease x label) counts as one product of the flag matrix with one-hot labels
+
+    Same frame as grouping the (disease, label) pairs and unstacking: only
+    diseases and labels that occur together, both sorted by name.
+    """
+    has_label = labels.notna().to_numpy()
+    onehot = pd.get_dummies(labels[has_label])
+    counts = flags.to_numpy(dtype=np.int64)[has_label].T @ onehot.to_numpy(dtype=np.int64)
+    table = pd.DataFrame(counts, index=flags.columns, columns=onehot.columns)
+    table = table.loc[table.sum(axis=1) > 0, table.sum(axis=0) > 0].sort_index()
+    table.index.name = 'disease'
+    table.columns.name = label_name
+    return table